@@ -1,15 +1,40 @@
+import getpass
 import json
 import logging
+import os
+import tempfile
 
 logger = logging.getLogger("config")
 
 CONFIG_FILE_NAME = "contentConfig.json"
 DEFAULT_FIRST_HALF_PREFIX = "1h_"
 DEFAULT_SECOND_HALF_PREFIX = "2h_"
+DEFAULT_SPLITS_PARTS = 2
+DEFAULT_SPLITS_WORKERS = 4
 DEFAULT_NER_FILE_PREFIX = "ner_"
 DEFAULT_REPLACEMENTS_FILE_PREFIX = "replaced_"
 DEFAULT_STITCHED_PREFIX = "stitched_"
 DEFAULT_NER_MODEL = "en_core_web_sm"
+DEFAULT_NER_BATCH_SIZE = 4
+DEFAULT_NER_PROCESSES = 1
+DEFAULT_NER_CHUNK_SIZE = 100000
+DEFAULT_NER_USE_CACHE = True
+DEFAULT_NER_PREFILTER = False
+DEFAULT_NER_CASCADE_MODEL = None
+NER_SAMPLING_PART = "part"
+NER_SAMPLING_ALL = "all"
+NER_SAMPLING_SECTIONS = "sections"
+DEFAULT_NER_SAMPLING = NER_SAMPLING_PART
+DEFAULT_NER_SAMPLE_FRACTION = 0.5
+try:
+    NER_SOCKET_USER = getpass.getuser()
+except (KeyError, OSError):
+    # No user name, as in containers without a USER variable or passwd entry
+    NER_SOCKET_USER = str(os.getuid()) if hasattr(os, "getuid") else "default"
+# In a directory of its own for each user, which the NER server makes private
+DEFAULT_NER_SOCKET_PATH = os.path.join(
+    tempfile.gettempdir(), f"novel_ai_module_tools_{NER_SOCKET_USER}", "ner.sock"
+)
 DEFAULT_PRIMARY_PATTERN = r"\sthis\s"
 DEFAULT_SECONDARY_PATTERN = r"\sexample\s"
 DEFAULT_PRIMARY_SCORE_FIRST_THRESHOLD = 2
@@ -52,6 +77,69 @@ except:
     )
     SPLITS_SECOND_HALF_PREFIX = DEFAULT_SECOND_HALF_PREFIX
 
+try:
+    SPLITS_PARTS = config["splits"]["parts"]
+except:
+    logger.warning(
+        f"No config value found for SPLITS_PARTS. "
+        f"Using default value of [{DEFAULT_SPLITS_PARTS}]"
+    )
+    SPLITS_PARTS = DEFAULT_SPLITS_PARTS
+
+try:
+    SPLITS_WORKERS = config["splits"]["workers"]
+except:
+    logger.warning(
+        f"No config value found for SPLITS_WORKERS. "
+        f"Using default value of [{DEFAULT_SPLITS_WORKERS}]"
+    )
+    SPLITS_WORKERS = DEFAULT_SPLITS_WORKERS
+
+# The text the two half prefixes have in common before and after the part
+# number, like "" and "h_" for "1h_" and "2h_"
+SPLITS_PART_PREFIX_HEAD = os.path.commonprefix(
+    [SPLITS_FIRST_HALF_PREFIX, SPLITS_SECOND_HALF_PREFIX]
+)
+SPLITS_PART_PREFIX_TAIL = os.path.commonprefix(
+    [
+        SPLITS_FIRST_HALF_PREFIX[len(SPLITS_PART_PREFIX_HEAD) :][::-1],
+        SPLITS_SECOND_HALF_PREFIX[len(SPLITS_PART_PREFIX_HEAD) :][::-1],
+    ]
+)[::-1]
+
+
+def get_split_part_prefix(part: int) -> str:
+    """
+    Get the file name prefix of one part of a split file.
+
+    The first two parts use the half prefixes. Later parts are numbered between
+    the text the half prefixes have in common, so "1h_" and "2h_" give "3h_",
+    "4h_", ...
+
+    Args:
+        part (int): The number of the part, starting from 1.
+
+    Returns:
+        str: The prefix.
+    """
+    if part == 1:
+        return SPLITS_FIRST_HALF_PREFIX
+    if part == 2:
+        return SPLITS_SECOND_HALF_PREFIX
+
+    prefix = f"{SPLITS_PART_PREFIX_HEAD}{part}{SPLITS_PART_PREFIX_TAIL}"
+    if prefix in (SPLITS_FIRST_HALF_PREFIX, SPLITS_SECOND_HALF_PREFIX):
+        # The half prefixes are not numbered in order, like "2_" and "1_"
+        return f"{SPLITS_SECOND_HALF_PREFIX}{part}_"
+
+    return prefix
+
+
+# File name prefixes for each part, in order
+SPLITS_PART_PREFIXES = [
+    get_split_part_prefix(part) for part in range(1, max(SPLITS_PARTS, 2) + 1)
+]
+
 try:
     NER_FILE_PREFIX = config["ner"]["file_prefix"]
 except:
@@ -79,6 +167,89 @@ except:
     )
     NER_MODEL = DEFAULT_NER_MODEL
 
+try:
+    NER_BATCH_SIZE = config["ner"]["batch_size"]
+except:
+    logger.warning(
+        f"No config value found for NER_BATCH_SIZE. "
+        f"Using default value of [{DEFAULT_NER_BATCH_SIZE}]"
+    )
+    NER_BATCH_SIZE = DEFAULT_NER_BATCH_SIZE
+
+try:
+    NER_PROCESSES = config["ner"]["processes"]
+except:
+    logger.warning(
+        f"No config value found for NER_PROCESSES. "
+        f"Using default value of [{DEFAULT_NER_PROCESSES}]"
+    )
+    NER_PROCESSES = DEFAULT_NER_PROCESSES
+
+try:
+    NER_CHUNK_SIZE = config["ner"]["chunk_size"]
+except:
+    logger.warning(
+        f"No config value found for NER_CHUNK_SIZE. "
+        f"Using default value of [{DEFAULT_NER_CHUNK_SIZE}]"
+    )
+    NER_CHUNK_SIZE = DEFAULT_NER_CHUNK_SIZE
+
+try:
+    NER_SOCKET_PATH = config["ner"]["socket_path"]
+except:
+    logger.warning(
+        f"No config value found for NER_SOCKET_PATH. "
+        f"Using default value of [{DEFAULT_NER_SOCKET_PATH}]"
+    )
+    NER_SOCKET_PATH = DEFAULT_NER_SOCKET_PATH
+
+try:
+    NER_USE_CACHE = config["ner"]["cache"]
+except:
+    logger.warning(
+        f"No config value found for NER_USE_CACHE. "
+        f"Using default value of [{DEFAULT_NER_USE_CACHE}]"
+    )
+    NER_USE_CACHE = DEFAULT_NER_USE_CACHE
+
+try:
+    NER_PREFILTER = config["ner"]["prefilter"]
+except:
+    logger.warning(
+        f"No config value found for NER_PREFILTER. "
+        f"Using default value of [{DEFAULT_NER_PREFILTER}]"
+    )
+    NER_PREFILTER = DEFAULT_NER_PREFILTER
+
+try:
+    NER_CASCADE_MODEL = config["ner"]["cascade_model"]
+except:
+    logger.warning(
+        f"No config value found for NER_CASCADE_MODEL. "
+        f"Using default value of [{DEFAULT_NER_CASCADE_MODEL}]"
+    )
+    NER_CASCADE_MODEL = DEFAULT_NER_CASCADE_MODEL
+
+try:
+    NER_SAMPLING = config["ner"]["sampling"]
+    if NER_SAMPLING not in (NER_SAMPLING_PART, NER_SAMPLING_ALL, NER_SAMPLING_SECTIONS):
+        raise ValueError(NER_SAMPLING)
+except:
+    logger.warning(
+        f"No valid config value found for NER_SAMPLING. "
+        f"Using default value of [{DEFAULT_NER_SAMPLING}]"
+    )
+    NER_SAMPLING = DEFAULT_NER_SAMPLING
+
+try:
+    NER_SAMPLE_FRACTION = float(config["ner"]["sample_fraction"])
+except:
+    logger.warning(
+        f"No config value found for NER_SAMPLE_FRACTION. "
+        f"Using default value of [{DEFAULT_NER_SAMPLE_FRACTION}]"
+    )
+    NER_SAMPLE_FRACTION = DEFAULT_NER_SAMPLE_FRACTION
+
 try:
     STITCHED_FILE_PREFIX = config["replacements"]["stitched_prefix"]
 except:
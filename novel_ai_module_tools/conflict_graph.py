@@ -0,0 +1,173 @@
+import json
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from novel_ai_module_tools.config import *
+from novel_ai_module_tools.file_utils import save_json_atomically
+from novel_ai_module_tools.logger_config import get_logger
+from novel_ai_module_tools.resources_loader import get_name_sources
+from novel_ai_module_tools.similarity_index import (
+    SIMILARITY_BATCH_SIZE,
+    ConflictGraph,
+    get_name_vectors,
+)
+
+"""
+conflict_graph.py
+
+Builds and caches the pairs of replacement names that are too similar to be
+used together.
+
+find_and_replace.py checks every candidate replacement against the names
+already used in the project and in the file. The replacement names never
+change between runs, so the similarity of every pair above the lower of the
+two thresholds is computed once and cached in a hidden file in the name
+directory. The cache is rebuilt when a name file or a threshold changes.
+
+Usage:
+    python conflict_graph.py
+"""
+
+CONFLICT_GRAPH_FILE_NAME = ".conflict_graph.json"
+CONFLICT_GRAPH_VERSION = 1
+
+logger = get_logger(__file__)
+
+
+def build_conflict_graph(names: List[str], threshold: float) -> ConflictGraph:
+    """
+    Find every pair of names whose similarity is above a threshold.
+
+    A bound on the similarity of every pair is computed from the characters
+    the names have in common with NumPy, and only the pairs it allows are
+    compared with SequenceMatcher.
+
+    Args:
+        names (List[str]): The names to compare.
+        threshold (float): The similarity a pair must be above.
+
+    Returns:
+        ConflictGraph: The pairs above the threshold.
+    """
+    names = sorted(set(names))
+    columns = {
+        character: column
+        for column, character in enumerate(sorted(set("".join(names))))
+    }
+    vectors = get_name_vectors(names, columns)
+    lengths = vectors.sum(axis=1)
+    batch_size = max(1, SIMILARITY_BATCH_SIZE // max(len(names) * len(columns), 1))
+    conflicts: Dict[str, Dict[str, float]] = {name: {} for name in names}
+
+    for start in range(0, len(names), batch_size):
+        common = np.minimum(
+            vectors[start : start + batch_size, np.newaxis, :],
+            vectors[np.newaxis, :, :],
+        ).sum(axis=2)
+        pair_lengths = lengths[start : start + batch_size, np.newaxis] + lengths
+        bounds = np.divide(
+            2.0 * common,
+            pair_lengths,
+            out=np.ones(common.shape),
+            where=pair_lengths > 0,
+        )
+        for row, column in zip(*np.nonzero(bounds > threshold)):
+            name = names[start + row]
+            other_name = names[column]
+            similarity = SequenceMatcher(None, name, other_name).ratio()
+            if similarity > threshold:
+                conflicts[name][other_name] = similarity
+
+    return ConflictGraph(threshold, conflicts)
+
+
+def read_names(path: Path) -> List[str]:
+    """
+    Read the names of every name file in a directory, without shuffling them.
+
+    Args:
+        path (Path): The directory containing name files.
+
+    Returns:
+        List[str]: The names.
+    """
+    names: List[str] = []
+    for name_file in sorted(path.iterdir()):
+        if name_file.is_file() and not name_file.name.startswith("."):
+            names.extend(name_file.read_text().splitlines())
+
+    return names
+
+
+def load_conflict_graph(path: Path, threshold: float) -> ConflictGraph:
+    """
+    Load the conflict graph of a directory of name files.
+
+    The graph is cached in a hidden file in the directory and only rebuilt when
+    the threshold, or the size or modification time of a name file, changes,
+    or a name file is added or removed.
+
+    Args:
+        path (Path): The directory containing name files.
+        threshold (float): The similarity the pairs in the graph must be above.
+
+    Returns:
+        ConflictGraph: The pairs of names above the threshold.
+    """
+    graph_path = path / CONFLICT_GRAPH_FILE_NAME
+    sources = get_name_sources(path)
+
+    try:
+        with open(graph_path, "r") as f:
+            cached = json.load(f)
+        if (
+            cached.get("version") == CONFLICT_GRAPH_VERSION
+            and cached.get("threshold") == threshold
+            and cached.get("sources") == sources
+        ):
+            logger.info(f"Loaded conflict graph from: [{graph_path}]")
+            return ConflictGraph(threshold, cached["conflicts"])
+    except (IOError, ValueError):
+        pass
+
+    logger.info(f"Building conflict graph for path: [{path}]")
+    graph = build_conflict_graph(read_names(path), threshold)
+
+    save_json_atomically(
+        graph_path,
+        {
+            "version": CONFLICT_GRAPH_VERSION,
+            "threshold": threshold,
+            "sources": sources,
+            "conflicts": graph.conflicts,
+        },
+    )
+
+    return graph
+
+
+def load_replacement_conflict_graph() -> ConflictGraph:
+    """
+    Load the conflict graph of the replacement names, at the lower of the
+    used-name similarity thresholds.
+
+    Returns:
+        ConflictGraph: The pairs of replacement names that are too similar.
+    """
+    replacements_directory = Path(__file__).parent / "resources" / "names" / "replace"
+    return load_conflict_graph(
+        replacements_directory,
+        min(
+            USED_NAME_IN_PROJECT_SIMILARITY_THRESHOLD,
+            USED_NAME_IN_FILE_SIMILARITY_THRESHOLD,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    graph = load_replacement_conflict_graph()
+    pairs = sum(len(conflicts) for conflicts in graph.conflicts.values())
+    print(f"{len(graph.conflicts)} names, {pairs} pairs above {graph.threshold}")
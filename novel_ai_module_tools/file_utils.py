@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Mapping, Union
+
+from novel_ai_module_tools.logger_config import get_logger
+
+"""
+file_utils.py
+
+Helpers shared by the tools that cache their results in files next to the
+files the results were computed from.
+"""
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+logger = get_logger(__file__)
+
+
+def get_file_hash(file_path: Union[str, Path]) -> str:
+    """
+    Compute the SHA-256 hash of a file's contents without reading it all at once.
+
+    Args:
+        file_path (Union[str, Path]): The path to the file.
+
+    Returns:
+        str: The hex digest of the file's contents.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def is_file_unchanged(file_path: Union[str, Path], record: Mapping[str, Any]) -> bool:
+    """
+    Check whether a file still matches a record of its size, modification time
+    and hash.
+
+    The size and modification time are compared first. The file is only hashed
+    if its size is unchanged but its modification time is not.
+
+    Args:
+        file_path (Union[str, Path]): The path to the file.
+        record (Mapping[str, Any]): The file's "size", "mtime_ns" and
+            "source_hash" when the record was made.
+
+    Returns:
+        bool: True if the file's contents are the same as when it was recorded.
+    """
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return False
+
+    if file_stat.st_size != record.get("size"):
+        return False
+    if file_stat.st_mtime_ns == record.get("mtime_ns"):
+        return True
+
+    # Touched but unchanged if the hash matches
+    return get_file_hash(file_path) == record.get("source_hash")
+
+
+def save_json_atomically(path: Union[str, Path], data: Any, **kwargs: Any) -> bool:
+    """
+    Write data to a JSON file without ever leaving a partly written file behind.
+
+    The data is written to a temporary file first and then moved into place.
+    Errors are logged rather than raised, since every caller can rebuild what
+    it failed to save.
+
+    Args:
+        path (Union[str, Path]): The path of the JSON file.
+        data (Any): The data to write.
+        **kwargs (Any): Extra arguments for ``json.dump``.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    temporary_path = f"{path}.tmp"
+    try:
+        with open(temporary_path, "w") as f:
+            json.dump(data, f, **kwargs)
+        os.replace(temporary_path, path)
+        return True
+    except IOError as e:
+        logger.error(f"Error writing {path}: {e}")
+        return False
@@ -7,16 +7,17 @@ while maintaining consistency across the project and individual files.
 
 import os
 import random
-import re
 import sys
-from difflib import SequenceMatcher
 from os import walk
-from typing import List, Set, Dict, Tuple
+from typing import List, Optional, Set, Dict, Tuple, Union
 
 from novel_ai_module_tools.config import *
+from novel_ai_module_tools.conflict_graph import load_replacement_conflict_graph
 from novel_ai_module_tools.logger_config import get_logger
+from novel_ai_module_tools.name_pool import NamePool, ends_with_s_or_x
+from novel_ai_module_tools.name_replacer import replace_names
 from novel_ai_module_tools.resources_loader import load_name_replacements
-
+from novel_ai_module_tools.similarity_index import SimilarityIndex
 
 logger = get_logger(__file__)
 
@@ -28,7 +29,14 @@ except:
 
 
 names = load_name_replacements()
+# The pairs of replacement names too similar to be used together
+conflict_graph = load_replacement_conflict_graph()
 original_character_names = set()
+# Indexed copy of original_character_names, built once they are all read
+original_names_index = SimilarityIndex()
+# The original name each replacement candidate is too similar to, if any,
+# found for all of the candidates at once after the original names are read
+original_name_matches: Dict[str, Optional[Tuple[str, float]]] = {}
 
 resource_directory = os.path.join(
     os.path.dirname(os.path.realpath(__file__)), "resources"
@@ -64,6 +72,10 @@ ner_directory = os.path.join(names_replaced_directory, "ner")
 output_directory = os.path.join(names_replaced_directory, "replaced")
 os.makedirs(output_directory, exist_ok=True)
 
+# Prefixes of the split files, in part order, removed to find the shared NER
+# file and to stitch
+split_prefixes = SPLITS_PART_PREFIXES
+
 # Get file list
 file_names = next(walk(splits_directory), (None, None, []))[2]  # [] if no file
 for filename in file_names:
@@ -74,88 +86,92 @@ for filename in file_names:
 def get_unique_replacement(
     original_name: str,
     name_type: str,
-    replacement_list: List[str],
-    used_project_pile: List[str],
-    used_file_pile: List[str],
+    replacement_list: Union[List[str], NamePool],
+    used_project_pile: Union[List[str], SimilarityIndex],
+    used_file_pile: Union[List[str], SimilarityIndex],
 ) -> str:
     """
     Find a unique replacement name that meets specific criteria.
 
+    Candidates are taken from the front of the replacement list, and each
+    candidate looked at is removed from it. Candidates too similar to an
+    original name or an already used name are found with SimilarityIndex,
+    which only compares a candidate with the names that could be similar enough.
+
     Args:
         original_name (str): The original name to be replaced.
         name_type (str): The type of the name (e.g., first name, surname).
-        replacement_list (List[str]): List of potential replacement names.
-        used_project_pile (List[str]): Names already used in the project.
-        used_file_pile (List[str]): Names already used in the current file.
+        replacement_list (Union[List[str], NamePool]): Potential replacement names.
+        used_project_pile (Union[List[str], SimilarityIndex]): Names already used in the project.
+        used_file_pile (Union[List[str], SimilarityIndex]): Names already used in the current file.
 
     Returns:
         str: A unique replacement name, or an empty string if no suitable replacement is found.
     """
-    for candidate in replacement_list:
-        fail = False
-
-        # Replace last names ending with 's' or 'x' with names that also end in 's' or 'x'
-        if (
-            name_type.startswith("S")
-            and (original_name.endswith("s") or original_name.endswith("x"))
-            and not (candidate.endswith("s") or candidate.endswith("x"))
-        ):
-            logger.info(
-                f"Unable to use candidate [{candidate}] for original name [{original_name}] because the replacement does not end with 's' or 'x'"
-            )
-            continue
-        if (
-            name_type.startswith("S")
-            and (candidate.endswith("s") or candidate.endswith("x"))
-            and not (original_name.endswith("s") or original_name.endswith("x"))
-        ):
-            logger.info(
-                f"Unable to use candidate [{candidate}] for original name [{original_name}] because the original name does not end with 's' or 'x'"
+    if not isinstance(replacement_list, NamePool):
+        pool = NamePool(replacement_list)
+        try:
+            return get_unique_replacement(
+                original_name, name_type, pool, used_project_pile, used_file_pile
             )
-            continue
+        finally:
+            replacement_list[:] = pool
+
+    if not isinstance(used_project_pile, SimilarityIndex):
+        used_project_pile = SimilarityIndex(used_project_pile)
+    if not isinstance(used_file_pile, SimilarityIndex):
+        used_file_pile = SimilarityIndex(used_file_pile)
+
+    # Replace last names ending with 's' or 'x' with names that also end in 's' or 'x'
+    ending_in_s_or_x = (
+        ends_with_s_or_x(original_name) if name_type.startswith("S") else None
+    )
+
+    while True:
+        candidate = replacement_list.pop(ending_in_s_or_x)
+        if candidate is None:
+            break
 
         # Was the this candidate replacement used in the original text?
-        for used_name in original_character_names:
-            similarity = SequenceMatcher(None, candidate, used_name).ratio()
-            if similarity > ORIGINAL_NAME_SIMILARITY_THRESHOLD:
-                logger.info(
-                    f"Unable to replace [{original_name}] with [{candidate}] because it is too similar to [{used_name}] which was already an ORIGINAL character name for the project. Similarity is [{similarity}]"
-                )
-                fail = True
-                break
-        if fail == True:
-            replacement_list.remove(candidate)
+        if candidate in original_name_matches:
+            similar = original_name_matches[candidate]
+        else:
+            similar = original_names_index.find_similar(
+                candidate, ORIGINAL_NAME_SIMILARITY_THRESHOLD
+            )
+        if similar is not None:
+            used_name, similarity = similar
+            logger.info(
+                f"Unable to replace [{original_name}] with [{candidate}] because it is too similar to [{used_name}] which was already an ORIGINAL character name for the project. Similarity is [{similarity}]"
+            )
             continue
 
         # Have we already used a similar replacement elsewhere in the project?
-        for used_name in used_project_pile:
-            similarity = SequenceMatcher(None, candidate, used_name).ratio()
-            if similarity > USED_NAME_IN_PROJECT_SIMILARITY_THRESHOLD:
-                logger.info(
-                    f"Unable to replace [{original_name}] with [{candidate}] because it is too similar to [{used_name}] which is already in the PROJECT list. Similarity is [{similarity}]"
-                )
-                fail = True
-                break
-        if fail == True:
-            replacement_list.remove(candidate)
+        similar = used_project_pile.find_similar(
+            candidate, USED_NAME_IN_PROJECT_SIMILARITY_THRESHOLD
+        )
+        if similar is not None:
+            used_name, similarity = similar
+            logger.info(
+                f"Unable to replace [{original_name}] with [{candidate}] because it is too similar to [{used_name}] which is already in the PROJECT list. Similarity is [{similarity}]"
+            )
             continue
 
         # Have we already used a similar replacement within this file?
-        for used_name in used_file_pile:
-            similarity = SequenceMatcher(None, candidate, used_name).ratio()
-            if similarity > USED_NAME_IN_FILE_SIMILARITY_THRESHOLD:
-                logger.info(
-                    f"Unable to replace [{original_name}] with [{candidate}] because it is too similar to [{used_name}] which is already in the FILE list. Similarity is [{similarity}]"
-                )
-                fail = True
-                break
-
-        replacement_list.remove(candidate)
-        if fail == False:
-            logger.debug(
-                f"Candidate not found in existing list. Returning candidate [{candidate}]"
+        similar = used_file_pile.find_similar(
+            candidate, USED_NAME_IN_FILE_SIMILARITY_THRESHOLD
+        )
+        if similar is not None:
+            used_name, similarity = similar
+            logger.info(
+                f"Unable to replace [{original_name}] with [{candidate}] because it is too similar to [{used_name}] which is already in the FILE list. Similarity is [{similarity}]"
             )
-            return candidate
+            continue
+
+        logger.debug(
+            f"Candidate not found in existing list. Returning candidate [{candidate}]"
+        )
+        return candidate
 
     logger.debug(
         f"Returning EMPTY from get_unique_replacement. Original name [{original_name}] Replacement list size [{len(replacement_list)}]"
@@ -170,8 +186,8 @@ def get_replacement(original_name, name_type, used_project_pile, used_file_pile)
     Args:
         original_name (str): The original name to be replaced.
         name_type (str): The type of the name.
-        used_project_pile (List[str]): Names already used in the project.
-        used_file_pile (List[str]): Names already used in the current file.
+        used_project_pile (Union[List[str], SimilarityIndex]): Names already used in the project.
+        used_file_pile (Union[List[str], SimilarityIndex]): Names already used in the current file.
 
     Returns:
         str: A replacement name, or an empty string if no suitable replacement is found.
@@ -233,29 +249,56 @@ def get_input_text(file_name):
 
 # Main processing loop
 for file_name in file_names:
-    ner_file_text = get_ner_file_text(
-        file_name, ["nosplits_", SPLITS_FIRST_HALF_PREFIX, SPLITS_SECOND_HALF_PREFIX]
-    )
+    ner_file_text = get_ner_file_text(file_name, ["nosplits_", *split_prefixes])
     ner_lines = ner_file_text.splitlines()
 
     for ner_line in ner_lines:
-        original_name, __, name_type = ner_line.split("|")
+        original_name, __, name_type = ner_line.split("|")[:3]
         original_character_names.add(original_name)
 
+original_names_index = SimilarityIndex(original_character_names)
+replacement_candidates = list(
+    dict.fromkeys(
+        candidate
+        for replacement_list in names.values()
+        for candidate in replacement_list
+    )
+)
+original_name_matches = dict(
+    zip(
+        replacement_candidates,
+        original_names_index.find_similar_batch(
+            replacement_candidates, ORIGINAL_NAME_SIMILARITY_THRESHOLD
+        ),
+    )
+)
+
+# Drop the candidates too similar to an original name from the pools up front
+for category, replacement_list in names.items():
+    for candidate in replacement_list:
+        if original_name_matches[candidate] is not None:
+            used_name, similarity = original_name_matches[candidate]
+            logger.info(
+                f"Removing candidate [{candidate}] because it is too similar to [{used_name}] which was already an ORIGINAL character name for the project. Similarity is [{similarity}]"
+            )
+    names[category] = NamePool(
+        candidate
+        for candidate in replacement_list
+        if original_name_matches[candidate] is None
+    )
 
 for file_name in file_names:
-    used_project_pile = []
-    used_file_pile = []
+    used_project_pile = SimilarityIndex(conflict_graph=conflict_graph)
+    used_file_pile = SimilarityIndex(conflict_graph=conflict_graph)
     input_text = get_input_text(file_name)
-    ner_file_text = get_ner_file_text(
-        file_name, ["nosplits_", SPLITS_FIRST_HALF_PREFIX, SPLITS_SECOND_HALF_PREFIX]
-    )
+    ner_file_text = get_ner_file_text(file_name, ["nosplits_", *split_prefixes])
 
     ner_lines = ner_file_text.splitlines()
+    replacements: List[Tuple[str, str]] = []
 
     for ner_line in ner_lines:
         logger.info(f"Processing line: [{ner_line}]")
-        original_name, __, name_type = ner_line.split("|")
+        original_name, __, name_type = ner_line.split("|")[:3]
 
         if name_type == "":
             logger.error(
@@ -272,19 +315,16 @@ for file_name in file_names:
                     f"{file_name} ERROR Unable to make replacement for string: [{original_name}] because the replacement is EMPTY"
                 )
                 continue
-            used_project_pile.append(replacement)
-            used_file_pile.append(replacement)
-            input_text = re.sub(
-                r"(^|[ ?!,.();'\"\-–—])%s([ ?!,.();'\"\-–—])"
-                % re.escape(original_name),
-                r"\1%s\2" % re.escape(str.strip(replacement)),
-                input_text,
-                flags=re.MULTILINE,
-            )
+            used_project_pile.add(replacement)
+            used_file_pile.add(replacement)
+            replacements.append((original_name, replacement))
             logger.info(
                 f"{filename}: Successfully replaced string [{original_name}] with string [{replacement}]"
             )
 
+    # Make all of the file's replacements in one scan of its text
+    input_text = replace_names(input_text, replacements)
+
     replaced_file = open(
         os.path.join(output_directory, REPLACEMENTS_FILE_PREFIX + file_name), "w"
     )
@@ -295,11 +335,24 @@ for file_name in file_names:
 stitched_directory = os.path.join(names_replaced_directory, "stitched")
 os.makedirs(stitched_directory, exist_ok=True)
 
+# The split files of each book, in part order. Only the files split_and_ner.py
+# left in the splits directory are used, so replaced parts left by an earlier
+# run with more parts are not stitched on.
+book_parts: Dict[str, List[Tuple[int, str]]] = {}
 for file_name in file_names:
-    base_name = file_name.removeprefix(SPLITS_FIRST_HALF_PREFIX).removeprefix(
-        SPLITS_SECOND_HALF_PREFIX
-    )
-
+    base_name = file_name
+    part = len(split_prefixes)
+    # Longest first, so a prefix is never mistaken for the start of a longer one
+    for split_part, split_prefix in sorted(
+        enumerate(split_prefixes), key=lambda item: -len(item[1])
+    ):
+        if base_name.startswith(split_prefix):
+            base_name = base_name.removeprefix(split_prefix)
+            part = split_part
+            break
+    book_parts.setdefault(base_name, []).append((part, file_name))
+
+for base_name, parts in book_parts.items():
     if base_name.startswith("nosplits_"):
         # Open first half
         with open(
@@ -318,29 +371,20 @@ for file_name in file_names:
             stitched_write_file.write(full_text)
             stitched_write_file.close()
     else:
-        # Open first half
-        with open(
-            os.path.join(
-                output_directory,
-                REPLACEMENTS_FILE_PREFIX + SPLITS_FIRST_HALF_PREFIX + base_name,
-            ),
-            "r",
-        ) as input_file:
-            first_half = input_file.read()
-            input_file.close()
-
-        # Open second half
-        with open(
-            os.path.join(
-                output_directory,
-                REPLACEMENTS_FILE_PREFIX + SPLITS_SECOND_HALF_PREFIX + base_name,
-            ),
-            "r",
-        ) as input_file:
-            second_half = input_file.read()
-            input_file.close()
-
-        stitched = first_half + "\n***\n" + second_half
+        # Open each part in order. A file may have been split into fewer parts
+        # than configured if it did not have enough "***" separators.
+        part_texts = []
+        for _, part_file_name in sorted(parts):
+            with open(
+                os.path.join(
+                    output_directory, REPLACEMENTS_FILE_PREFIX + part_file_name
+                ),
+                "r",
+            ) as input_file:
+                part_texts.append(input_file.read())
+                input_file.close()
+
+        stitched = "\n***\n".join(part_texts)
 
         # Open stitched file for output
         with open(
@@ -1,10 +1,21 @@
+import argparse
+import csv
+import hashlib
+import json
 import os
 import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional, TextIO, Tuple, Union
 
+from novel_ai_module_tools.file_utils import (
+    get_file_hash,
+    is_file_unchanged,
+    save_json_atomically,
+)
 from novel_ai_module_tools.logger_config import get_logger
 
-
 logger = get_logger(__file__)
 
 """
@@ -20,6 +31,731 @@ Usage:
 """
 
 
+class FormatRule(NamedTuple):
+    """
+    A single precompiled formatting rule.
+
+    Attributes:
+        name (str): Short identifier for the rule.
+        pattern (re.Pattern): The compiled pattern to substitute.
+        replacement (Union[str, Callable[[re.Match], str]]): The replacement
+            string or function passed to ``pattern.sub``.
+    """
+
+    name: str
+    pattern: re.Pattern
+    replacement: Union[str, Callable[[re.Match], str]]
+
+
+class RuleProfile(NamedTuple):
+    """
+    Measurements for one formatting rule, recorded in profiling mode.
+
+    Attributes:
+        rule (str): The name of the rule.
+        seconds (float): The time spent applying the rule.
+        matches (int): The number of substitutions the rule made.
+        bytes_in (int): The UTF-8 size of the text before the rule.
+        bytes_out (int): The UTF-8 size of the text after the rule.
+    """
+
+    rule: str
+    seconds: float
+    matches: int
+    bytes_in: int
+    bytes_out: int
+
+
+class FormatResult(NamedTuple):
+    """
+    The outcome of formatting a single file.
+
+    Attributes:
+        file_path (str): The path to the unformatted file.
+        size (int): The size of the unformatted file in bytes.
+        seconds (float): The time taken to format the file.
+        formatted (bool): Whether the formatted file was written successfully.
+        rule_profiles (Tuple[RuleProfile, ...]): Per-rule measurements, if the
+            file was formatted in profiling mode.
+    """
+
+    file_path: str
+    size: int
+    seconds: float
+    formatted: bool
+    rule_profiles: Tuple[RuleProfile, ...] = ()
+
+
+# Fancy quotes are plain character mappings, so they are applied in a single
+# str.translate pass rather than with regular expressions.
+QUOTE_TRANSLATION_TABLE = str.maketrans(
+    {"“": '"', "”": '"', "‘": "'", "’": "'", "`": "'"}
+)
+
+DASH_REPLACEMENTS = {" --- ": " - ", "---": "–"}
+
+# Number of characters read at a time when formatting in streaming mode
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Files shorter than this many characters are not split across processes
+PARALLEL_FORMAT_MIN_SIZE = 8 * 1024 * 1024
+
+# Number of pieces per worker process when formatting one file in parallel
+PARALLEL_PIECES_PER_JOB = 4
+
+BYTES_PER_MEGABYTE = 1024 * 1024
+
+QUOTES_RULE_NAME = "quotes"
+PROFILE_REPORT_FIELDS = ["file", "rule", "seconds", "matches", "bytes_in", "bytes_out"]
+DEFAULT_PROFILE_TOP = 10
+
+FORMATTED_FILE_SUFFIX = "_fmtd"
+MANIFEST_FILE_NAME = ".formatter_manifest.json"
+
+# The rules are order dependent: each one runs on the output of the previous
+# rule. Rules are only merged into a single pattern where the merged pattern
+# gives exactly the same output as running them one after another.
+FORMAT_RULES: List[FormatRule] = [
+    # Replace different dash/hyphen patterns: " --- " to hyphen, "---" to en dash
+    FormatRule(
+        "dashes",
+        re.compile(r" --- |---"),
+        lambda match: DASH_REPLACEMENTS[match.group()],
+    ),
+    # Replace ellipsis variations with standard ellipsis. The ellipsis
+    # character stays in this pattern rather than the translation table
+    # because " . . …" must not be read as a spaced ellipsis.
+    FormatRule("ellipsis", re.compile(r"…|\s\.\s\.\s\."), "..."),
+    FormatRule("ellipsis_whitespace", re.compile(r"\s\.\.\."), "..."),
+    # Standardize section/chapter markers
+    FormatRule("chapters", re.compile(r"CHAPTER \d+$", re.MULTILINE), "***"),
+    # Reduce multiple "***" lines to a single one
+    FormatRule(
+        "repeated_separators",
+        re.compile(r"(^\*\*\*$\n){2,}", re.MULTILINE),
+        "***\n",
+    ),
+    # Replace multiple newlines with section separator, and shorten runs of
+    # four or more stars to "***"
+    FormatRule(
+        "separators",
+        re.compile(r"\n{3,}|\*{4,}"),
+        lambda match: "\n***\n" if match.group()[0] == "\n" else "***",
+    ),
+    # Remove empty lines
+    FormatRule("empty_lines", re.compile(r"^\s*$", re.MULTILINE), ""),
+    # Trim leading and trailing whitespace
+    FormatRule("whitespace", re.compile(r"^\s+|\s+$", re.MULTILINE), ""),
+    # Remove lines with only digits
+    FormatRule("digit_lines", re.compile(r"^\d+$", re.MULTILINE), ""),
+]
+
+
+def format_text(source_text: str) -> str:
+    """
+    Apply all formatting rules to a string.
+
+    The quote translation table and the rules in FORMAT_RULES are compiled once
+    at import, so they are shared by every file formatted in this process.
+
+    Args:
+        source_text (str): The text to format.
+
+    Returns:
+        str: The formatted text.
+    """
+    source_text = source_text.translate(QUOTE_TRANSLATION_TABLE)
+
+    for rule in FORMAT_RULES:
+        source_text = rule.pattern.sub(rule.replacement, source_text)
+
+    return source_text
+
+
+def profile_format_text(source_text: str) -> Tuple[str, List[RuleProfile]]:
+    """
+    Apply all formatting rules to a string, measuring each rule.
+
+    This gives the same output as format_text, but also records the time, the
+    number of substitutions and the text size before and after every rule.
+
+    Args:
+        source_text (str): The text to format.
+
+    Returns:
+        Tuple[str, List[RuleProfile]]: The formatted text and the measurements
+            for each rule, in the order the rules were applied.
+    """
+    profile: List[RuleProfile] = []
+
+    bytes_in = len(source_text.encode("utf-8"))
+    matches = sum(source_text.count(chr(code)) for code in QUOTE_TRANSLATION_TABLE)
+    start_time = time.perf_counter()
+    source_text = source_text.translate(QUOTE_TRANSLATION_TABLE)
+    seconds = time.perf_counter() - start_time
+    bytes_out = len(source_text.encode("utf-8"))
+    profile.append(RuleProfile(QUOTES_RULE_NAME, seconds, matches, bytes_in, bytes_out))
+
+    for rule in FORMAT_RULES:
+        bytes_in = bytes_out
+        start_time = time.perf_counter()
+        source_text, matches = rule.pattern.subn(rule.replacement, source_text)
+        seconds = time.perf_counter() - start_time
+        bytes_out = len(source_text.encode("utf-8"))
+        profile.append(RuleProfile(rule.name, seconds, matches, bytes_in, bytes_out))
+
+    return source_text, profile
+
+
+def merge_rule_profiles(profile: List[RuleProfile]) -> List[RuleProfile]:
+    """
+    Add together the measurements for each rule.
+
+    Args:
+        profile (List[RuleProfile]): Measurements, possibly several per rule.
+
+    Returns:
+        List[RuleProfile]: One combined measurement per rule, in the order the
+            rules first appear.
+    """
+    merged: Dict[str, RuleProfile] = {}
+    for rule_profile in profile:
+        total = merged.get(rule_profile.rule)
+        if total is None:
+            merged[rule_profile.rule] = rule_profile
+        else:
+            merged[rule_profile.rule] = RuleProfile(
+                rule_profile.rule,
+                total.seconds + rule_profile.seconds,
+                total.matches + rule_profile.matches,
+                total.bytes_in + rule_profile.bytes_in,
+                total.bytes_out + rule_profile.bytes_out,
+            )
+
+    return list(merged.values())
+
+
+def get_ruleset_version() -> str:
+    """
+    Compute a version string that changes whenever the formatting rules change.
+
+    Returns:
+        str: A hex digest of the translation table and every rule's pattern,
+            flags and replacement.
+    """
+    ruleset = hashlib.sha256()
+    ruleset.update(repr(sorted(QUOTE_TRANSLATION_TABLE.items())).encode("utf-8"))
+    ruleset.update(repr(sorted(DASH_REPLACEMENTS.items())).encode("utf-8"))
+
+    for rule in FORMAT_RULES:
+        ruleset.update(rule.name.encode("utf-8"))
+        ruleset.update(rule.pattern.pattern.encode("utf-8"))
+        ruleset.update(str(rule.pattern.flags).encode("utf-8"))
+        if callable(rule.replacement):
+            ruleset.update(rule.replacement.__code__.co_code)
+            ruleset.update(repr(rule.replacement.__code__.co_consts).encode("utf-8"))
+        else:
+            ruleset.update(rule.replacement.encode("utf-8"))
+
+    return ruleset.hexdigest()
+
+
+RULESET_VERSION = get_ruleset_version()
+
+
+def find_chunk_boundary(text: str, start: int = 0, end: Optional[int] = None) -> int:
+    """
+    Find the last newline in the text where formatting can safely be split.
+
+    No formatting rule matches across a newline that has a non-whitespace
+    character on both sides, unless that character takes part in the ellipsis,
+    chapter or "***" rules. Formatting the text before and after such a newline
+    separately and joining the results with a newline gives the same output as
+    formatting the whole text at once.
+
+    Args:
+        text (str): The text to search.
+        start (int): The lowest index to consider.
+        end (Optional[int]): The end of the region to search. Defaults to the
+            end of the text.
+
+    Returns:
+        int: The index of the newline, or -1 if there is no safe boundary.
+    """
+    if end is None:
+        end = len(text)
+
+    index = text.rfind("\n", start, end - 1)
+    while index > 0:
+        before = text[index - 1]
+        after = text[index + 1]
+        if (
+            not before.isspace()
+            and not before.isdigit()
+            and before != "*"
+            and not after.isspace()
+            and after not in ".…*"
+        ):
+            return index
+        index = text.rfind("\n", start, index)
+
+    return -1
+
+
+def format_stream(
+    input_file: TextIO,
+    output_file: TextIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    profile: Optional[List[RuleProfile]] = None,
+) -> None:
+    """
+    Format text from one open file to another in chunks.
+
+    Text is buffered only until a safe chunk boundary is found, so memory use is
+    bounded by the chunk size rather than the size of the file. The output is
+    identical to formatting the whole file with format_text.
+
+    Args:
+        input_file (TextIO): The file to read unformatted text from.
+        output_file (TextIO): The file to write formatted text to.
+        chunk_size (int): The number of characters to read at a time.
+        profile (Optional[List[RuleProfile]]): If given, per-rule measurements
+            for every chunk are appended to this list.
+    """
+    pending = ""
+    separator = ""
+
+    while True:
+        chunk = input_file.read(chunk_size)
+        if not chunk:
+            break
+
+        # Newlines before the previous end of the buffer were already checked
+        search_start = max(len(pending) - 1, 0)
+        pending += chunk
+        boundary = find_chunk_boundary(pending, search_start)
+        if boundary == -1:
+            continue
+
+        output_file.write(separator + format_chunk(pending[:boundary], profile))
+        separator = "\n"
+        pending = pending[boundary + 1 :]
+
+    output_file.write(separator + format_chunk(pending, profile))
+
+
+def format_chunk(text: str, profile: Optional[List[RuleProfile]] = None) -> str:
+    """
+    Format a piece of text, recording per-rule measurements if requested.
+
+    Args:
+        text (str): The text to format.
+        profile (Optional[List[RuleProfile]]): If given, the measurements for
+            each rule are appended to this list.
+
+    Returns:
+        str: The formatted text.
+    """
+    if profile is None:
+        return format_text(text)
+
+    text, chunk_profile = profile_format_text(text)
+    profile.extend(chunk_profile)
+    return text
+
+
+def split_text(text: str, piece_size: int) -> List[str]:
+    """
+    Split text into pieces of roughly the given size at safe chunk boundaries.
+
+    Formatting each piece separately and joining the results with newlines gives
+    the same output as formatting the whole text at once.
+
+    Args:
+        text (str): The text to split.
+        piece_size (int): The target number of characters per piece.
+
+    Returns:
+        List[str]: The pieces, without the newlines they were split at.
+    """
+    pieces = []
+    start = 0
+
+    while len(text) - start > piece_size:
+        end = start + piece_size
+        boundary = find_chunk_boundary(text, start, end)
+        # Widen the search until a boundary turns up or the text runs out
+        while boundary == -1 and end < len(text):
+            end = min(end + piece_size, len(text))
+            boundary = find_chunk_boundary(text, start, end)
+        if boundary == -1:
+            break
+
+        pieces.append(text[start:boundary])
+        start = boundary + 1
+
+    pieces.append(text[start:])
+    return pieces
+
+
+def format_text_parallel(
+    source_text: str, jobs: int, profile: Optional[List[RuleProfile]] = None
+) -> str:
+    """
+    Format a large string by formatting paragraph-aligned pieces on a process pool.
+
+    The pieces are cut at safe chunk boundaries, so no rule crosses a seam and
+    the output is identical to format_text.
+
+    Args:
+        source_text (str): The text to format.
+        jobs (int): The number of worker processes to use.
+        profile (Optional[List[RuleProfile]]): If given, per-rule measurements
+            for every piece are appended to this list.
+
+    Returns:
+        str: The formatted text.
+    """
+    if jobs <= 1 or len(source_text) < PARALLEL_FORMAT_MIN_SIZE:
+        return format_chunk(source_text, profile)
+
+    piece_size = max(len(source_text) // (jobs * PARALLEL_PIECES_PER_JOB), 1)
+    pieces = split_text(source_text, piece_size)
+    logger.info(f"Formatting {len(pieces)} pieces on {jobs} worker processes")
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        if profile is None:
+            return "\n".join(executor.map(format_text, pieces))
+
+        formatted_pieces = []
+        for formatted_piece, piece_profile in executor.map(profile_format_text, pieces):
+            formatted_pieces.append(formatted_piece)
+            profile.extend(piece_profile)
+        return "\n".join(formatted_pieces)
+
+
+def parse_arguments(argv: List[str]) -> argparse.Namespace:
+    """
+    Parse the command-line arguments for the formatter.
+
+    Args:
+        argv (List[str]): The arguments, excluding the program name.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Format .txt files in the way NovelAI prefers."
+    )
+    parser.add_argument("path", nargs="?", help="A .txt file or a directory")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read and write files in chunks to keep memory use constant",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes. A directory is formatted one file per "
+        "process; a single large file is split into pieces across processes",
+    )
+    parser.add_argument(
+        "--yes",
+        action="store_true",
+        help="Format all files in a directory without asking for confirmation",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="REPORT",
+        help="Measure every formatting rule for every file and write the results "
+        "to REPORT (.json or .csv)",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=DEFAULT_PROFILE_TOP,
+        metavar="N",
+        help="Number of entries to show in the printed profiling summary",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Format every file in a directory, even if its output is up to date",
+    )
+
+    return parser.parse_args(argv)
+
+
+def get_formatted_file_path(file_path: str) -> str:
+    """
+    Get the path that the formatted copy of a file is written to.
+
+    Args:
+        file_path (str): The path to the unformatted file.
+
+    Returns:
+        str: The same path with the "_fmtd" suffix added before the extension.
+    """
+    file_name, file_extension = os.path.splitext(file_path)
+    return f"{file_name}{FORMATTED_FILE_SUFFIX}{file_extension}"
+
+
+def load_manifest(directory: str) -> Dict[str, Dict[str, Union[str, int]]]:
+    """
+    Load the formatting manifest for a directory.
+
+    Args:
+        directory (str): The directory containing the manifest.
+
+    Returns:
+        Dict[str, Dict[str, Union[str, int]]]: The manifest entries keyed by
+            file name, or an empty dictionary if there is no readable manifest.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE_NAME), "r") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_manifest(
+    directory: str, manifest: Dict[str, Dict[str, Union[str, int]]]
+) -> None:
+    """
+    Write the formatting manifest for a directory.
+
+    Args:
+        directory (str): The directory to write the manifest to.
+        manifest (Dict[str, Dict[str, Union[str, int]]]): The manifest entries.
+    """
+    save_json_atomically(
+        os.path.join(directory, MANIFEST_FILE_NAME), manifest, indent=2, sort_keys=True
+    )
+
+
+def create_manifest_entry(file_path: str) -> Dict[str, Union[str, int]]:
+    """
+    Describe a source file and its formatted output for the manifest.
+
+    Args:
+        file_path (str): The path to the unformatted file.
+
+    Returns:
+        Dict[str, Union[str, int]]: The source hash, size and modification time,
+            the size of the formatted output, and the rule-set version.
+    """
+    source_stat = os.stat(file_path)
+    return {
+        "source_hash": get_file_hash(file_path),
+        "size": source_stat.st_size,
+        "mtime_ns": source_stat.st_mtime_ns,
+        "output_size": os.path.getsize(get_formatted_file_path(file_path)),
+        "ruleset_version": RULESET_VERSION,
+    }
+
+
+def is_up_to_date(file_path: str, entry: Dict[str, Union[str, int]]) -> bool:
+    """
+    Check whether a file's formatted output matches its manifest entry.
+
+    Args:
+        file_path (str): The path to the unformatted file.
+        entry (Dict[str, Union[str, int]]): The manifest entry for the file.
+
+    Returns:
+        bool: True if the formatted output is current and can be skipped.
+    """
+    if not entry or entry.get("ruleset_version") != RULESET_VERSION:
+        return False
+
+    try:
+        output_size = os.path.getsize(get_formatted_file_path(file_path))
+    except OSError:
+        return False
+
+    if output_size != entry.get("output_size"):
+        return False
+    if not is_file_unchanged(file_path, entry):
+        return False
+
+    # Remember the modification time in case it was touched but unchanged
+    entry["mtime_ns"] = os.stat(file_path).st_mtime_ns
+    return True
+
+
+def format_file_with_stats(
+    file_path: str, streaming: bool = False, jobs: int = 1, profile: bool = False
+) -> FormatResult:
+    """
+    Format a single file and measure how long it took.
+
+    Args:
+        file_path (str): The path to the file to be processed.
+        streaming (bool): Whether to format the file in streaming mode.
+        jobs (int): The number of worker processes to split a large file across.
+        profile (bool): Whether to record measurements for each rule.
+
+    Returns:
+        FormatResult: The file path, size, time taken and whether it succeeded.
+    """
+    rule_profiles: Optional[List[RuleProfile]] = [] if profile else None
+    start_time = time.perf_counter()
+    formatted = process_file(
+        file_path, streaming=streaming, jobs=jobs, profile=rule_profiles
+    )
+
+    return FormatResult(
+        file_path,
+        os.path.getsize(file_path),
+        time.perf_counter() - start_time,
+        formatted,
+        tuple(merge_rule_profiles(rule_profiles)) if profile else (),
+    )
+
+
+def format_directory_files(
+    file_paths: List[str],
+    jobs: int = 1,
+    streaming: bool = False,
+    profile: bool = False,
+) -> List[FormatResult]:
+    """
+    Format a list of files, optionally on a pool of worker processes.
+
+    Files are scheduled largest first so that a single large file does not
+    start last and hold up the end of the run.
+
+    Args:
+        file_paths (List[str]): The paths of the files to format.
+        jobs (int): The number of worker processes to use.
+        streaming (bool): Whether to format the files in streaming mode.
+        profile (bool): Whether to record measurements for each rule.
+
+    Returns:
+        List[FormatResult]: The result for each file.
+    """
+    file_paths = sorted(file_paths, key=os.path.getsize, reverse=True)
+
+    if jobs <= 1:
+        return [
+            format_file_with_stats(path, streaming, profile=profile)
+            for path in file_paths
+        ]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(format_file_with_stats, path, streaming, profile=profile)
+            for path in file_paths
+        ]
+        return [future.result() for future in as_completed(futures)]
+
+
+def get_throughput(size: int, seconds: float) -> float:
+    """
+    Calculate throughput in megabytes per second.
+
+    Args:
+        size (int): The number of bytes processed.
+        seconds (float): The time taken in seconds.
+
+    Returns:
+        float: The throughput in MB/s, or 0 if no time was measured.
+    """
+    if seconds <= 0:
+        return 0.0
+
+    return size / BYTES_PER_MEGABYTE / seconds
+
+
+def print_throughput_summary(
+    results: List[FormatResult], elapsed_seconds: float
+) -> None:
+    """
+    Print the throughput for each formatted file and for the whole run.
+
+    Args:
+        results (List[FormatResult]): The result for each formatted file.
+        elapsed_seconds (float): The wall-clock time of the whole run.
+    """
+    for result in results:
+        print(
+            f"{os.path.basename(result.file_path)}: "
+            f"{result.size / BYTES_PER_MEGABYTE:.2f} MB in {result.seconds:.2f}s "
+            f"({get_throughput(result.size, result.seconds):.2f} MB/s)"
+        )
+
+    total_size = sum(result.size for result in results)
+    print(
+        f"Formatted {len(results)} file(s), {total_size / BYTES_PER_MEGABYTE:.2f} MB "
+        f"in {elapsed_seconds:.2f}s "
+        f"({get_throughput(total_size, elapsed_seconds):.2f} MB/s)"
+    )
+
+
+def write_profile_report(results: List[FormatResult], report_path: str) -> None:
+    """
+    Write the per-rule measurements for every file to a JSON or CSV report.
+
+    Args:
+        results (List[FormatResult]): The results of a profiled run.
+        report_path (str): The report file. A .csv extension writes CSV; any
+            other extension writes JSON.
+    """
+    rows = [
+        {"file": result.file_path, **rule_profile._asdict()}
+        for result in results
+        for rule_profile in result.rule_profiles
+    ]
+
+    try:
+        with open(report_path, "w", newline="") as f:
+            if report_path.lower().endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=PROFILE_REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                json.dump(rows, f, indent=2)
+        logger.info(f"Profiling report saved as: {report_path}")
+    except IOError as e:
+        logger.error(f"Error writing profiling report {report_path}: {e}")
+
+
+def print_profile_summary(results: List[FormatResult], top: int) -> None:
+    """
+    Print the rules that took the most time overall and in individual files.
+
+    Args:
+        results (List[FormatResult]): The results of a profiled run.
+        top (int): The number of entries to print in each list.
+    """
+    totals = merge_rule_profiles(
+        [rule_profile for result in results for rule_profile in result.rule_profiles]
+    )
+    print(f"Top {top} rules by total time:")
+    for rule_profile in sorted(totals, key=lambda p: p.seconds, reverse=True)[:top]:
+        print(
+            f"  {rule_profile.rule}: {rule_profile.seconds:.3f}s, "
+            f"{rule_profile.matches} matches, "
+            f"{rule_profile.bytes_in / BYTES_PER_MEGABYTE:.2f} MB in, "
+            f"{rule_profile.bytes_out / BYTES_PER_MEGABYTE:.2f} MB out"
+        )
+
+    runs = [
+        (result.file_path, rule_profile)
+        for result in results
+        for rule_profile in result.rule_profiles
+    ]
+    print(f"Top {top} slowest rules in a single file:")
+    for file_path, rule_profile in sorted(
+        runs, key=lambda run: run[1].seconds, reverse=True
+    )[:top]:
+        print(
+            f"  {os.path.basename(file_path)} {rule_profile.rule}: "
+            f"{rule_profile.seconds:.3f}s, {rule_profile.matches} matches"
+        )
+
+
 def format_files(input_func=input):
     """
     Process and format text files in the specified directory or a single file.
@@ -31,31 +767,79 @@ def format_files(input_func=input):
         SystemExit: If the path is not provided as a command-line argument.
         IOError: If there are issues reading from or writing to files.
     """
-    try:
-        input_path = sys.argv[1]
-    except IndexError:
+    arguments = parse_arguments(sys.argv[1:])
+    input_path = arguments.path
+    if input_path is None:
         print("Please pass a directory or file path")
         sys.exit(1)
 
+    profile = arguments.profile is not None
+
     if os.path.isfile(input_path):
-        process_file(input_path)
+        result = format_file_with_stats(
+            input_path, arguments.stream, arguments.jobs, profile=profile
+        )
+        if profile:
+            write_profile_report([result], arguments.profile)
+            print_profile_summary([result], arguments.profile_top)
     elif os.path.isdir(input_path):
+        # Formatted copies are outputs of earlier runs, not files to format
         filenames = [
             f
             for f in os.listdir(input_path)
-            if f.endswith(".txt") and os.path.isfile(os.path.join(input_path, f))
+            if f.endswith(".txt")
+            and not f.endswith(f"{FORMATTED_FILE_SUFFIX}.txt")
+            and os.path.isfile(os.path.join(input_path, f))
         ]
         num_files = len(filenames)
         print(f"Found {num_files} .txt file(s) in the directory: {input_path}")
-        confirmation = (
-            input_func(f"Do you want to format {num_files} file(s)? (Y/n): ")
-            .strip()
-            .lower()
-        )
+        if arguments.yes:
+            confirmation = "y"
+        else:
+            confirmation = (
+                input_func(f"Do you want to format {num_files} file(s)? (Y/n): ")
+                .strip()
+                .lower()
+            )
         if confirmation in ["y", "yes", ""]:
+            start_time = time.perf_counter()
+            old_manifest = {} if arguments.force else load_manifest(input_path)
+            manifest = {}
+            stale_filenames = []
             for file_name in filenames:
-                full_filename = os.path.join(input_path, file_name)
-                process_file(full_filename)
+                entry = old_manifest.get(file_name)
+                if is_up_to_date(os.path.join(input_path, file_name), entry):
+                    manifest[file_name] = entry
+                else:
+                    stale_filenames.append(file_name)
+
+            num_skipped = num_files - len(stale_filenames)
+            if num_skipped:
+                print(f"Skipping {num_skipped} file(s) that are already up to date")
+
+            results = format_directory_files(
+                [os.path.join(input_path, file_name) for file_name in stale_filenames],
+                jobs=arguments.jobs,
+                streaming=arguments.stream,
+                profile=profile,
+            )
+            for result in results:
+                if not result.formatted:
+                    continue
+                try:
+                    manifest[os.path.basename(result.file_path)] = (
+                        create_manifest_entry(result.file_path)
+                    )
+                except OSError as e:
+                    logger.error(
+                        f"Unable to add {result.file_path} to the manifest: {e}"
+                    )
+            save_manifest(input_path, manifest)
+
+            print_throughput_summary(results, time.perf_counter() - start_time)
+            if profile:
+                write_profile_report(results, arguments.profile)
+                print_profile_summary(results, arguments.profile_top)
         else:
             logger.info("Format files in directory canceled by user.")
             print("Operation cancelled.")
@@ -65,65 +849,50 @@ def format_files(input_func=input):
         sys.exit(1)
 
 
-def process_file(file_path):
+def process_file(
+    file_path, streaming=False, chunk_size=DEFAULT_CHUNK_SIZE, jobs=1, profile=None
+):
     """
     Process and format a single text file.
 
     Args:
         file_path (str): The path to the file to be processed.
+        streaming (bool): Whether to read and write the file in chunks instead
+            of loading it into memory at once. The output is the same either way.
+        chunk_size (int): The number of characters to read at a time when streaming.
+        jobs (int): The number of worker processes to split a large file across.
+            Ignored when streaming.
+        profile (Optional[List[RuleProfile]]): If given, per-rule measurements
+            are appended to this list.
+
+    Returns:
+        bool: True if the formatted file was written, False if an error occurred.
     """
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            source_text = f.read()
-
-            # Replace fancy quotes with regular quotes
-            source_text = re.sub(r"[“”]", '"', source_text)
-            source_text = re.sub(r"[‘’`]", "'", source_text)
-
-            # Replace different dash/hyphen patterns
-            source_text = re.sub(r" --- ", " - ", source_text)  # Change to hyphen
-            source_text = re.sub(r"---", "–", source_text)  # Change to en dash
-
-            # Replace ellipsis variations with standard ellipsis
-            source_text = re.sub(r"…|\s\.\s\.\s\.", "...", source_text)
-            source_text = re.sub(r"\s\.\.\.", "...", source_text)
-
-            # Standardize section/chapter markers
-            source_text = re.sub(
-                r"CHAPTER \d+$", "***", source_text, flags=re.MULTILINE
-            )
+        # Generate the new file name with "_fmtd" suffix
+        new_file_path = get_formatted_file_path(file_path)
 
-            # Reduce multiple "***" lines to a single one
-            source_text = re.sub(
-                r"(^\*\*\*$\n){2,}", "***\n", source_text, flags=re.MULTILINE
-            )
-
-            # Replace multiple newlines with section separator
-            source_text = re.sub(r"\n{3,}", "\n***\n", source_text)
-
-            source_text = re.sub(r"\*{4,}", "***", source_text)
-
-            # Remove empty lines
-            source_text = re.sub(r"^\s*$", "", source_text, flags=re.MULTILINE)
-
-            # Trim leading and trailing whitespace
-            source_text = re.sub(r"^\s+|\s+$", "", source_text, flags=re.MULTILINE)
-
-            # Remove lines with only digits
-            source_text = re.sub(r"^\d+$", "", source_text, flags=re.MULTILINE)
+        if streaming:
+            with open(file_path, "r", encoding="utf-8") as input_file, open(
+                new_file_path, "w", encoding="utf-8"
+            ) as output_file:
+                format_stream(input_file, output_file, chunk_size, profile)
+        else:
+            with open(file_path, "r", encoding="utf-8") as f:
+                source_text = f.read()
 
-            # Generate the new file name with "_fmtd" suffix
-            file_name, file_extension = os.path.splitext(file_path)
-            new_file_path = f"{file_name}_fmtd{file_extension}"
+            source_text = format_text_parallel(source_text, jobs, profile)
 
             # Write the formatted content to the new file
             with open(new_file_path, "w", encoding="utf-8") as f:
                 f.write(source_text)
 
-            logger.info(f"Formatted file saved as: {new_file_path}")
+        logger.info(f"Formatted file saved as: {new_file_path}")
+        return True
 
     except IOError as e:
         logger.error(f"Error processing file {file_path}: {e}")
+        return False
 
 
 if __name__ == "__main__":
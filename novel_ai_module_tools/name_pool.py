@@ -0,0 +1,85 @@
+from collections import deque
+from heapq import merge
+from typing import Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+"""
+name_pool.py
+
+Holds the replacement names of one name type, in their shuffled order.
+
+Surnames ending in 's' or 'x' are only replaced with surnames that also end in
+'s' or 'x', and other surnames only with surnames that don't. The pool keeps
+the two kinds of names apart, so the first name of the right kind is taken
+without walking past the names of the other kind.
+"""
+
+
+def ends_with_s_or_x(name: str) -> bool:
+    """
+    Check whether a name ends in 's' or 'x'.
+
+    Args:
+        name (str): The name to check.
+
+    Returns:
+        bool: True if the name ends in 's' or 'x'.
+    """
+    return name.endswith("s") or name.endswith("x")
+
+
+class NamePool:
+    """
+    Replacement names that are taken from the front, kept apart by their ending.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        """
+        Initialize the NamePool.
+
+        Args:
+            names (Iterable[str]): The names, in the order they are to be taken.
+        """
+        self.partitions: Dict[bool, Deque[Tuple[int, str]]] = {
+            True: deque(),
+            False: deque(),
+        }
+        for position, name in enumerate(names):
+            self.partitions[ends_with_s_or_x(name)].append((position, name))
+
+    def __len__(self) -> int:
+        return len(self.partitions[True]) + len(self.partitions[False])
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterate over the names left in the pool, in order.
+
+        Returns:
+            Iterator[str]: The names.
+        """
+        return (
+            name for _, name in merge(self.partitions[True], self.partitions[False])
+        )
+
+    def pop(self, ending_in_s_or_x: Optional[bool] = None) -> Optional[str]:
+        """
+        Take the first name left in the pool.
+
+        Args:
+            ending_in_s_or_x (Optional[bool]): True to take the first name ending
+                in 's' or 'x', False to take the first name that doesn't, or None
+                to take the first name of either kind.
+
+        Returns:
+            Optional[str]: The name, or None if there are no names of that kind.
+        """
+        if ending_in_s_or_x is None:
+            fronts = [partition for partition in self.partitions.values() if partition]
+            if not fronts:
+                return None
+            return min(fronts, key=lambda partition: partition[0][0]).popleft()[1]
+
+        partition = self.partitions[ending_in_s_or_x]
+        if not partition:
+            return None
+
+        return partition.popleft()[1]
@@ -0,0 +1,190 @@
+import re
+from collections import Counter
+from typing import Dict, List, Match, Tuple
+
+from novel_ai_module_tools.logger_config import get_logger
+
+"""
+name_replacer.py
+
+Replaces the names of a file in one scan of its text.
+
+find_and_replace.py used to run one re.sub over the whole text for each name.
+replace_names gives the same text, but replaces all of the names that cannot
+affect each other in a single scan. Only names that may overlap another name,
+or whose replacement may create another name, are still replaced one at a time.
+"""
+
+# Characters a name must be between to be replaced. A name may also start a line.
+NAME_BOUNDARY_CLASS = r"[ ?!,.();'\"\-–—]"
+NAME_SEPARATOR_PATTERN = re.compile(r"[ ?!,.();'\"\-–—\n]")
+
+logger = get_logger(__file__)
+
+
+def get_name_pattern(original_name: str) -> str:
+    """
+    Get the pattern that finds a name between two boundary characters.
+
+    Args:
+        original_name (str): The name to find.
+
+    Returns:
+        str: The pattern, with the leading and trailing boundaries as groups.
+    """
+    return r"(^|%s)%s(%s)" % (
+        NAME_BOUNDARY_CLASS,
+        re.escape(original_name),
+        NAME_BOUNDARY_CLASS,
+    )
+
+
+def get_replacement_template(replacement: str) -> str:
+    """
+    Get the re.sub template that puts a replacement between the boundaries.
+
+    Args:
+        replacement (str): The replacement name.
+
+    Returns:
+        str: The template.
+    """
+    return r"\1%s\2" % re.escape(str.strip(replacement))
+
+
+def replace_name(text: str, original_name: str, replacement: str) -> str:
+    """
+    Replace every occurrence of one name in a text.
+
+    Each match takes its trailing boundary character with it, so of two
+    occurrences separated by a single boundary character only the first is
+    replaced.
+
+    Args:
+        text (str): The text to replace the name in.
+        original_name (str): The name to replace.
+        replacement (str): The name to replace it with.
+
+    Returns:
+        str: The text with the name replaced.
+    """
+    return re.sub(
+        get_name_pattern(original_name),
+        get_replacement_template(replacement),
+        text,
+        flags=re.MULTILINE,
+    )
+
+
+def get_name_tokens(text: str) -> List[str]:
+    """
+    Split a text into the runs of characters between boundaries and newlines.
+
+    A name without boundary characters can only match one whole token.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        List[str]: The non-empty tokens, in order.
+    """
+    return [token for token in NAME_SEPARATOR_PATTERN.split(text) if token]
+
+
+def get_independent_replacements(replacements: List[Tuple[str, str]]) -> Dict[str, str]:
+    """
+    Find the replacements that can be made in any order without changing the text.
+
+    A replacement is independent if its name and the text it inserts are each
+    a single token, its name is not part of any other name or inserted text,
+    and the text it inserts is not part of any other name.
+
+    Args:
+        replacements (List[Tuple[str, str]]): The names and their replacements.
+
+    Returns:
+        Dict[str, str]: The text inserted for each independent name.
+    """
+    inserted_texts = [
+        re.match("()()", "").expand(get_replacement_template(replacement))
+        for _, replacement in replacements
+    ]
+    name_tokens: Counter = Counter()
+    inserted_tokens: Counter = Counter()
+    for (original_name, _), inserted_text in zip(replacements, inserted_texts):
+        name_tokens.update(set(get_name_tokens(original_name)))
+        inserted_tokens.update(set(get_name_tokens(inserted_text)))
+
+    independent: Dict[str, str] = {}
+    for (original_name, _), inserted_text in zip(replacements, inserted_texts):
+        if get_name_tokens(original_name) != [original_name]:
+            continue
+        if get_name_tokens(inserted_text) != [inserted_text]:
+            continue
+
+        same = 1 if inserted_text == original_name else 0
+        if (
+            name_tokens[original_name] == 1
+            and inserted_tokens[original_name] == same
+            and name_tokens[inserted_text] == same
+        ):
+            independent[original_name] = inserted_text
+
+    return independent
+
+
+def replace_names(text: str, replacements: List[Tuple[str, str]]) -> str:
+    """
+    Replace names in a text, giving the same result as replace_name for each in turn.
+
+    The independent replacements (see get_independent_replacements) are made
+    in one scan of the text. The rest are then made one at a time, in order.
+
+    Args:
+        text (str): The text to replace the names in.
+        replacements (List[Tuple[str, str]]): The names and their replacements,
+            in the order they are to be made.
+
+    Returns:
+        str: The text with the names replaced.
+    """
+    independent = get_independent_replacements(replacements)
+    if independent:
+        pattern = re.compile(
+            r"(^|%s)(%s)(?=%s)"
+            % (
+                NAME_BOUNDARY_CLASS,
+                "|".join(
+                    re.escape(name)
+                    for name in sorted(independent, key=len, reverse=True)
+                ),
+                NAME_BOUNDARY_CLASS,
+            ),
+            flags=re.MULTILINE,
+        )
+        # Where the boundary after the last replaced occurrence of each name is
+        last_boundaries: Dict[str, int] = {}
+
+        def replace_match(match: Match) -> str:
+            name = match.group(2)
+            # One at a time, the previous occurrence would have taken this
+            # occurrence's leading boundary, and it would not be replaced
+            if match.group(1) and last_boundaries.get(name) == match.start():
+                return match.group()
+
+            last_boundaries[name] = match.end()
+            return match.group(1) + independent[name]
+
+        text = pattern.sub(replace_match, text)
+
+    dependent = [
+        (original_name, replacement)
+        for original_name, replacement in replacements
+        if original_name not in independent
+    ]
+    if dependent:
+        logger.debug(f"Replacing {len(dependent)} names one at a time")
+    for original_name, replacement in dependent:
+        text = replace_name(text, original_name, replacement)
+
+    return text
@@ -1,4 +1,9 @@
-from typing import Dict, List, Set
+import json
+import os
+import re
+import socket
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from pathlib import Path
 
 import spacy
@@ -6,11 +11,50 @@ from spacy.language import Language
 from spacy.tokens import Doc
 
 from novel_ai_module_tools.config import *
-from novel_ai_module_tools.resources_loader import load_name_recognizers
+from novel_ai_module_tools.ner_cache import NERCache, get_ner_cache_path
+from novel_ai_module_tools.resources_loader import (
+    NameIndex,
+    load_name_recognizer_index,
+)
 from novel_ai_module_tools.logger_config import get_logger
 
 logger = get_logger(__file__)
 
+NER_SERVER_CONNECT_TIMEOUT = 1.0
+NER_SERVER_ENCODING = "utf-8"
+# A word, including names joined with hyphens or apostrophes like O'Neil
+GAZETTEER_WORD_PATTERN = re.compile(r"[\w'’-]+")
+# A capitalized word after one of these starts a sentence
+SENTENCE_END_CHARACTERS = ".!?…:\n\r"
+# Characters that may come between the end of a sentence and its first word
+SENTENCE_START_CHARACTERS = " \t\"'“‘(*—–-"
+# Capitalized words that are not names, even where they are in the name lists.
+# Contractions like "I'm" are checked by the part before the apostrophe.
+NON_NAME_WORDS = frozenset(
+    [
+        "I",
+        "Monday",
+        "Tuesday",
+        "Wednesday",
+        "Thursday",
+        "Friday",
+        "Saturday",
+        "Sunday",
+        "January",
+        "February",
+        "March",
+        "April",
+        "May",
+        "June",
+        "July",
+        "August",
+        "September",
+        "October",
+        "November",
+        "December",
+    ]
+)
+
 
 def get_unique_entities(ner_entities: Doc) -> Set[str]:
     """
@@ -55,47 +99,604 @@ def get_ner_write_file(
     return ner_directory / f"{NER_FILE_PREFIX}{base_file_name}"
 
 
-def perform_ner(
+def get_text_chunks(file_name: Path, chunk_size: int) -> Iterator[str]:
+    """
+    Read a file in chunks of whole paragraphs.
+
+    Paragraphs are added to a chunk until the next one would take it past
+    chunk_size characters. A paragraph longer than chunk_size is cut at the
+    last space before the limit, or at the limit if it has no spaces. Joined
+    back together, the chunks are the text of the file.
+
+    Args:
+        file_name (Path): The file to read.
+        chunk_size (int): The most characters to put in a chunk.
+
+    Yields:
+        str: Each chunk of the file, in order.
+    """
+    chunk_lines: List[str] = []
+    chunk_length = 0
+    with file_name.open() as input_file:
+        for line in input_file:
+            if chunk_length and chunk_length + len(line) > chunk_size:
+                yield "".join(chunk_lines)
+                chunk_lines = []
+                chunk_length = 0
+
+            while len(line) > chunk_size:
+                cut = line.rfind(" ", 0, chunk_size) + 1 or chunk_size
+                yield line[:cut]
+                line = line[cut:]
+
+            chunk_lines.append(line)
+            chunk_length += len(line)
+
+    if chunk_lines:
+        yield "".join(chunk_lines)
+
+
+def read_text_chunks(
+    file_names: Iterable[Path], chunk_size: int
+) -> Iterator[Tuple[str, int]]:
+    """
+    Read the chunks of each file as they are needed.
+
+    Args:
+        file_names (Iterable[Path]): The file paths to read. They are only taken
+            from the iterable once the chunks of the file before are read.
+        chunk_size (int): The most characters to put in a chunk.
+
+    Yields:
+        Tuple[str, int]: Each chunk with the index of the file it came from. An
+            empty file gives one empty chunk, so every file gets a result.
+    """
+    for file_index, file_name in enumerate(file_names):
+        chunk_count = 0
+        for chunk in get_text_chunks(file_name, chunk_size):
+            chunk_count += 1
+            yield chunk, file_index
+
+        if chunk_count == 0:
+            yield "", file_index
+
+
+def load_ner_model(model_name: str = NER_MODEL) -> Language:
+    """
+    Load a spaCy model with only the components NER needs.
+
+    Args:
+        model_name (str): The name of the model to load.
+
+    Returns:
+        Language: The loaded model.
+    """
+    logger.info(f"Loading NER model: [{model_name}]")
+    return spacy.load(
+        model_name, disable=["tagger", "parser", "attribute_ruler", "lemmatizer"]
+    )
+
+
+def get_file_entities(
+    get_model: Callable[[], Language],
+    file_names: Iterable[Path],
+    batch_size: int,
+    n_process: int,
+    chunk_size: int,
+    cache: Optional[NERCache] = None,
+    prefilter_index: Optional[NameIndex] = None,
+) -> List[Set[str]]:
+    """
+    Find the PERSON entities of each file.
+
+    The files are read lazily in paragraph-aligned chunks and streamed through
+    ``nlp.pipe``, which batches them and can spread the batches over several
+    processes. The PERSON entities of each file's chunks are merged, and each
+    Doc is dropped once its entities are taken, so memory use depends on the
+    chunk size rather than the size of the file.
+
+    Chunks found in the cache are not run through the model, and the model is
+    only loaded if at least one chunk is missing from the cache.
+
+    With a prefilter index, only the paragraphs that may contain a name (see
+    is_candidate_paragraph) are run through the model. This is faster, but
+    the model has less context and may miss some names.
+
+    The file names may be a stream of files that are still being written, in
+    which case the model runs on the files already taken while the rest are
+    being prepared.
+
+    Args:
+        get_model (Callable[[], Language]): Returns the spaCy model to use.
+        file_names (Iterable[Path]): The file paths to process.
+        batch_size (int): Number of chunks spaCy processes in each batch.
+        n_process (int): Number of processes spaCy runs the model on.
+        chunk_size (int): The most characters to run the model on at once.
+        cache (Optional[NERCache]): The entities of chunks seen before.
+        prefilter_index (Optional[NameIndex]): The name index to prefilter
+            paragraphs with, or None to run the model on all of the text.
+
+    Returns:
+        List[Set[str]]: The unique person names found in each file, in file order.
+    """
+    file_entities: List[Set[str]] = []
+    cached_chunks = 0
+
+    def get_uncached_chunks() -> Iterator[Tuple[str, Tuple[int, Optional[str]]]]:
+        nonlocal cached_chunks
+        for chunk, file_index in read_text_chunks(file_names, chunk_size):
+            if file_index == len(file_entities):
+                file_entities.append(set())
+            if prefilter_index is not None:
+                chunk = filter_candidate_paragraphs(chunk, prefilter_index)
+                if not chunk:
+                    continue
+
+            if cache is None:
+                yield chunk, (file_index, None)
+                continue
+
+            key = cache.get_key(chunk)
+            cached_entities = cache.get(key)
+            if cached_entities is None:
+                yield chunk, (file_index, key)
+            else:
+                cached_chunks += 1
+                file_entities[file_index] |= get_unique_entities(cached_entities)
+
+    uncached_chunks = get_uncached_chunks()
+    first_chunk = next(uncached_chunks, None)
+    if first_chunk is not None:
+        NER = get_model()
+        if chunk_size > NER.max_length:
+            NER.max_length = chunk_size
+
+        results: Iterator[Tuple[Doc, Tuple[int, Optional[str]]]] = NER.pipe(
+            chain([first_chunk], uncached_chunks),
+            as_tuples=True,
+            batch_size=batch_size,
+            n_process=n_process,
+        )
+        for ner_entities, (file_index, key) in results:
+            if cache is not None:
+                cache.add(key, ner_entities)
+            file_entities[file_index] |= get_unique_entities(ner_entities)
+
+    if cache is not None:
+        logger.info(f"Found {cached_chunks} chunks in the NER cache")
+
+    return file_entities
+
+
+def get_paragraph_window(text: str, start: int, end: int) -> str:
+    """
+    Get the paragraph of a text that an entity is in.
+
+    Args:
+        text (str): The text the entity was found in.
+        start (int): The offset of the start of the entity.
+        end (int): The offset of the end of the entity.
+
+    Returns:
+        str: The lines of the text containing the entity.
+    """
+    window_start = text.rfind("\n", 0, start) + 1
+    window_end = text.find("\n", end)
+    return text[window_start : window_end if window_end != -1 else len(text)]
+
+
+def get_cascade_file_entities(
+    get_small_model: Callable[[], Language],
+    get_large_model: Callable[[], Language],
+    large_model_name: str,
+    name_index: NameIndex,
+    file_names: List[Path],
+    batch_size: int,
+    n_process: int,
+    chunk_size: int,
+) -> List[Dict[str, str]]:
+    """
+    Find the PERSON entities of each file with a small model, checking the
+    names it is unsure of with a larger one.
+
+    The small model runs on all of the text. A name it finds that is in the
+    name lists is taken as confirmed. A name that is not in the lists is only
+    kept if the large model also finds it as a person in one of the paragraphs
+    the small model found it in. The large model only runs on those
+    paragraphs, and is only loaded if there are any.
+
+    Args:
+        get_small_model (Callable[[], Language]): Returns the small model.
+        get_large_model (Callable[[], Language]): Returns the large model.
+        large_model_name (str): The name recorded for names the large model
+            confirms.
+        name_index (NameIndex): The index of the recognized names.
+        file_names (List[Path]): List of file paths to process.
+        batch_size (int): Number of chunks spaCy processes in each batch.
+        n_process (int): Number of processes spaCy runs the models on.
+        chunk_size (int): The most characters to run a model on at once.
+
+    Returns:
+        List[Dict[str, str]]: For each file, in file order, the unique person
+            names found mapped to the name of the model that confirmed them.
+    """
+    name_tiers: List[Dict[str, str]] = [{} for _ in file_names]
+    unconfirmed_names: List[Set[str]] = [set() for _ in file_names]
+    windows: Set[Tuple[str, int]] = set()
+
+    NER = get_small_model()
+    if chunk_size > NER.max_length:
+        NER.max_length = chunk_size
+    results: Iterator[Tuple[Doc, int]] = NER.pipe(
+        read_text_chunks(file_names, chunk_size),
+        as_tuples=True,
+        batch_size=batch_size,
+        n_process=n_process,
+    )
+    for ner_entities, file_index in results:
+        for entity in ner_entities.ents:
+            if entity.label_ != "PERSON":
+                continue
+            for name in entity.text.split():
+                if not name[0].isupper():
+                    continue
+                if name in name_index.name_types:
+                    name_tiers[file_index][name] = NER_MODEL
+                else:
+                    unconfirmed_names[file_index].add(name)
+                    windows.add(
+                        (
+                            get_paragraph_window(
+                                ner_entities.text, entity.start_char, entity.end_char
+                            ),
+                            file_index,
+                        )
+                    )
+
+    if windows:
+        logger.info(f"Checking {len(windows)} paragraphs with [{large_model_name}]")
+        NER = get_large_model()
+        results = NER.pipe(
+            sorted(windows),
+            as_tuples=True,
+            batch_size=batch_size,
+            n_process=n_process,
+        )
+        for ner_entities, file_index in results:
+            for name in get_unique_entities(ner_entities):
+                if name in unconfirmed_names[file_index]:
+                    name_tiers[file_index].setdefault(name, large_model_name)
+
+    return name_tiers
+
+
+def get_list_name(word: str, name_index: NameIndex) -> Optional[str]:
+    """
+    Find the name in the name lists that a capitalized word stands for.
+
+    Args:
+        word (str): A word matched by GAZETTEER_WORD_PATTERN.
+        name_index (NameIndex): The index of the recognized names.
+
+    Returns:
+        Optional[str]: The name, which drops any possessive from the word, or
+            None if the word is not capitalized or not in the name lists.
+    """
+    name = word.strip("-'’")
+    if not name or not name[0].isupper():
+        return None
+
+    if name not in name_index.name_types:
+        name = re.sub("['’]s$", "", name)
+    if name not in name_index.name_types:
+        name = re.split("['’]", name, maxsplit=1)[0]
+    if name in name_index.name_types:
+        return name
+
+    return None
+
+
+def get_likely_names(text: str, name_index: NameIndex) -> Iterator[str]:
+    """
+    Find the words of a text that are likely to be names, without a model.
+
+    A word is a likely name if it is in the name lists, or if it is capitalized
+    and does not start a sentence or paragraph. The pronoun "I", its
+    contractions, and the names of days and months (NON_NAME_WORDS) are never
+    likely names, so first-person paragraphs without names are not kept.
+
+    Args:
+        text (str): The text to search.
+        name_index (NameIndex): The index of the recognized names.
+
+    Yields:
+        str: Each likely name, without any possessive, in the order found.
+    """
+    for match in GAZETTEER_WORD_PATTERN.finditer(text):
+        word = match.group()
+        if not word.strip("-'’")[:1].isupper():
+            continue
+        if re.split("['’]", word.strip("-'’"), maxsplit=1)[0] in NON_NAME_WORDS:
+            continue
+        list_name = get_list_name(word, name_index)
+        if list_name is not None:
+            yield list_name
+            continue
+
+        index = match.start() - 1
+        while index >= 0 and text[index] in SENTENCE_START_CHARACTERS:
+            index -= 1
+        if index >= 0 and text[index] not in SENTENCE_END_CHARACTERS:
+            yield re.split("['’]", word.strip("-'’"), maxsplit=1)[0]
+
+
+def is_candidate_paragraph(paragraph: str, name_index: NameIndex) -> bool:
+    """
+    Check whether a paragraph may contain a person's name.
+
+    A paragraph is a candidate if it has a likely name (see get_likely_names).
+
+    Args:
+        paragraph (str): The paragraph to check.
+        name_index (NameIndex): The index of the recognized names.
+
+    Returns:
+        bool: True if the paragraph should be run through the model.
+    """
+    return next(get_likely_names(paragraph, name_index), None) is not None
+
+
+def filter_candidate_paragraphs(text: str, name_index: NameIndex) -> str:
+    """
+    Keep only the paragraphs of a text that may contain a person's name.
+
+    Args:
+        text (str): The text to filter.
+        name_index (NameIndex): The index of the recognized names.
+
+    Returns:
+        str: The candidate paragraphs, in order.
+    """
+    return "".join(
+        paragraph
+        for paragraph in text.splitlines(keepends=True)
+        if is_candidate_paragraph(paragraph, name_index)
+    )
+
+
+def get_gazetteer_entities(
+    name_index: NameIndex, file_names: List[Path], chunk_size: int
+) -> List[Set[str]]:
+    """
+    Find the names of each file that are in the name lists, without a model.
+
+    Each chunk of the file is scanned once for words, and each capitalized
+    word is looked up in the name index. Like the model path, names are
+    matched a word at a time, and a possessive such as "John's" matches "John".
+
+    Args:
+        name_index (NameIndex): The index of the recognized names.
+        file_names (List[Path]): List of file paths to process.
+        chunk_size (int): The most characters to read at once.
+
+    Returns:
+        List[Set[str]]: The unique list names found in each file, in file order.
+    """
+    file_entities: List[Set[str]] = [set() for _ in file_names]
+    for chunk, file_index in read_text_chunks(file_names, chunk_size):
+        for word in set(GAZETTEER_WORD_PATTERN.findall(chunk)):
+            name = get_list_name(word, name_index)
+            if name is not None:
+                file_entities[file_index].add(name)
+
+    return file_entities
+
+
+def is_owned_by_user(path: str) -> bool:
+    """
+    Check whether a path belongs to the user running this process.
+
+    Args:
+        path (str): The path to check.
+
+    Returns:
+        bool: True if the path exists and the user owns it. Always False where
+            there are no user IDs, such as on Windows.
+    """
+    if not hasattr(os, "getuid"):
+        return False
+
+    try:
+        return os.stat(path).st_uid == os.getuid()
+    except OSError:
+        return False
+
+
+def request_file_entities(
+    socket_path: str,
     file_names: List[Path],
+    batch_size: int,
+    n_process: int,
+    chunk_size: int,
+    cache_path: Optional[Path] = None,
+    prefilter_names_path: Optional[Path] = None,
+) -> Optional[List[Set[str]]]:
+    """
+    Ask a running NER server for the PERSON entities of each file.
+
+    The server keeps the model loaded between runs (see ner_server.py). The
+    request is one line of JSON naming the model and the files, and the reply
+    is one line of JSON with the names found in each file. Sockets that belong
+    to another user are not used.
+
+    Args:
+        socket_path (str): The path of the server's Unix socket.
+        file_names (List[Path]): List of file paths to process.
+        batch_size (int): Number of chunks spaCy processes in each batch.
+        n_process (int): Number of processes spaCy runs the model on.
+        chunk_size (int): The most characters to run the model on at once.
+        cache_path (Optional[Path]): The NER cache directory for the server to use.
+        prefilter_names_path (Optional[Path]): The ignore list to load the name
+            index with, if the server should prefilter paragraphs.
+
+    Returns:
+        Optional[List[Set[str]]]: The unique person names found in each file, or
+            None if no server is running or it could not handle the request.
+    """
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "getuid"):
+        return None
+    if not Path(socket_path).exists():
+        return None
+    # Another user could have put a socket there to answer with their own names
+    if not is_owned_by_user(socket_path):
+        logger.warning(f"Not using NER server at [{socket_path}] of another user")
+        return None
+
+    request = {
+        "model": NER_MODEL,
+        "files": [str(file_name.resolve()) for file_name in file_names],
+        "batch_size": batch_size,
+        "n_process": n_process,
+        "chunk_size": chunk_size,
+        "cache_path": str(cache_path.resolve()) if cache_path else None,
+        "prefilter_names_path": (
+            str(prefilter_names_path.resolve()) if prefilter_names_path else None
+        ),
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(NER_SERVER_CONNECT_TIMEOUT)
+            client.connect(socket_path)
+            # NER can take a long time, so only the connection has a timeout
+            client.settimeout(None)
+            client.sendall((json.dumps(request) + "\n").encode(NER_SERVER_ENCODING))
+            with client.makefile("r", encoding=NER_SERVER_ENCODING) as reply_file:
+                reply = json.loads(reply_file.readline())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unable to use NER server at [{socket_path}]: {e}")
+        return None
+
+    if "error" in reply:
+        logger.warning(f"NER server at [{socket_path}] failed: {reply['error']}")
+        return None
+
+    logger.info(f"Used NER server at [{socket_path}]")
+    return [set(entities) for entities in reply["entities"]]
+
+
+def perform_ner(
+    file_names: Iterable[Path],
     ner_directory: Path,
     resource_directory: Path,
     strip_prefixes: List[str],
+    batch_size: int = NER_BATCH_SIZE,
+    n_process: int = NER_PROCESSES,
+    chunk_size: int = NER_CHUNK_SIZE,
+    socket_path: str = NER_SOCKET_PATH,
+    use_cache: bool = NER_USE_CACHE,
+    gazetteer_only: bool = False,
+    prefilter: bool = NER_PREFILTER,
+    cascade_model: Optional[str] = NER_CASCADE_MODEL,
 ) -> None:
     """
     Perform Named Entity Recognition (NER) on a list of files and write the results.
 
+    If an NER server is listening on socket_path, it runs the model, saving the
+    time it takes to load it. Otherwise the model is loaded here.
+
+    The entities found in each chunk of text are cached in the NER directory,
+    so re-running NER after changing the ignore list or the name lists only
+    runs the model on text that has changed.
+
+    With prefilter, the model is only run on paragraphs that may contain a
+    name. In gazetteer-only mode no model is used at all. Only names that are in
+    the name lists are found, which is much faster.
+
+    With a cascade model, the configured model runs on all of the text and the
+    cascade model checks the names that are not in the name lists (see
+    get_cascade_file_entities). Each line of the NER files then ends with the
+    name of the model that confirmed the name.
+
+    The file names may be a stream of files that are still being written (see
+    split_and_ner.stream_ner_source_files). When the model is run here, it
+    starts on the first files while the rest are being prepared. The other
+    modes wait for all of the files first.
+
     Args:
-        file_names (List[Path]): List of file paths to process.
+        file_names (Iterable[Path]): The file paths to process.
         ner_directory (Path): Directory to save the NER results.
         resource_directory (Path): Directory containing resource files.
         strip_prefixes (List[str]): Prefixes to be removed from output file names.
+        batch_size (int): Number of chunks spaCy processes in each batch.
+        n_process (int): Number of processes spaCy runs the model on.
+        chunk_size (int): The most characters to run the model on at once.
+        socket_path (str): The path of the NER server's Unix socket.
+        use_cache (bool): Whether to use and update the NER cache.
+        gazetteer_only (bool): Whether to find names from the name lists
+            instead of running the model.
+        prefilter (bool): Whether to only run the model on paragraphs that may
+            contain a name.
+        cascade_model (Optional[str]): The larger model to check uncertain names
+            with, or None to use only the configured model.
 
     Returns:
         None
     """
-    names: Dict[str, List[str]] = load_name_recognizers()
+    ignore_names_path = resource_directory / "ignore_names.txt"
+    name_index: NameIndex = load_name_recognizer_index(ignore_names_path)
 
-    # Ignore Names
-    try:
-        logger.info(
-            f"Loading ignore names from: [{resource_directory}/ignore_names.txt]"
+    name_tiers: Optional[List[Dict[str, str]]] = None
+    if gazetteer_only or cascade_model or Path(socket_path).exists():
+        file_names = list(file_names)
+
+    if gazetteer_only:
+        logger.info("Finding names from the name lists only")
+        file_entities = get_gazetteer_entities(name_index, file_names, chunk_size)
+    elif cascade_model:
+        name_tiers = get_cascade_file_entities(
+            load_ner_model,
+            lambda: load_ner_model(cascade_model),
+            cascade_model,
+            name_index,
+            file_names,
+            batch_size,
+            n_process,
+            chunk_size,
         )
-        ignore_names = (
-            (resource_directory / "ignore_names.txt").read_text().splitlines()
+        file_entities = [set(tiers) for tiers in name_tiers]
+    else:
+        cache_path = get_ner_cache_path(ner_directory, NER_MODEL) if use_cache else None
+        file_entities = request_file_entities(
+            socket_path,
+            file_names,
+            batch_size,
+            n_process,
+            chunk_size,
+            cache_path,
+            ignore_names_path if prefilter else None,
         )
-    except FileNotFoundError:
-        ignore_names = []
+        if file_entities is None:
+            taken_file_names: List[Path] = []
 
-    logger.info(f"Loading NER model: [{NER_MODEL}]")
-    NER: Language = spacy.load(
-        NER_MODEL, disable=["tagger", "parser", "attribute_ruler", "lemmatizer"]
-    )
+            def take_file_names() -> Iterator[Path]:
+                for file_name in file_names:
+                    taken_file_names.append(file_name)
+                    yield file_name
 
-    for file_name in file_names:
-        data: str = file_name.read_text()
+            file_entities = get_file_entities(
+                load_ner_model,
+                take_file_names(),
+                batch_size,
+                n_process,
+                chunk_size,
+                NERCache(cache_path) if cache_path else None,
+                name_index if prefilter else None,
+            )
+            file_names = taken_file_names
 
-        ner_entities: Doc = NER(data)
-        unique_entities: Set[str] = get_unique_entities(ner_entities)
+    for file_index, (file_name, unique_entities) in enumerate(
+        zip(file_names, file_entities)
+    ):
         logger.info(
             f"Found {len(unique_entities)} unique entities in file: [{file_name}]"
         )
@@ -116,16 +717,13 @@ def perform_ner(
                     # Ignore possessives
                     number_of_possessives += 1
                     continue
-                if name.lower() in ignore_names:
+                if name_index.is_ignored(name):
                     number_of_ignored += 1
                     continue
 
-                write_out = f"{name}|PERSON|"
-
-                for name_type, name_list in names.items():
-                    if name in name_list:
-                        write_out = write_out + name_type
-                        break
+                write_out = f"{name}|PERSON|{name_index.get_type(name)}"
+                if name_tiers is not None:
+                    write_out = f"{write_out}|{name_tiers[file_index][name]}"
 
                 output_file.write(write_out + "\n")
 
@@ -0,0 +1,156 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+import spacy
+from spacy.tokens import Doc
+
+from novel_ai_module_tools.file_utils import save_json_atomically
+from novel_ai_module_tools.logger_config import get_logger
+
+"""
+ner_cache.py
+
+Caches the entities spaCy finds in each chunk of text, so NER only runs the
+model on text it has not seen before.
+
+Each chunk's entity spans are kept in their own file, named after the SHA-256
+hash of the chunk's text and sharded into directories by the first characters
+of the hash, so a run only reads and writes the entries of the chunks it
+processes. A separate cache directory is kept for each model and spaCy
+version, since either can change the entities that are found.
+"""
+
+NER_CACHE_VERSION = 2
+NER_CACHE_SHARD_LENGTH = 2
+
+logger = get_logger(__file__)
+
+
+class CachedEntity(NamedTuple):
+    """
+    An entity span read from the cache.
+
+    Attributes:
+        text (str): The text of the entity.
+        label_ (str): The entity label, such as PERSON.
+        start_char (int): The offset of the entity in its chunk.
+        end_char (int): The offset of the end of the entity in its chunk.
+    """
+
+    text: str
+    label_: str
+    start_char: int
+    end_char: int
+
+
+class CachedDoc(NamedTuple):
+    """
+    The entities of a chunk read from the cache, in place of a spaCy Doc.
+
+    Attributes:
+        ents (List[CachedEntity]): The entities found in the chunk.
+    """
+
+    ents: List[CachedEntity]
+
+
+def get_ner_cache_path(directory: Path, model_name: str) -> Path:
+    """
+    Get the path of the cache directory for a model and the installed spaCy
+    version.
+
+    Args:
+        directory (Path): The directory to keep the cache in.
+        model_name (str): The name of the spaCy model.
+
+    Returns:
+        Path: The path to the hidden cache directory.
+    """
+    return directory / f".ner_cache_{model_name}_{spacy.__version__}"
+
+
+class NERCache:
+    """
+    The entity spans found in each chunk of text, keyed by the chunk's hash.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Initialize the NERCache.
+
+        Args:
+            path (Path): The path of the cache directory.
+        """
+        self.path = path
+
+    @staticmethod
+    def get_key(text: str) -> str:
+        """
+        Compute the cache key of a chunk of text.
+
+        Args:
+            text (str): The chunk of text.
+
+        Returns:
+            str: The hex digest of the text's SHA-256 hash.
+        """
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_entry_path(self, key: str) -> Path:
+        """
+        Get the path of the file a chunk's entities are kept in.
+
+        Args:
+            key (str): The cache key of the chunk.
+
+        Returns:
+            Path: The entry file, in the shard directory of the key.
+        """
+        return self.path / key[:NER_CACHE_SHARD_LENGTH] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[CachedDoc]:
+        """
+        Get the cached entities of a chunk.
+
+        Args:
+            key (str): The cache key of the chunk.
+
+        Returns:
+            Optional[CachedDoc]: The chunk's entities, or None if the chunk is
+                not in the cache.
+        """
+        try:
+            with open(self.get_entry_path(key), "r") as f:
+                cached = json.load(f)
+            if cached.get("version") != NER_CACHE_VERSION:
+                return None
+            spans = cached["entities"]
+        except (IOError, ValueError, KeyError):
+            return None
+
+        return CachedDoc([CachedEntity(*span) for span in spans])
+
+    def add(self, key: str, ner_entities: Doc) -> None:
+        """
+        Add the entities of a processed chunk to the cache.
+
+        Args:
+            key (str): The cache key of the chunk.
+            ner_entities (Doc): The spaCy Doc of the chunk.
+        """
+        entry_path = self.get_entry_path(key)
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.error(f"Error creating NER cache directory {entry_path.parent}: {e}")
+            return
+
+        spans = [
+            [entity.text, entity.label_, entity.start_char, entity.end_char]
+            for entity in ner_entities.ents
+        ]
+        save_json_atomically(
+            entry_path, {"version": NER_CACHE_VERSION, "entities": spans}
+        )
@@ -0,0 +1,179 @@
+import sys
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Set
+
+from spacy.language import Language
+
+from novel_ai_module_tools.config import *
+from novel_ai_module_tools.logger_config import get_logger
+from novel_ai_module_tools.ner import (
+    filter_candidate_paragraphs,
+    get_file_entities,
+    load_ner_model,
+    read_text_chunks,
+)
+from novel_ai_module_tools.resources_loader import (
+    NameIndex,
+    load_name_recognizer_index,
+)
+
+"""
+ner_recall.py
+
+Measures how many names the NER prefilter misses, and how much time it saves.
+
+Each file is run through the model twice: once in full and once with only
+the candidate paragraphs kept by the prefilter. The names found in full are
+taken as the truth that the prefiltered run is compared against.
+
+Usage:
+    python ner_recall.py <file_name> [<file_name> ...]
+"""
+
+logger = get_logger(__file__)
+
+
+class RecallResult(NamedTuple):
+    """
+    The result of comparing prefiltered NER with full-text NER for one file.
+
+    Attributes:
+        file_name (Path): The file that was compared.
+        full_names (Set[str]): The names found in the full text.
+        prefiltered_names (Set[str]): The names found in the candidate paragraphs.
+        full_seconds (float): The time NER took on the full text.
+        prefiltered_seconds (float): The time NER took with the prefilter.
+        characters (int): The number of characters in the file.
+        prefiltered_characters (int): The number of characters the prefilter kept.
+    """
+
+    file_name: Path
+    full_names: Set[str]
+    prefiltered_names: Set[str]
+    full_seconds: float
+    prefiltered_seconds: float
+    characters: int
+    prefiltered_characters: int
+
+    @property
+    def recall(self) -> float:
+        """
+        The share of the full-text names the prefiltered run also found.
+
+        Returns:
+            float: The recall, or 1.0 if the full text has no names.
+        """
+        if not self.full_names:
+            return 1.0
+
+        return len(self.full_names & self.prefiltered_names) / len(self.full_names)
+
+
+def compare_prefilter_recall(
+    NER: Language,
+    name_index: NameIndex,
+    file_names: List[Path],
+    batch_size: int = NER_BATCH_SIZE,
+    chunk_size: int = NER_CHUNK_SIZE,
+) -> List[RecallResult]:
+    """
+    Run NER on each file with and without the prefilter and compare the names.
+
+    The cache is not used, so both runs time the model itself.
+
+    Args:
+        NER (Language): The loaded spaCy model.
+        name_index (NameIndex): The index of the recognized names.
+        file_names (List[Path]): List of file paths to compare.
+        batch_size (int): Number of chunks spaCy processes in each batch.
+        chunk_size (int): The most characters to run the model on at once.
+
+    Returns:
+        List[RecallResult]: The comparison for each file, in order.
+    """
+    results: List[RecallResult] = []
+    for file_name in file_names:
+        characters = 0
+        prefiltered_characters = 0
+        for chunk, _ in read_text_chunks([file_name], chunk_size):
+            characters += len(chunk)
+            prefiltered_characters += len(
+                filter_candidate_paragraphs(chunk, name_index)
+            )
+
+        start = time.perf_counter()
+        (full_names,) = get_file_entities(
+            lambda: NER, [file_name], batch_size, 1, chunk_size
+        )
+        full_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        (prefiltered_names,) = get_file_entities(
+            lambda: NER,
+            [file_name],
+            batch_size,
+            1,
+            chunk_size,
+            prefilter_index=name_index,
+        )
+        prefiltered_seconds = time.perf_counter() - start
+
+        results.append(
+            RecallResult(
+                file_name,
+                full_names,
+                prefiltered_names,
+                full_seconds,
+                prefiltered_seconds,
+                characters,
+                prefiltered_characters,
+            )
+        )
+
+    return results
+
+
+def print_recall_report(results: List[RecallResult]) -> None:
+    """
+    Print the recall, text kept and time saved for each file and overall.
+
+    Args:
+        results (List[RecallResult]): The comparison for each file.
+    """
+    for result in results:
+        kept = result.prefiltered_characters / max(result.characters, 1)
+        print(
+            f"{result.file_name.name}: recall {result.recall:.1%} "
+            f"({len(result.full_names)} names), kept {kept:.1%} of text, "
+            f"{result.full_seconds:.2f}s -> {result.prefiltered_seconds:.2f}s"
+        )
+        missed = sorted(result.full_names - result.prefiltered_names)
+        if missed:
+            print(f"    Missed: {', '.join(missed)}")
+
+    full_names = sum(len(result.full_names) for result in results)
+    found_names = sum(
+        len(result.full_names & result.prefiltered_names) for result in results
+    )
+    full_seconds = sum(result.full_seconds for result in results)
+    prefiltered_seconds = sum(result.prefiltered_seconds for result in results)
+    recall = found_names / full_names if full_names else 1.0
+    speedup = full_seconds / prefiltered_seconds if prefiltered_seconds else 0.0
+    print(
+        f"Total: recall {recall:.1%} ({found_names}/{full_names} names), "
+        f"{full_seconds:.2f}s -> {prefiltered_seconds:.2f}s ({speedup:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python ner_recall.py <file_name> [<file_name> ...]")
+        sys.exit(1)
+
+    resource_directory = Path(__file__).parent / "resources"
+    name_index = load_name_recognizer_index(resource_directory / "ignore_names.txt")
+    results = compare_prefilter_recall(
+        load_ner_model(), name_index, [Path(name) for name in sys.argv[1:]]
+    )
+    print_recall_report(results)
@@ -0,0 +1,227 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+from pathlib import Path
+from typing import List
+
+from spacy.language import Language
+
+from novel_ai_module_tools.config import *
+from novel_ai_module_tools.logger_config import get_logger
+from novel_ai_module_tools.ner_cache import NERCache, get_ner_cache_path
+from novel_ai_module_tools.resources_loader import load_name_recognizer_index
+from novel_ai_module_tools.ner import (
+    NER_SERVER_CONNECT_TIMEOUT,
+    NER_SERVER_ENCODING,
+    get_file_entities,
+    is_owned_by_user,
+    load_ner_model,
+)
+
+"""
+ner_server.py
+
+Keeps the NER model loaded and runs NER for split_and_ner.py over a Unix socket.
+
+Starting Python, importing spaCy and loading the model can take longer than
+the NER itself when split_and_ner.py is run on many small projects. While this
+server is running, perform_ner sends it the files to process instead of
+loading the model itself.
+
+Only the user running the server can connect to it: its socket is made
+private, and by default is kept in a private directory of that user's.
+
+Usage:
+    python ner_server.py [socket_path]
+"""
+
+logger = get_logger(__file__)
+
+SOCKET_DIRECTORY_MODE = 0o700
+SOCKET_MODE = 0o600
+# The name of the directory split_and_ner.py keeps its output in, inside the
+# directory of the books
+NAMES_REPLACED_DIRECTORY_NAME = "names_replaced"
+
+
+def get_project_directory(file_name: Path) -> Path:
+    """
+    Get the directory of the books a file NER is run on belongs to.
+
+    Args:
+        file_name (Path): A book, or a split or sample of one.
+
+    Returns:
+        Path: The directory of the books.
+    """
+    for parent in file_name.parents:
+        if parent.name == NAMES_REPLACED_DIRECTORY_NAME:
+            return parent.parent
+
+    return file_name.parent
+
+
+def check_cache_path(cache_path: Path, file_names: List[Path], model_name: str) -> None:
+    """
+    Check that a requested cache directory is the model's NER cache in the files'
+    project.
+
+    The server writes the cache as its own user, so it must not be pointed at
+    any other directory.
+
+    Args:
+        cache_path (Path): The requested cache directory.
+        file_names (List[Path]): The files of the request.
+        model_name (str): The name the model was loaded with.
+
+    Raises:
+        ValueError: If the cache directory is not the model's NER cache, or is not
+            inside the directory of the books of every file.
+    """
+    cache_path = cache_path.resolve()
+    if cache_path != get_ner_cache_path(cache_path.parent, model_name):
+        raise ValueError(f"Not an NER cache directory: [{cache_path}]")
+    for file_name in file_names:
+        project_directory = get_project_directory(file_name.resolve())
+        if project_directory not in cache_path.parents:
+            raise ValueError(
+                f"NER cache [{cache_path}] is outside the project [{project_directory}]"
+            )
+
+
+class NERRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one request: a line of JSON in, a line of JSON out.
+    """
+
+    def handle(self) -> None:
+        """
+        Run NER on the files named in the request and reply with their names.
+        """
+        try:
+            request = json.loads(self.rfile.readline().decode(NER_SERVER_ENCODING))
+            if request["model"] != self.server.model_name:
+                reply = {
+                    "error": f"Server has model [{self.server.model_name}] "
+                    f"loaded, not [{request['model']}]"
+                }
+            else:
+                file_names = [Path(file_name) for file_name in request["files"]]
+                logger.info(f"Running NER on {len(file_names)} files")
+                cache_path = request.get("cache_path")
+                if cache_path:
+                    check_cache_path(
+                        Path(cache_path), file_names, self.server.model_name
+                    )
+                prefilter_names_path = request.get("prefilter_names_path")
+                file_entities = get_file_entities(
+                    lambda: self.server.ner,
+                    file_names,
+                    request["batch_size"],
+                    request["n_process"],
+                    request["chunk_size"],
+                    NERCache(Path(cache_path)) if cache_path else None,
+                    (
+                        load_name_recognizer_index(Path(prefilter_names_path))
+                        if prefilter_names_path
+                        else None
+                    ),
+                )
+                reply = {"entities": [sorted(entities) for entities in file_entities]}
+        except Exception as e:
+            logger.error(f"Error handling NER request: {e}")
+            reply = {"error": str(e)}
+
+        self.wfile.write((json.dumps(reply) + "\n").encode(NER_SERVER_ENCODING))
+
+
+class NERServer(socketserver.UnixStreamServer):
+    """
+    A Unix socket server that keeps a loaded spaCy model between requests.
+
+    Requests are handled one at a time, so the model is never used by two
+    requests at once.
+    """
+
+    def __init__(self, socket_path: str, ner: Language, model_name: str):
+        """
+        Initialize the NERServer and start listening on the socket.
+
+        Args:
+            socket_path (str): The path of the Unix socket to listen on.
+            ner (Language): The loaded spaCy model.
+            model_name (str): The name the model was loaded with.
+        """
+        self.ner = ner
+        self.model_name = model_name
+        super().__init__(socket_path, NERRequestHandler)
+
+    def server_bind(self) -> None:
+        """
+        Bind the socket, and let only the user running the server connect to it.
+        """
+        super().server_bind()
+        os.chmod(self.server_address, SOCKET_MODE)
+
+
+def is_server_running(socket_path: str) -> bool:
+    """
+    Check whether a server is already listening on a socket.
+
+    Args:
+        socket_path (str): The path of the Unix socket.
+
+    Returns:
+        bool: True if a connection to the socket succeeds.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(NER_SERVER_CONNECT_TIMEOUT)
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return False
+
+    return True
+
+
+def serve(socket_path: str = NER_SOCKET_PATH) -> None:
+    """
+    Load the NER model and serve requests until interrupted.
+
+    The socket's directory is created private if it does not exist. A directory
+    that belongs to another user is not used, since they could replace the
+    socket.
+
+    Args:
+        socket_path (str): The path of the Unix socket to listen on.
+    """
+    socket_directory = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(socket_directory, mode=SOCKET_DIRECTORY_MODE, exist_ok=True)
+    if not is_owned_by_user(socket_directory):
+        logger.error(
+            f"The socket directory [{socket_directory}] belongs to another user"
+        )
+        sys.exit(1)
+
+    if os.path.exists(socket_path):
+        if is_server_running(socket_path):
+            logger.error(f"An NER server is already running on [{socket_path}]")
+            sys.exit(1)
+        # Left behind by a server that did not shut down cleanly
+        os.remove(socket_path)
+
+    NER = load_ner_model()
+    with NERServer(socket_path, NER, NER_MODEL) as server:
+        logger.info(f"NER server listening on [{socket_path}]")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopping NER server")
+        finally:
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else NER_SOCKET_PATH)
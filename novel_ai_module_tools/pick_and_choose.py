@@ -9,6 +9,11 @@ from matplotlib import pyplot
 
 from novel_ai_module_tools.config import *
 from novel_ai_module_tools.logger_config import get_logger
+from novel_ai_module_tools.section_index import (
+    SECTION_INDEX_ENCODING,
+    get_section_index,
+    get_sections,
+)
 
 # Check if running in a headless environment (like GitHub Actions)
 if os.environ.get("GITHUB_ACTIONS") or not os.environ.get("DISPLAY"):
@@ -33,7 +38,6 @@ from PyQt5.QtWidgets import (
     QWidget,
 )
 
-
 logger = get_logger(__file__)
 
 WINDOW_TITLE = "Pick and Choose"
@@ -81,7 +85,8 @@ def get_file(filename: str) -> str:
         IOError: If there's an error reading the file.
     """
     try:
-        with open(filename, "r", encoding="utf-8") as f:
+        # Decoded the way the section index counts its character offsets
+        with open(filename, "r", encoding=SECTION_INDEX_ENCODING) as f:
             return f.read()
     except FileNotFoundError:
         logger.error(f"File not found: {filename}")
@@ -433,7 +438,9 @@ if __name__ == "__main__":
         input_filename: str = argv[1]
         output_filename: str = argv[2]
         file_text: str = get_file(input_filename)
-        sections: List[str] = file_text.split(SECTION_SEPARATOR)
+        # Cut the sections at the offsets in the book's section index instead
+        # of searching the text for separators again
+        sections: List[str] = get_sections(file_text, get_section_index(input_filename))
 
         current_full_text: str = file_text
 
@@ -1,12 +1,70 @@
 from collections import OrderedDict
+import json
+import os
 from pathlib import Path
 import random
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
 
+from novel_ai_module_tools.file_utils import save_json_atomically
 from novel_ai_module_tools.logger_config import get_logger
 
-
 logger = get_logger(__file__)
 
+NAME_INDEX_FILE_NAME = ".name_index.json"
+NAME_INDEX_VERSION = 1
+
+
+class NameIndex(NamedTuple):
+    """
+    A hash index of the recognized names and the names to ignore.
+
+    Attributes:
+        name_types (Dict[str, List[str]]): The name types each name belongs to,
+            in the order of the name files.
+        ignore_names (FrozenSet[str]): The names on the ignore list. Names are
+            lower cased before they are looked up.
+    """
+
+    name_types: Dict[str, List[str]]
+    ignore_names: FrozenSet[str]
+
+    def get_types(self, name: str) -> List[str]:
+        """
+        Get every name type a name belongs to.
+
+        Args:
+            name (str): The name to look up.
+
+        Returns:
+            List[str]: The name types, or an empty list for an unknown name.
+        """
+        return self.name_types.get(name, [])
+
+    def get_type(self, name: str) -> str:
+        """
+        Get the first name type a name belongs to.
+
+        Args:
+            name (str): The name to look up.
+
+        Returns:
+            str: The name type, or an empty string for an unknown name.
+        """
+        name_types = self.name_types.get(name)
+        return name_types[0] if name_types else ""
+
+    def is_ignored(self, name: str) -> bool:
+        """
+        Check whether a name is on the ignore list.
+
+        Args:
+            name (str): The name to check, in any case.
+
+        Returns:
+            bool: True if the name should be ignored.
+        """
+        return name.lower() in self.ignore_names
+
 
 def load_names(path):
     """
@@ -63,3 +121,139 @@ def load_name_recognizers():
     recognizers_directory = names_directory / "recognize"
 
     return load_names(recognizers_directory)
+
+
+def load_ignore_names(path: Path) -> List[str]:
+    """
+    Load the names to ignore during NER.
+
+    Args:
+        path (Path): The path of the ignore list.
+
+    Returns:
+        List[str]: The names to ignore, or an empty list if there is no list.
+    """
+    try:
+        logger.info(f"Loading ignore names from: [{path}]")
+        return path.read_text().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def compile_name_index(
+    names: Dict[str, List[str]], ignore_names: List[str]
+) -> NameIndex:
+    """
+    Build a name index from name lists.
+
+    Args:
+        names (Dict[str, List[str]]): The names of each name type.
+        ignore_names (List[str]): The names to ignore.
+
+    Returns:
+        NameIndex: The index of the names.
+    """
+    name_types: Dict[str, List[str]] = {}
+    for name_type, name_list in names.items():
+        for name in name_list:
+            types = name_types.setdefault(name, [])
+            if not types or types[-1] != name_type:
+                types.append(name_type)
+
+    return NameIndex(name_types, frozenset(ignore_names))
+
+
+def get_name_sources(
+    path: Path, ignore_names_path: Optional[Path] = None
+) -> Dict[str, Optional[List[int]]]:
+    """
+    Describe the files a name index is built from.
+
+    Args:
+        path (Path): The directory containing name files.
+        ignore_names_path (Optional[Path]): The path of the ignore list, if
+            the index depends on it.
+
+    Returns:
+        Dict[str, Optional[List[int]]]: The size and modification time of each
+            file, keyed by path, or None for a missing ignore list.
+    """
+    source_paths = [f for f in path.iterdir() if f.is_file()]
+    source_paths = [f for f in source_paths if not f.name.startswith(".")]
+    if ignore_names_path is not None:
+        source_paths.append(ignore_names_path)
+
+    sources: Dict[str, Optional[List[int]]] = {}
+    for source_path in source_paths:
+        try:
+            source_stat = os.stat(source_path)
+            sources[str(source_path)] = [source_stat.st_size, source_stat.st_mtime_ns]
+        except FileNotFoundError:
+            sources[str(source_path)] = None
+
+    return sources
+
+
+def load_name_index(path: Path, ignore_names_path: Path) -> NameIndex:
+    """
+    Load the name index for a directory of name files.
+
+    The index is cached in a hidden file in the directory and only rebuilt when
+    the size or modification time of a name file or the ignore list changes,
+    or a name file is added or removed.
+
+    Args:
+        path (Path): The directory containing name files.
+        ignore_names_path (Path): The path of the ignore list.
+
+    Returns:
+        NameIndex: The index of the names.
+    """
+    index_path = path / NAME_INDEX_FILE_NAME
+    sources = get_name_sources(path, ignore_names_path)
+
+    try:
+        with open(index_path, "r") as f:
+            cached = json.load(f)
+        if (
+            cached.get("version") == NAME_INDEX_VERSION
+            and cached.get("sources") == sources
+        ):
+            logger.info(f"Loaded name index from: [{index_path}]")
+            return NameIndex(cached["name_types"], frozenset(cached["ignore_names"]))
+    except (IOError, ValueError):
+        pass
+
+    logger.info(f"Building name index for path: [{path}]")
+    name_index = compile_name_index(
+        load_names(path), load_ignore_names(ignore_names_path)
+    )
+
+    save_json_atomically(
+        index_path,
+        {
+            "version": NAME_INDEX_VERSION,
+            "sources": sources,
+            "name_types": name_index.name_types,
+            "ignore_names": sorted(name_index.ignore_names),
+        },
+    )
+
+    return name_index
+
+
+def load_name_recognizer_index(ignore_names_path: Path) -> NameIndex:
+    """
+    Load the name index of the 'recognize' directory.
+
+    Args:
+        ignore_names_path (Path): The path of the ignore list.
+
+    Returns:
+        NameIndex: The index of the name recognizers.
+    """
+    resource_directory = Path(__file__).parent / "resources"
+    names_directory = resource_directory / "names"
+    recognizers_directory = names_directory / "recognize"
+
+    return load_name_index(recognizers_directory, ignore_names_path)
@@ -0,0 +1,285 @@
+from collections import Counter
+from difflib import SequenceMatcher
+from heapq import merge
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+"""
+similarity_index.py
+
+Finds names that are too similar to a candidate name without comparing the
+candidate with every name.
+
+The similarity of two names is difflib.SequenceMatcher's ratio, 2 * M / T,
+where M is the number of matching characters and T the total length of both
+names. M can be no more than the length of the shorter name, nor than the
+number of characters the names have in common. Names whose length or
+characters put the ratio at or below the threshold are skipped, and only the
+rest are compared with SequenceMatcher, so the names found are the same as
+comparing every pair.
+
+find_similar_batch searches for many candidates at once. The characters each
+pair has in common are counted for all pairs in a few NumPy operations, on
+fixed-width vectors of each name's character counts.
+"""
+
+# Characters are counted in this many columns. Characters with the same code
+# modulo the width share a column, which can only raise the count of common
+# characters, so the bound stays an upper bound.
+NAME_VECTOR_WIDTH = 128
+# The most character counts compared at once by find_similar_batch
+SIMILARITY_BATCH_SIZE = 1 << 22
+
+
+def get_ratio(matches: int, length: int) -> float:
+    """
+    Compute a similarity ratio the way SequenceMatcher does.
+
+    Args:
+        matches (int): The number of matching characters.
+        length (int): The total length of both names.
+
+    Returns:
+        float: 2 * matches / length, or 1.0 if both names are empty.
+    """
+    if length:
+        return 2.0 * matches / length
+
+    return 1.0
+
+
+def get_name_vectors(
+    names: List[str], columns: Optional[Dict[str, int]] = None
+) -> np.ndarray:
+    """
+    Count the characters of each name.
+
+    Args:
+        names (List[str]): The names to count.
+        columns (Optional[Dict[str, int]]): The column to count each character
+            in, which must have a column for every character of the names. By
+            default characters are counted in NAME_VECTOR_WIDTH columns.
+
+    Returns:
+        np.ndarray: One row of character counts per name.
+    """
+    if columns is None:
+        vectors = np.zeros((len(names), NAME_VECTOR_WIDTH), dtype=np.int32)
+        for row, name in enumerate(names):
+            for character in name:
+                vectors[row, ord(character) % NAME_VECTOR_WIDTH] += 1
+        return vectors
+
+    vectors = np.zeros((len(names), max(len(columns), 1)), dtype=np.int32)
+    for row, name in enumerate(names):
+        for character in name:
+            vectors[row, columns[character]] += 1
+
+    return vectors
+
+
+class ConflictGraph:
+    """
+    The names each name is too similar to, with their similarity.
+    """
+
+    def __init__(self, threshold: float, conflicts: Dict[str, Dict[str, float]]):
+        """
+        Initialize the ConflictGraph.
+
+        Args:
+            threshold (float): The similarity the pairs in the graph are above.
+            conflicts (Dict[str, Dict[str, float]]): For every name in the
+                graph, the names whose SequenceMatcher ratio with it, as the
+                first sequence, is above the threshold.
+        """
+        self.threshold = threshold
+        self.conflicts = conflicts
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.conflicts
+
+
+class SimilarityIndex:
+    """
+    A set of names, bucketed by length, that can be searched for similar names.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str] = (),
+        conflict_graph: Optional[ConflictGraph] = None,
+    ):
+        """
+        Initialize the SimilarityIndex.
+
+        Args:
+            names (Iterable[str]): The names to add, in order.
+            conflict_graph (Optional[ConflictGraph]): The similar pairs of the
+                names that are usually searched for. Names in the graph are
+                then found by looking up their pairs instead of comparing them.
+        """
+        self.names: Set[str] = set()
+        self.names_by_length: Dict[int, List[Tuple[int, str, Counter]]] = {}
+        self.ordered_names: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.conflict_graph = conflict_graph
+        # The names that are not in the conflict graph
+        self.outside_names = SimilarityIndex() if conflict_graph is not None else None
+        # Built by find_similar_batch when first needed after a name is added
+        self.vectors: Optional[np.ndarray] = None
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.names
+
+    def add(self, name: str) -> None:
+        """
+        Add a name to the index. Adding a name twice has no effect.
+
+        Args:
+            name (str): The name to add.
+        """
+        if name in self.names:
+            return
+
+        self.names_by_length.setdefault(len(name), []).append(
+            (len(self.names), name, Counter(name))
+        )
+        self.names.add(name)
+        self.positions[name] = len(self.ordered_names)
+        self.ordered_names.append(name)
+        self.vectors = None
+        if self.outside_names is not None and name not in self.conflict_graph:
+            self.outside_names.add(name)
+
+    def get_possible_names(
+        self, candidate: str, threshold: float
+    ) -> Iterator[Tuple[int, str, Counter]]:
+        """
+        Get the names long or short enough to be more similar than the threshold.
+
+        Args:
+            candidate (str): The name to compare with.
+            threshold (float): The similarity a name must be above.
+
+        Returns:
+            Iterator[Tuple[int, str, Counter]]: The order each name was added
+                in, the name, and its character counts, in the order added.
+        """
+        candidate_length = len(candidate)
+        return merge(
+            *(
+                names
+                for length, names in self.names_by_length.items()
+                if get_ratio(min(length, candidate_length), length + candidate_length)
+                > threshold
+            )
+        )
+
+    def find_similar(
+        self, candidate: str, threshold: float
+    ) -> Optional[Tuple[str, float]]:
+        """
+        Find the first name added whose similarity to a candidate is above a threshold.
+
+        If the candidate is in the conflict graph, and the graph has every pair
+        above the threshold, the names in the graph are found by intersecting
+        the candidate's pairs with the index. Only the names outside the graph
+        are compared.
+
+        Args:
+            candidate (str): The name to compare with.
+            threshold (float): The similarity a name must be above.
+
+        Returns:
+            Optional[Tuple[str, float]]: The name and its similarity, or None if
+                no name is that similar.
+        """
+        graph = self.conflict_graph
+        if graph is not None and candidate in graph and threshold >= graph.threshold:
+            conflicts = graph.conflicts[candidate]
+            found = [
+                (self.positions[name], name, conflicts[name])
+                for name in conflicts.keys() & self.names
+                if conflicts[name] > threshold
+            ]
+            outside = self.outside_names.find_similar(candidate, threshold)
+            if outside is not None:
+                found.append((self.positions[outside[0]], *outside))
+            if not found:
+                return None
+
+            _, name, similarity = min(found)
+            return name, similarity
+
+        candidate_counts = Counter(candidate)
+        for _, name, counts in self.get_possible_names(candidate, threshold):
+            common = sum((candidate_counts & counts).values())
+            if get_ratio(common, len(candidate) + len(name)) <= threshold:
+                continue
+
+            similarity = SequenceMatcher(None, candidate, name).ratio()
+            if similarity > threshold:
+                return name, similarity
+
+        return None
+
+    def find_similar_batch(
+        self, candidates: List[str], threshold: float
+    ) -> List[Optional[Tuple[str, float]]]:
+        """
+        Find the first similar name for each of many candidates (see find_similar).
+
+        The bound on the similarity of every candidate and name is computed
+        with NumPy, a batch of candidates at a time. Only the pairs the bound
+        allows are compared with SequenceMatcher.
+
+        Args:
+            candidates (List[str]): The names to compare with.
+            threshold (float): The similarity a name must be above.
+
+        Returns:
+            List[Optional[Tuple[str, float]]]: The first similar name and its
+                similarity for each candidate, in order, or None for candidates
+                with no similar name.
+        """
+        results: List[Optional[Tuple[str, float]]] = [None] * len(candidates)
+        if not candidates or not self.ordered_names:
+            return results
+
+        if self.vectors is None:
+            self.vectors = get_name_vectors(self.ordered_names)
+        name_lengths = self.vectors.sum(axis=1)
+        batch_size = max(
+            1, SIMILARITY_BATCH_SIZE // (len(self.ordered_names) * NAME_VECTOR_WIDTH)
+        )
+
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start : start + batch_size]
+            candidate_vectors = get_name_vectors(batch)
+            common = np.minimum(
+                candidate_vectors[:, np.newaxis, :], self.vectors[np.newaxis, :, :]
+            ).sum(axis=2)
+            lengths = candidate_vectors.sum(axis=1)[:, np.newaxis] + name_lengths
+            bounds = np.divide(
+                2.0 * common,
+                lengths,
+                out=np.ones(common.shape),
+                where=lengths > 0,
+            )
+
+            for row, candidate in enumerate(batch):
+                for column in np.flatnonzero(bounds[row] > threshold):
+                    name = self.ordered_names[column]
+                    similarity = SequenceMatcher(None, candidate, name).ratio()
+                    if similarity > threshold:
+                        results[start + row] = (name, similarity)
+                        break
+
+        return results
@@ -1,16 +1,78 @@
+import queue
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Iterator, List, NamedTuple, Optional, Set, Tuple, TypeVar
 
 from numpy import random
 
 from novel_ai_module_tools.config import *
-from novel_ai_module_tools.ner import perform_ner
-from novel_ai_module_tools.split_file import split_file
+from novel_ai_module_tools.ner import get_likely_names, perform_ner
+from novel_ai_module_tools.resources_loader import (
+    NameIndex,
+    load_name_recognizer_index,
+)
+from novel_ai_module_tools.section_index import (
+    SECTION_INDEX_ENCODING,
+    get_section_index,
+    get_sections,
+)
+from novel_ai_module_tools.split_file import (
+    ERROR,
+    split_file,
+    split_file_into_parts,
+    split_file_mapped,
+)
 from novel_ai_module_tools.logger_config import get_logger
 
 logger = get_logger(__file__)
 
+# The most prepared files that may wait for NER
+NER_SOURCE_QUEUE_SIZE = 8
+# How often a thread waiting on the full queue checks whether it should stop
+NER_SOURCE_QUEUE_POLL_SECONDS = 0.1
+
+T = TypeVar("T")
+
+
+class SampleCoverage(NamedTuple):
+    """
+    How many of a book's likely names are in the text NER was run on.
+
+    Attributes:
+        file_name (str): The book the sample was taken from.
+        likely_names (Set[str]): The likely names in the whole book.
+        sampled_names (Set[str]): The likely names in the sampled text.
+    """
+
+    file_name: str
+    likely_names: Set[str]
+    sampled_names: Set[str]
+
+    @property
+    def missed_names(self) -> Set[str]:
+        """
+        The likely names that only appear outside the sampled text.
+
+        Returns:
+            Set[str]: The names NER could not have found.
+        """
+        return self.likely_names - self.sampled_names
+
+    @property
+    def coverage(self) -> float:
+        """
+        The share of the book's likely names that are in the sampled text.
+
+        Returns:
+            float: The coverage, or 1.0 if the book has no likely names.
+        """
+        if not self.likely_names:
+            return 1.0
+
+        return 1 - len(self.missed_names) / len(self.likely_names)
+
 
 def create_directories(working_directory: Path) -> Tuple[Path, Path, Path]:
     """
@@ -33,50 +95,437 @@ def create_directories(working_directory: Path) -> Tuple[Path, Path, Path]:
     return names_replaced_directory, splits_directory, ner_directory
 
 
+def remove_split_files(file_name: str, splits_directory: Path) -> None:
+    """
+    Remove the split files of a file left by an earlier run.
+
+    An earlier run may have split the file into more parts, or not at all, so
+    its files would otherwise be stitched together with the new ones. Only
+    this file's split names are removed, without listing the directory. Every
+    run writes parts 1, 2, 3, ... with no gaps, so the parts after the halves
+    are removed until one is missing.
+
+    Args:
+        file_name (str): Name of the file that is about to be split.
+        splits_directory (Path): Directory the split files are saved in.
+    """
+    for prefix in ("nosplits_", get_split_part_prefix(1), get_split_part_prefix(2)):
+        (splits_directory / f"{prefix}{file_name}").unlink(missing_ok=True)
+
+    part = 3
+    while True:
+        part_file_path = splits_directory / f"{get_split_part_prefix(part)}{file_name}"
+        if not part_file_path.exists():
+            break
+        part_file_path.unlink()
+        part += 1
+
+
 def process_single_file(
-    file_name: str, working_directory: Path, splits_directory: Path
+    file_name: str,
+    working_directory: Path,
+    splits_directory: Path,
+    use_mmap: bool = False,
 ) -> Path:
     """
     Process a single file by splitting it and saving the results.
 
+    Files are split in two, unless the "parts" splits setting is more than 2. In
+    that case they are split into that many parts of similar word counts, saved
+    with the prefixes of get_split_part_prefix. Split files left by an earlier
+    run are removed first.
+
     Args:
         file_name (str): Name of the file to process.
         working_directory (Path): Directory containing the files to process.
         splits_directory (Path): Directory to save split files.
+        use_mmap (bool): Whether to split the file with split_file_mapped, which
+            writes the halves straight from the memory-mapped file. Only used when
+            splitting in two.
 
     Returns:
         Path: Path to the processed file (either full file or randomly chosen split).
+
+    Raises:
+        RuntimeError: If the file could not be split.
     """
     logger.info(f"Processing file: [{file_name}]")
     full_filename = working_directory / file_name
+    nosplits_file_path = splits_directory / f"nosplits_{file_name}"
+    first_half_file_path = splits_directory / f"{SPLITS_FIRST_HALF_PREFIX}{file_name}"
+    second_half_file_path = splits_directory / f"{SPLITS_SECOND_HALF_PREFIX}{file_name}"
+    remove_split_files(file_name, splits_directory)
+
+    if SPLITS_PARTS > 2:
+        logger.info(f"Splitting file into {SPLITS_PARTS} parts: [{full_filename}]")
+        splits = split_file_into_parts(str(full_filename), SPLITS_PARTS)
+        if splits.error is not None:
+            raise RuntimeError(
+                f"Error splitting file [{full_filename}]: {splits.error}"
+            )
+        if splits.no_stars:
+            logger.info(f"No stars found in file: [{full_filename}]; not splitting.")
+            nosplits_file_path.write_text(splits.full_text)
+            return nosplits_file_path
+
+        part_file_paths = [
+            splits_directory / f"{get_split_part_prefix(part)}{file_name}"
+            for part in range(1, len(splits.part_ranges) + 1)
+        ]
+        for index, part_file_path in enumerate(part_file_paths):
+            splits.write_part(index, part_file_path)
+
+        return random.choice(part_file_paths)
+
+    if use_mmap:
+        logger.info(f"Splitting file: [{full_filename}]")
+        splits = split_file_mapped(
+            str(full_filename),
+            str(first_half_file_path),
+            str(second_half_file_path),
+            str(nosplits_file_path),
+        )
+        if ERROR in splits:
+            raise RuntimeError(
+                f"Error splitting file [{full_filename}]: {splits[ERROR]}"
+            )
+        if splits["no_stars"]:
+            logger.info(f"No stars found in file: [{full_filename}]; not splitting.")
+            return nosplits_file_path
+
+        return random.choice([first_half_file_path, second_half_file_path])
+
     splits = split_file(str(full_filename))
     logger.info(f"Splitting file: [{full_filename}]")
 
-    if splits["no_stars"]:
+    if splits.error is not None:
+        raise RuntimeError(f"Error splitting file [{full_filename}]: {splits.error}")
+    if splits.no_stars:
         logger.info(f"No stars found in file: [{full_filename}]; not splitting.")
-        file_path = splits_directory / f"nosplits_{file_name}"
-        file_path.write_text(splits["full_text"])
-        return file_path
+        nosplits_file_path.write_text(splits.full_text)
+        return nosplits_file_path
     else:
-        first_half_file_path = (
-            splits_directory / f"{SPLITS_FIRST_HALF_PREFIX}{file_name}"
+        # Write the halves from their offsets instead of building copies of them
+        splits.write_first_half(first_half_file_path)
+        splits.write_second_half(second_half_file_path)
+
+        return random.choice([first_half_file_path, second_half_file_path])
+
+
+def write_section_sample(
+    file_name: str,
+    working_directory: Path,
+    samples_directory: Path,
+    fraction: float,
+) -> Path:
+    """
+    Write a sample of a file's "***" sections, spread evenly across the file.
+
+    The sections are divided into as many runs of neighbouring sections as are
+    to be sampled, and one section is chosen at random from each run, so every
+    part of the book is represented.
+
+    Args:
+        file_name (str): Name of the file to sample.
+        working_directory (Path): Directory containing the file.
+        samples_directory (Path): Directory to save the sample to.
+        fraction (float): The share of the sections to sample.
+
+    Returns:
+        Path: Path to the sample, which has the same name as the file.
+    """
+    full_filename = working_directory / file_name
+    sections = get_sections(
+        full_filename.read_text(encoding=SECTION_INDEX_ENCODING),
+        get_section_index(str(full_filename)),
+    )
+    number_of_sections = len(sections)
+    number_sampled = min(
+        number_of_sections, max(1, round(fraction * number_of_sections))
+    )
+    sampled_sections = [
+        sections[
+            random.randint(
+                stratum * number_of_sections // number_sampled,
+                (stratum + 1) * number_of_sections // number_sampled,
+            )
+        ]
+        for stratum in range(number_sampled)
+    ]
+    logger.info(
+        f"Sampled {number_sampled} of {number_of_sections} sections: [{full_filename}]"
+    )
+
+    sample_file_path = samples_directory / file_name
+    sample_file_path.write_text("***".join(sampled_sections))
+    return sample_file_path
+
+
+def estimate_sample_coverage(
+    full_file_path: Path, sample_file_path: Path, name_index: NameIndex
+) -> SampleCoverage:
+    """
+    Estimate how many of a book's names NER can find in the sampled text.
+
+    Runs no model: the likely names (see get_likely_names) of the whole book
+    are compared with those of the sample.
+
+    Args:
+        full_file_path (Path): Path to the whole book.
+        sample_file_path (Path): Path to the text NER is run on.
+        name_index (NameIndex): The index of the recognized names.
+
+    Returns:
+        SampleCoverage: The likely names of the book and of the sample.
+    """
+    likely_names = set(get_likely_names(full_file_path.read_text(), name_index))
+    sampled_names = set(get_likely_names(sample_file_path.read_text(), name_index))
+    return SampleCoverage(full_file_path.name, likely_names, sampled_names)
+
+
+def log_sample_coverage(coverages: List[SampleCoverage]) -> None:
+    """
+    Log the likely names that fell outside the NER sample of each book and overall.
+
+    Args:
+        coverages (List[SampleCoverage]): The coverage of each book's sample.
+    """
+    for coverage in coverages:
+        logger.info(
+            f"{len(coverage.missed_names)} of {len(coverage.likely_names)} likely "
+            f"names are outside the NER sample ({coverage.coverage:.1%} coverage): "
+            f"[{coverage.file_name}]"
+        )
+        logger.debug(
+            f"Likely names outside the sample: {sorted(coverage.missed_names)}"
         )
-        second_half_file_path = (
-            splits_directory / f"{SPLITS_SECOND_HALF_PREFIX}{file_name}"
+
+    likely_names = sum(len(coverage.likely_names) for coverage in coverages)
+    missed_names = sum(len(coverage.missed_names) for coverage in coverages)
+    if likely_names:
+        logger.info(
+            f"{missed_names} of {likely_names} likely names are outside the NER "
+            f"samples ({1 - missed_names / likely_names:.1%} coverage)"
         )
 
-        first_half_file_path.write_text(splits["first_half"])
-        second_half_file_path.write_text(splits["second_half"])
 
-        return random.choice([first_half_file_path, second_half_file_path])
+def prepare_ner_source_file(
+    file_name: str,
+    working_directory: Path,
+    splits_directory: Path,
+    samples_directory: Path,
+    use_mmap: bool,
+    sampling: str,
+    sample_fraction: float,
+    name_index: Optional[NameIndex],
+) -> Tuple[Path, Optional[SampleCoverage]]:
+    """
+    Split a file and choose the text NER is run on with the sampling policy.
 
+    Args:
+        file_name (str): Name of the file to process.
+        working_directory (Path): Directory containing the files to process.
+        splits_directory (Path): Directory to save split files.
+        samples_directory (Path): Directory to save section samples.
+        use_mmap (bool): Whether to split the file by memory-mapping it.
+        sampling (str): The sampling policy (see process_files).
+        sample_fraction (float): The share of the sections to sample with
+            NER_SAMPLING_SECTIONS.
+        name_index (Optional[NameIndex]): The index of the recognized names, to
+            estimate the sample's coverage with. Not needed with NER_SAMPLING_ALL.
 
-def process_files(working_directory: str) -> None:
+    Returns:
+        Tuple[Path, Optional[SampleCoverage]]: Path to the text to run NER on,
+            and its coverage, or None if the whole file is used.
+    """
+    split_file_path = process_single_file(
+        file_name, working_directory, splits_directory, use_mmap
+    )
+    if sampling == NER_SAMPLING_ALL:
+        return working_directory / file_name, None
+
+    if sampling == NER_SAMPLING_SECTIONS:
+        sample_file_path = write_section_sample(
+            file_name, working_directory, samples_directory, sample_fraction
+        )
+    else:
+        sample_file_path = split_file_path
+
+    return sample_file_path, estimate_sample_coverage(
+        working_directory / file_name, sample_file_path, name_index
+    )
+
+
+class PreparedFileStream(Iterator[T]):
+    """
+    The results of files being prepared on a thread pool, in the order they
+    are finished (see stream_ner_source_files).
+
+    The stream must be closed, or used as a context manager, so that the
+    threads stop if the results are not all taken. Files that fail to be
+    prepared are logged and skipped, and their errors kept in errors.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[[str], T],
+        file_names: List[str],
+        workers: int,
+        queue_size: int,
+    ):
+        """
+        Initialize the PreparedFileStream and start preparing the files.
+
+        Args:
+            prepare (Callable[[str], T]): Prepares one file, given its name.
+            file_names (List[str]): The names of the files to prepare.
+            workers (int): The number of threads to prepare files on.
+            queue_size (int): The most results that may wait to be taken.
+        """
+        self.prepare = prepare
+        self.results: "queue.Queue[object]" = queue.Queue(maxsize=queue_size)
+        self.errors: List[BaseException] = []
+        self.end = object()
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(workers, 1), thread_name_prefix="ner_source"
+        )
+        futures = [
+            self.executor.submit(self.prepare_and_queue, file_name)
+            for file_name in file_names
+        ]
+        threading.Thread(target=self.produce, args=(futures,), daemon=True).start()
+
+    def put(self, result: object) -> None:
+        """
+        Queue a result, waiting while the queue is full, unless the stream is closed.
+
+        Args:
+            result (object): The result to queue.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.results.put(result, timeout=NER_SOURCE_QUEUE_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def prepare_and_queue(self, file_name: str) -> None:
+        """
+        Prepare a file and queue its result, unless the stream is closed.
+
+        Args:
+            file_name (str): The name of the file to prepare.
+        """
+        if self.stopped.is_set():
+            return
+
+        try:
+            result = self.prepare(file_name)
+        except Exception as e:
+            logger.error(f"Error preparing file [{file_name}] for NER: {e}")
+            self.errors.append(e)
+            return
+
+        self.put(result)
+
+    def produce(self, futures: List[Future]) -> None:
+        """
+        Wait for every file to be prepared, or cancelled by close, and queue the end.
+
+        Args:
+            futures (List[Future]): The files being prepared.
+        """
+        wait(futures)
+        self.put(self.end)
+
+    def __next__(self) -> T:
+        if self.stopped.is_set():
+            raise StopIteration
+
+        result = self.results.get()
+        if result is self.end:
+            self.close()
+            raise StopIteration
+
+        return result
+
+    def close(self) -> None:
+        """
+        Stop preparing files, and wait for the files being prepared to finish.
+        """
+        self.stopped.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "PreparedFileStream[T]":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def stream_ner_source_files(
+    prepare: Callable[[str], T],
+    file_names: List[str],
+    workers: int = SPLITS_WORKERS,
+    queue_size: int = NER_SOURCE_QUEUE_SIZE,
+) -> PreparedFileStream[T]:
+    """
+    Prepare files on a thread pool, and yield each result as soon as it is ready.
+
+    The files start being prepared as soon as this is called, so they are read
+    and split while the caller loads the NER model and runs it on the files
+    already yielded. Results wait in a queue of at most queue_size; while it is
+    full the threads wait too, so preparing never gets far ahead of NER.
+
+    Closing the stream, or leaving it as a context manager, stops the threads,
+    so a failure while the results are taken does not leave them waiting on
+    the full queue. A file that fails to be prepared does not stop the others;
+    its error is kept in the stream's errors for the caller to raise once the
+    other files are done.
+
+    Args:
+        prepare (Callable[[str], T]): Prepares one file, given its name.
+        file_names (List[str]): The names of the files to prepare.
+        workers (int): The number of threads to prepare files on.
+        queue_size (int): The most results that may wait to be taken.
+
+    Returns:
+        PreparedFileStream[T]: The result of each file that was prepared, in
+            the order they are finished.
+    """
+    return PreparedFileStream(prepare, file_names, workers, queue_size)
+
+
+def process_files(
+    working_directory: str,
+    use_mmap: bool = False,
+    gazetteer_only: bool = False,
+    sampling: str = NER_SAMPLING,
+    sample_fraction: float = NER_SAMPLE_FRACTION,
+) -> None:
     """
     Process all .txt files in the working directory by splitting them and performing NER.
 
+    Which text of each file NER is run on depends on the sampling policy:
+    NER_SAMPLING_PART runs it on one randomly chosen split, NER_SAMPLING_ALL on
+    the whole file, and NER_SAMPLING_SECTIONS on a sample of the file's sections
+    (see write_section_sample). Unless the whole file is used, the likely names
+    outside the sample are counted and logged.
+
+    The files are split on a thread pool while NER runs on the files already
+    split (see stream_ner_source_files).
+    A file that cannot be split is skipped, and its error raised once the NER
+    output of the other files is written.
+
     Args:
         working_directory (str): Path to the working directory containing files to process.
+        use_mmap (bool): Whether to split files by memory-mapping them.
+        gazetteer_only (bool): Whether to find names from the name lists instead
+            of running the NER model.
+        sampling (str): The sampling policy.
+        sample_fraction (float): The share of the sections to sample with
+            NER_SAMPLING_SECTIONS.
     """
     working_directory = Path(working_directory)
     resource_dir = Path(__file__).parent / "resources"
@@ -97,21 +546,52 @@ def process_files(working_directory: str) -> None:
     logger.info(
         f"Splitting and performing NER on .txt files in directory: [{working_directory}]"
     )
-    ner_source_files: List[Path] = [
-        process_single_file(file_name, working_directory, splits_directory)
-        for file_name in txt_filenames
-    ]
-
-    perform_ner(
-        file_names=ner_source_files,
-        ner_directory=ner_directory,
-        resource_directory=resource_dir,
-        strip_prefixes=[
-            "nosplits_",
-            SPLITS_FIRST_HALF_PREFIX,
-            SPLITS_SECOND_HALF_PREFIX,
-        ],
+    samples_directory = names_replaced_directory / "samples"
+    if sampling == NER_SAMPLING_SECTIONS:
+        samples_directory.mkdir(exist_ok=True)
+    name_index = (
+        None
+        if sampling == NER_SAMPLING_ALL
+        else load_name_recognizer_index(resource_dir / "ignore_names.txt")
     )
+    with stream_ner_source_files(
+        lambda file_name: prepare_ner_source_file(
+            file_name,
+            working_directory,
+            splits_directory,
+            samples_directory,
+            use_mmap,
+            sampling,
+            sample_fraction,
+            name_index,
+        ),
+        txt_filenames,
+    ) as prepared_files:
+        coverages: List[SampleCoverage] = []
+
+        def get_ner_source_files() -> Iterator[Path]:
+            for ner_source_file, coverage in prepared_files:
+                if coverage is not None:
+                    coverages.append(coverage)
+                yield ner_source_file
+
+        perform_ner(
+            file_names=get_ner_source_files(),
+            ner_directory=ner_directory,
+            resource_directory=resource_dir,
+            strip_prefixes=[
+                "nosplits_",
+                SPLITS_FIRST_HALF_PREFIX,
+                SPLITS_SECOND_HALF_PREFIX,
+                *SPLITS_PART_PREFIXES,
+            ],
+            gazetteer_only=gazetteer_only,
+        )
+    if coverages:
+        log_sample_coverage(sorted(coverages, key=lambda coverage: coverage.file_name))
+    # Only once every other file has its NER output and the cache is saved
+    if prepared_files.errors:
+        raise prepared_files.errors[0]
 
 
 if __name__ == "__main__":
@@ -121,4 +601,8 @@ if __name__ == "__main__":
         print("Please pass directory name")
         sys.exit(1)
 
-    process_files(working_directory)
+    process_files(
+        working_directory,
+        use_mmap="--mmap" in sys.argv[2:],
+        gazetteer_only="--gazetteer" in sys.argv[2:],
+    )
@@ -1,12 +1,27 @@
-from typing import Dict, Union
+import mmap
+import os
+import shutil
+from pathlib import Path
+from bisect import bisect_left
+from itertools import accumulate
+from typing import BinaryIO, Dict, List, Optional, TextIO, Tuple, Union
 
 from novel_ai_module_tools.logger_config import get_logger
+from novel_ai_module_tools.section_index import (
+    SECTION_INDEX_ENCODING,
+    get_section_index,
+    get_separator_indexes,
+)
 
 STAR_SEPARATOR = "***"
+STAR_SEPARATOR_BYTES = STAR_SEPARATOR.encode()
+ASCII_WHITESPACE = b" \t\n\r\x0b\x0c"
 FIRST_HALF = "first_half"
 SECOND_HALF = "second_half"
 NO_STARS = "no_stars"
 FULL_TEXT = "full_text"
+ERROR = "ERROR"
+WRITE_BLOCK_SIZE = 1024 * 1024
 
 
 logger = get_logger(__file__)
@@ -33,7 +48,160 @@ def get_star_index(input_text: str) -> int:
     return star_index
 
 
-def split_file(file_name: str) -> Dict[str, Union[str, bool]]:
+class SplitResult:
+    """
+    The result of splitting a file's text on the '***' separator.
+
+    The text is stored once, together with the start and end offsets of each
+    part. Part strings are only built when they are asked for, and write_part
+    writes a part out directly from the stored text. A file split in two has
+    a first and a second half.
+
+    For compatibility with code that used the dictionary returned by earlier
+    versions of split_file, results can also be read with the 'first_half',
+    'second_half', 'no_stars', 'full_text' and 'ERROR' keys.
+    """
+
+    __slots__ = ("full_text", "part_ranges", "error")
+
+    def __init__(
+        self,
+        full_text: str = "",
+        part_ranges: Optional[List[Tuple[int, int]]] = None,
+        error: Optional[str] = None,
+    ):
+        """
+        Initialize the SplitResult.
+
+        Args:
+            full_text (str): The entire content of the file.
+            part_ranges (Optional[List[Tuple[int, int]]]): The start and end
+                offsets of each part, or None if the text was not split.
+            error (Optional[str]): Error message if an exception occurred.
+        """
+        self.full_text = full_text
+        self.part_ranges = part_ranges
+        self.error = error
+
+    @property
+    def no_stars(self) -> bool:
+        """bool: True if the file was read but '***' was not found, so it was not split."""
+        return self.error is None and self.part_ranges is None
+
+    @property
+    def first_half_range(self) -> Tuple[int, int]:
+        """Tuple[int, int]: The offsets of the content before '***'."""
+        return self.part_ranges[0]
+
+    @property
+    def second_half_range(self) -> Tuple[int, int]:
+        """Tuple[int, int]: The offsets of the content after '***'."""
+        return self.part_ranges[1]
+
+    @property
+    def first_half(self) -> str:
+        """str: The content before '***'."""
+        return self.get_part(0)
+
+    @property
+    def second_half(self) -> str:
+        """str: The content after '***'."""
+        return self.get_part(1)
+
+    def get_part(self, index: int) -> str:
+        """
+        Build the string for one part.
+
+        Args:
+            index (int): The zero-based index of the part.
+
+        Returns:
+            str: The content of the part.
+        """
+        start, end = self.part_ranges[index]
+        return self.full_text[start:end]
+
+    def write_part(self, index: int, file_path: Path) -> None:
+        """
+        Write one part to a file.
+
+        Args:
+            index (int): The zero-based index of the part.
+            file_path (Path): The file to write to.
+        """
+        with open(file_path, "w") as output_file:
+            write_text_range(output_file, self.full_text, *self.part_ranges[index])
+
+    def write_first_half(self, file_path: Path) -> None:
+        """
+        Write the content before '***' to a file.
+
+        Args:
+            file_path (Path): The file to write to.
+        """
+        self.write_part(0, file_path)
+
+    def write_second_half(self, file_path: Path) -> None:
+        """
+        Write the content after '***' to a file.
+
+        Args:
+            file_path (Path): The file to write to.
+        """
+        self.write_part(1, file_path)
+
+    def __contains__(self, key: str) -> bool:
+        if self.error is not None:
+            return key == ERROR
+        if key in (FIRST_HALF, SECOND_HALF):
+            return not self.no_stars
+        return key in (NO_STARS, FULL_TEXT)
+
+    def __getitem__(self, key: str) -> Union[str, bool]:
+        if key not in self:
+            raise KeyError(key)
+        if key == ERROR:
+            return self.error
+        return getattr(self, key)
+
+
+def write_text_range(output_file: TextIO, text: str, start: int, end: int) -> None:
+    """
+    Write part of a string to a file in blocks, without copying the whole part first.
+
+    Args:
+        output_file (TextIO): The open file to write to.
+        text (str): The string to write from.
+        start (int): The start of the part to write.
+        end (int): The end of the part to write (exclusive).
+    """
+    for block_start in range(start, end, WRITE_BLOCK_SIZE):
+        output_file.write(text[block_start : min(block_start + WRITE_BLOCK_SIZE, end)])
+
+
+def get_stripped_text_range(text: str, start: int, end: int) -> Tuple[int, int]:
+    """
+    Narrow a range of a string so that it excludes leading and trailing whitespace.
+
+    This gives the same range as str.strip would, without copying the text.
+
+    Args:
+        text (str): The string.
+        start (int): The start of the range.
+        end (int): The end of the range (exclusive).
+
+    Returns:
+        Tuple[int, int]: The start and end of the stripped range.
+    """
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+
+    return start, end
+
+
+def split_file(file_name: str) -> SplitResult:
     """
     Read a file and split its content based on the '***' separator.
 
@@ -41,12 +209,8 @@ def split_file(file_name: str) -> Dict[str, Union[str, bool]]:
         file_name (str): The name of the file to process.
 
     Returns:
-        Dict[str, Union[str, bool]]: A dictionary containing:
-            - 'first_half': The content before '***' (if found)
-            - 'second_half': The content after '***' (if found)
-            - 'no_stars': Boolean indicating if '***' was not found
-            - 'full_text': The entire content of the file
-            - 'ERROR': Error message if an exception occurred
+        SplitResult: The text of the file with the offsets of the content before
+            and after '***', or an error message if an exception occurred.
     """
     try:
         with open(file_name, "r") as input_file:
@@ -56,19 +220,253 @@ def split_file(file_name: str) -> Dict[str, Union[str, bool]]:
         star_index = get_star_index(input_text)
 
         if star_index == -1:
-            return {FULL_TEXT: input_text, NO_STARS: True}
+            return SplitResult(input_text)
+
+        return SplitResult(
+            input_text,
+            [
+                get_stripped_text_range(input_text, 0, star_index),
+                get_stripped_text_range(
+                    input_text, star_index + len(STAR_SEPARATOR), len(input_text)
+                ),
+            ],
+        )
+    except Exception as e:
+        logger.error(f"Error processing file {file_name}: {str(e)}")
+        return SplitResult(error=str(e))
+
+
+def get_balanced_separator_indexes(
+    separator_indexes: List[int], section_word_counts: List[int], parts: int
+) -> List[int]:
+    """
+    Choose the separators that split the text into parts with similar word counts.
+
+    Prefix sums over the word counts of the sections are searched for the
+    separator closest to each 1/parts share of the total.
+
+    Args:
+        separator_indexes (List[int]): The indexes of every '***' in the text.
+        section_word_counts (List[int]): The number of words in each section
+            between the separators.
+        parts (int): The number of parts wanted.
+
+    Returns:
+        List[int]: The indexes of the chosen separators, in order. Fewer than
+            parts - 1 separators are returned if the text does not have enough.
+    """
+    if len(separator_indexes) <= parts - 1:
+        return list(separator_indexes)
+
+    # words_before[i] is the number of words before separator i
+    words_before = list(accumulate(section_word_counts))[:-1]
+    total_words = sum(section_word_counts)
+
+    chosen = []
+    lowest = 0
+    for part in range(1, parts):
+        target = total_words * part / parts
+        # Leave enough separators for the parts that are still to come
+        highest = len(separator_indexes) - (parts - part)
+        candidate = bisect_left(words_before, target, lowest, highest + 1)
+        if candidate > lowest and (
+            candidate > highest
+            or target - words_before[candidate - 1] <= words_before[candidate] - target
+        ):
+            candidate -= 1
+        chosen.append(separator_indexes[candidate])
+        lowest = candidate + 1
+
+    return chosen
+
+
+def split_file_into_parts(file_name: str, parts: int) -> SplitResult:
+    """
+    Read a file and split its content on '***' separators into balanced parts.
+
+    Unlike split_file, which splits at the first '***' past the character
+    midpoint, the separators are chosen so that each part has about the same
+    number of words. The separators and word counts come from the book's
+    section index, which is only built if it is missing or out of date.
+
+    Args:
+        file_name (str): The name of the file to process.
+        parts (int): The number of parts wanted.
+
+    Returns:
+        SplitResult: The text of the file with the offsets of each part, or an
+            error message if an exception occurred. The text is not split if it
+            has no '***' separators, and has fewer parts than asked for if it
+            does not have enough.
+    """
+    try:
+        # Decoded the way the section index counts its character offsets
+        with open(file_name, "r", encoding=SECTION_INDEX_ENCODING) as input_file:
+            input_text = input_file.read()
+
+        index = get_section_index(file_name)
+        chosen_indexes = get_balanced_separator_indexes(
+            get_separator_indexes(index),
+            [section["words"] for section in index["sections"]],
+            parts,
+        )
+        logger.info(f"Splitting at separator indexes: {chosen_indexes}")
+
+        if not chosen_indexes:
+            return SplitResult(input_text)
+
+        part_starts = [0] + [index + len(STAR_SEPARATOR) for index in chosen_indexes]
+        part_ends = chosen_indexes + [len(input_text)]
+
+        return SplitResult(
+            input_text,
+            [
+                get_stripped_text_range(input_text, start, end)
+                for start, end in zip(part_starts, part_ends)
+            ],
+        )
+    except Exception as e:
+        logger.error(f"Error processing file {file_name}: {str(e)}")
+        return SplitResult(error=str(e))
+
+
+def get_star_offset(buffer: Union[bytes, mmap.mmap]) -> int:
+    """
+    Find the byte offset of the first '***' in the second half of a byte buffer.
+
+    Args:
+        buffer (Union[bytes, mmap.mmap]): The raw contents of a file.
+
+    Returns:
+        int: The offset of '***' in the second half of the buffer, or -1 if not found.
+    """
+    midway_offset = len(buffer) // 2
+    logger.info(f"Buffer length: {len(buffer)}. Midway offset: {midway_offset}")
+
+    star_offset = buffer.find(STAR_SEPARATOR_BYTES, midway_offset)
+    logger.info(f"Star offset: {star_offset}")
+
+    return star_offset
+
+
+def get_stripped_range(
+    buffer: Union[bytes, mmap.mmap], start: int, end: int
+) -> Tuple[int, int]:
+    """
+    Narrow a byte range so that it excludes leading and trailing ASCII whitespace.
+
+    Args:
+        buffer (Union[bytes, mmap.mmap]): The raw contents of a file.
+        start (int): The start of the range.
+        end (int): The end of the range (exclusive).
+
+    Returns:
+        Tuple[int, int]: The start and end of the stripped range.
+    """
+    while start < end and buffer[start] in ASCII_WHITESPACE:
+        start += 1
+    while end > start and buffer[end - 1] in ASCII_WHITESPACE:
+        end -= 1
+
+    return start, end
+
+
+def copy_range(
+    source_file: BinaryIO,
+    buffer: mmap.mmap,
+    destination_path: str,
+    start: int,
+    end: int,
+) -> None:
+    """
+    Write a byte range of a file to another file without building a copy in memory.
+
+    The range is copied in the kernel with os.copy_file_range where available,
+    and otherwise written directly from the memory-mapped buffer.
+
+    Args:
+        source_file (BinaryIO): The open source file.
+        buffer (mmap.mmap): The memory-mapped contents of the source file.
+        destination_path (str): The file to write the range to.
+        start (int): The start of the range.
+        end (int): The end of the range (exclusive).
+    """
+    with open(destination_path, "wb") as destination_file:
+        if hasattr(os, "copy_file_range"):
+            try:
+                offset = start
+                while offset < end:
+                    copied = os.copy_file_range(
+                        source_file.fileno(),
+                        destination_file.fileno(),
+                        end - offset,
+                        offset,
+                    )
+                    if copied == 0:
+                        break
+                    offset += copied
+                if offset == end:
+                    return
+                destination_file.seek(0)
+                destination_file.truncate()
+            except OSError:
+                # Not supported between these files; fall back to a plain write
+                destination_file.seek(0)
+                destination_file.truncate()
+
+        with memoryview(buffer) as view:
+            destination_file.write(view[start:end])
+
+
+def split_file_mapped(
+    file_name: str, first_half_path: str, second_half_path: str, full_text_path: str
+) -> Dict[str, Union[str, bool]]:
+    """
+    Split a file on the '***' separator by memory-mapping it and working on raw bytes.
+
+    The separator is searched for from the byte midpoint of the file, and the two
+    halves are written straight from the mapped file, so the time taken depends on
+    the distance to the separator rather than the size of the book, and no copy of
+    the text is held in memory. Unlike split_file, the midpoint is measured in
+    bytes, only ASCII whitespace is stripped from the halves, and line endings are
+    left as they are.
+
+    Args:
+        file_name (str): The name of the file to process.
+        first_half_path (str): Where to write the content before '***'.
+        second_half_path (str): Where to write the content after '***'.
+        full_text_path (str): Where to copy the whole file if '***' is not found.
+
+    Returns:
+        Dict[str, Union[str, bool]]: A dictionary containing:
+            - 'no_stars': Boolean indicating if '***' was not found
+            - 'ERROR': Error message if an exception occurred
+    """
+    try:
+        with open(file_name, "rb") as input_file:
+            if os.fstat(input_file.fileno()).st_size == 0:
+                # Empty files cannot be memory-mapped
+                shutil.copyfile(file_name, full_text_path)
+                return {NO_STARS: True}
+
+            with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                star_offset = get_star_offset(buffer)
+
+                if star_offset == -1:
+                    shutil.copyfile(file_name, full_text_path)
+                    return {NO_STARS: True}
 
-        first_half = input_text[:star_index].strip()
-        second_half = input_text[star_index + len(STAR_SEPARATOR) :].strip()
+                first_start, first_end = get_stripped_range(buffer, 0, star_offset)
+                second_start, second_end = get_stripped_range(
+                    buffer, star_offset + len(STAR_SEPARATOR_BYTES), len(buffer)
+                )
 
-        ret_data: Dict[str, Union[str, bool]] = {
-            FIRST_HALF: first_half,
-            SECOND_HALF: second_half,
-            NO_STARS: False,
-            FULL_TEXT: input_text,
-        }
+                copy_range(input_file, buffer, first_half_path, first_start, first_end)
+                copy_range(
+                    input_file, buffer, second_half_path, second_start, second_end
+                )
 
-        return ret_data
+        return {NO_STARS: False}
     except Exception as e:
         logger.error(f"Error processing file {file_name}: {str(e)}")
-        return {"ERROR": str(e)}
+        return {ERROR: str(e)}
@@ -0,0 +1,77 @@
+import os
+import random
+from difflib import SequenceMatcher
+
+from novel_ai_module_tools.conflict_graph import (
+    CONFLICT_GRAPH_FILE_NAME,
+    build_conflict_graph,
+    load_conflict_graph,
+)
+from novel_ai_module_tools.similarity_index import SimilarityIndex
+
+
+def get_random_names(count):
+    return [
+        "".join(random.choice("aeilnrsx") for _ in range(random.randint(0, 9)))
+        for _ in range(count)
+    ]
+
+
+def test_build_conflict_graph_matches_comparing_all_pairs():
+    random.seed(0)
+    names = get_random_names(200)
+    graph = build_conflict_graph(names, 0.8)
+
+    assert graph.threshold == 0.8
+    for name in names:
+        expected = {}
+        for other_name in set(names):
+            similarity = SequenceMatcher(None, name, other_name).ratio()
+            if similarity > 0.8:
+                expected[other_name] = similarity
+        assert graph.conflicts[name] == expected
+
+
+def test_load_conflict_graph_reuses_cache(tmp_path, mocker):
+    (tmp_path / "F.txt").write_text("Alice\nAlicia\nBob\n")
+
+    graph = load_conflict_graph(tmp_path, 0.7)
+    assert (tmp_path / CONFLICT_GRAPH_FILE_NAME).exists()
+    assert "Alicia" in graph.conflicts["Alice"]
+    assert "Bob" not in graph.conflicts["Alice"]
+
+    build = mocker.patch("novel_ai_module_tools.conflict_graph.build_conflict_graph")
+    cached = load_conflict_graph(tmp_path, 0.7)
+    build.assert_not_called()
+    assert cached.conflicts == graph.conflicts
+
+
+def test_load_conflict_graph_rebuilds_when_threshold_or_names_change(tmp_path):
+    name_file = tmp_path / "F.txt"
+    name_file.write_text("Alice\nAlicia\n")
+    assert "Alicia" in load_conflict_graph(tmp_path, 0.7).conflicts["Alice"]
+
+    assert "Alicia" not in load_conflict_graph(tmp_path, 0.9).conflicts["Alice"]
+
+    name_file.write_text("Alice\nAlicia\nAlise\n")
+    stat = name_file.stat()
+    os.utime(name_file, (stat.st_atime, stat.st_mtime + 10))
+    assert "Alise" in load_conflict_graph(tmp_path, 0.9).conflicts
+
+
+def test_find_similar_with_conflict_graph_matches_comparing():
+    random.seed(1)
+    names = get_random_names(300)
+    graph = build_conflict_graph(names[:200], 0.8)
+    candidates = names[:100] + names[250:]
+
+    for threshold in (0.5, 0.8, 0.85, 0.9):
+        plain_index = SimilarityIndex()
+        graph_index = SimilarityIndex(conflict_graph=graph)
+        for name in names[100:]:
+            plain_index.add(name)
+            graph_index.add(name)
+        for candidate in candidates:
+            assert graph_index.find_similar(
+                candidate, threshold
+            ) == plain_index.find_similar(candidate, threshold)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+
+from novel_ai_module_tools import file_utils
+from novel_ai_module_tools.file_utils import (
+    get_file_hash,
+    is_file_unchanged,
+    save_json_atomically,
+)
+
+
+def create_record(file_path):
+    file_stat = os.stat(file_path)
+    return {
+        "size": file_stat.st_size,
+        "mtime_ns": file_stat.st_mtime_ns,
+        "source_hash": get_file_hash(file_path),
+    }
+
+
+def test_get_file_hash(tmp_path):
+    file_path = tmp_path / "book.txt"
+    file_path.write_bytes(b"One two three")
+
+    assert get_file_hash(file_path) == hashlib.sha256(b"One two three").hexdigest()
+
+
+def test_is_file_unchanged(tmp_path, mocker):
+    file_path = tmp_path / "book.txt"
+    file_path.write_text("One two three")
+    record = create_record(file_path)
+
+    hash_file = mocker.spy(file_utils, "get_file_hash")
+    assert is_file_unchanged(file_path, record)
+    hash_file.assert_not_called()
+
+    # Touched but unchanged
+    os.utime(file_path, ns=(record["mtime_ns"] + 10**9, record["mtime_ns"] + 10**9))
+    assert is_file_unchanged(file_path, record)
+    hash_file.assert_called_once()
+
+    # Changed without changing size
+    file_path.write_text("One two thre3")
+    assert not is_file_unchanged(file_path, record)
+
+    file_path.write_text("One two")
+    assert not is_file_unchanged(file_path, record)
+
+    file_path.unlink()
+    assert not is_file_unchanged(file_path, record)
+
+
+def test_save_json_atomically(tmp_path):
+    json_path = tmp_path / "data.json"
+
+    assert save_json_atomically(json_path, {"b": 1, "a": [2]}, sort_keys=True)
+    assert json_path.read_text() == '{"a": [2], "b": 1}'
+    assert not (tmp_path / "data.json.tmp").exists()
+
+
+def test_save_json_atomically_keeps_old_file_on_error(tmp_path):
+    json_path = tmp_path / "data.json"
+    json_path.write_text(json.dumps({"old": True}))
+
+    (tmp_path / "data.json.tmp").mkdir()
+
+    assert not save_json_atomically(json_path, {"new": True})
+    assert json.loads(json_path.read_text()) == {"old": True}
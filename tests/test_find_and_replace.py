@@ -73,3 +73,11 @@ def test_get_replacement_invalid_type(mock_load_name_replacements):
         original_name, name_type, used_project_pile, used_file_pile
     )
     assert result == ""
+
+
+def test_get_unique_replacement_keeps_surname_endings():
+    replacement_list = ["Smith", "Jones", "Brown", "Wilcox"]
+
+    assert get_unique_replacement("Harris", "S", replacement_list, [], []) == "Jones"
+    assert get_unique_replacement("Clark", "S", replacement_list, [], []) == "Smith"
+    assert replacement_list == ["Brown", "Wilcox"]
@@ -1,7 +1,22 @@
 import pytest
+import csv
+import io
+import json
 import os
+import re
 import tempfile
-from novel_ai_module_tools.formatter import process_file, format_files
+from novel_ai_module_tools.formatter import (
+    process_file,
+    format_files,
+    format_text,
+    format_stream,
+    format_directory_files,
+    format_text_parallel,
+    split_text,
+    profile_format_text,
+    FORMAT_RULES,
+    MANIFEST_FILE_NAME,
+)
 from unittest.mock import Mock
 
 
@@ -68,6 +83,113 @@ def test_format_files_directory(temp_directory, sample_text, monkeypatch):
     assert os.path.exists(os.path.join(temp_directory, "test2_fmtd.txt"))
 
 
+def test_format_files_directory_parallel_without_prompt(
+    temp_directory, sample_text, monkeypatch, capsys
+):
+    for name in ["test1.txt", "test2.txt", "test3.txt"]:
+        with open(os.path.join(temp_directory, name), "w", encoding="utf-8") as f:
+            f.write(sample_text)
+
+    monkeypatch.setattr(
+        "sys.argv", ["script_name", temp_directory, "--yes", "--jobs", "2"]
+    )
+    mock_input = Mock(return_value="n")
+
+    format_files(input_func=mock_input)
+
+    mock_input.assert_not_called()
+    for name in ["test1_fmtd.txt", "test2_fmtd.txt", "test3_fmtd.txt"]:
+        assert os.path.exists(os.path.join(temp_directory, name))
+    captured = capsys.readouterr()
+    assert "Formatted 3 file(s)" in captured.out
+    assert "test1.txt:" in captured.out
+
+
+def test_format_directory_files_largest_first(temp_directory, sample_text):
+    file_paths = []
+    for name, repeat in [("small.txt", 1), ("large.txt", 10), ("medium.txt", 5)]:
+        file_path = os.path.join(temp_directory, name)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(sample_text * repeat)
+        file_paths.append(file_path)
+
+    results = format_directory_files(file_paths)
+
+    assert [os.path.basename(result.file_path) for result in results] == [
+        "large.txt",
+        "medium.txt",
+        "small.txt",
+    ]
+
+
+def test_format_files_directory_skips_up_to_date_files(
+    temp_directory, sample_text, monkeypatch, mocker
+):
+    for name in ["test1.txt", "test2.txt"]:
+        with open(os.path.join(temp_directory, name), "w", encoding="utf-8") as f:
+            f.write(sample_text)
+    monkeypatch.setattr("sys.argv", ["script_name", temp_directory, "--yes"])
+    format_files()
+    assert os.path.exists(os.path.join(temp_directory, MANIFEST_FILE_NAME))
+
+    spy = mocker.patch(
+        "novel_ai_module_tools.formatter.process_file", wraps=process_file
+    )
+
+    # Nothing changed, and the _fmtd outputs are not formatted again
+    format_files()
+    spy.assert_not_called()
+    assert not os.path.exists(os.path.join(temp_directory, "test1_fmtd_fmtd.txt"))
+
+    # Touched but unchanged files are still skipped
+    os.utime(os.path.join(temp_directory, "test1.txt"), ns=(0, 0))
+    format_files()
+    spy.assert_not_called()
+
+    with open(os.path.join(temp_directory, "test2.txt"), "a", encoding="utf-8") as f:
+        f.write("More text")
+    format_files()
+    spy.assert_called_once()
+    assert spy.call_args.args[0] == os.path.join(temp_directory, "test2.txt")
+
+    monkeypatch.setattr("sys.argv", ["script_name", temp_directory, "--yes", "--force"])
+    format_files()
+    assert spy.call_count == 3
+
+
+@pytest.mark.parametrize("report_name", ["profile.json", "profile.csv"])
+def test_format_files_profile_report(
+    temp_directory, sample_text, monkeypatch, capsys, report_name
+):
+    input_file = os.path.join(temp_directory, "test.txt")
+    with open(input_file, "w", encoding="utf-8") as f:
+        f.write(sample_text)
+    report_path = os.path.join(temp_directory, report_name)
+
+    monkeypatch.setattr(
+        "sys.argv", ["script_name", input_file, "--profile", report_path]
+    )
+    format_files()
+
+    with open(report_path, "r") as f:
+        if report_name.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+    rules = {row["rule"]: row for row in rows}
+    assert set(rules) == {"quotes"} | {rule.name for rule in FORMAT_RULES}
+    assert int(rules["chapters"]["matches"]) == 1
+    assert int(rules["quotes"]["bytes_in"]) == len(sample_text.encode("utf-8"))
+    assert "Top 10 rules by total time:" in capsys.readouterr().out
+
+
+def test_profile_format_text_matches_format_text(sample_text):
+    formatted_text, profile = profile_format_text(sample_text)
+
+    assert formatted_text == format_text(sample_text)
+    assert profile[-1].bytes_out == len(formatted_text.encode("utf-8"))
+
+
 def test_format_files_single_file(temp_directory, sample_text, monkeypatch):
     input_file = os.path.join(temp_directory, "test.txt")
 
@@ -128,6 +250,91 @@ def test_specific_formatting_rules(temp_directory, input_text, expected_output):
     assert processed_text == expected_output
 
 
+def sequential_format(source_text):
+    # Reference implementation: one re.sub pass per rule, in the original order
+    source_text = re.sub(r"[“”]", '"', source_text)
+    source_text = re.sub(r"[‘’`]", "'", source_text)
+    source_text = re.sub(r" --- ", " - ", source_text)
+    source_text = re.sub(r"---", "–", source_text)
+    source_text = re.sub(r"…|\s\.\s\.\s\.", "...", source_text)
+    source_text = re.sub(r"\s\.\.\.", "...", source_text)
+    source_text = re.sub(r"CHAPTER \d+$", "***", source_text, flags=re.MULTILINE)
+    source_text = re.sub(r"(^\*\*\*$\n){2,}", "***\n", source_text, flags=re.MULTILINE)
+    source_text = re.sub(r"\n{3,}", "\n***\n", source_text)
+    source_text = re.sub(r"\*{4,}", "***", source_text)
+    source_text = re.sub(r"^\s*$", "", source_text, flags=re.MULTILINE)
+    source_text = re.sub(r"^\s+|\s+$", "", source_text, flags=re.MULTILINE)
+    source_text = re.sub(r"^\d+$", "", source_text, flags=re.MULTILINE)
+    return source_text
+
+
+@pytest.mark.parametrize(
+    "input_text",
+    [
+        " --- --- text",
+        "word --- . . . after",
+        " . . … end",
+        "CHAPTER 5\n. . .",
+        "***\n***\n\n\n***\n",
+        "**\n\n\n*****\n",
+        "a\n  \t\n\n\n  42  \nb",
+        "\r\n\r\n“Quote” ‘single’ `tick`\r\n",
+    ],
+)
+def test_format_text_matches_sequential_rules(sample_text, input_text):
+    assert format_text(input_text) == sequential_format(input_text)
+    assert format_text(sample_text) == sequential_format(sample_text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64])
+def test_format_stream_matches_format_text(sample_text, chunk_size):
+    input_text = (
+        sample_text + "He left.\nShe came.\nCHAPTER 2\nCHAPTER 3\n***\nThen\n. . .\nEnd"
+    )
+    output_file = io.StringIO()
+
+    format_stream(io.StringIO(input_text), output_file, chunk_size)
+
+    assert output_file.getvalue() == format_text(input_text)
+
+
+def test_split_text_pieces_format_like_whole_text(sample_text):
+    input_text = (sample_text + "He left.\nShe came.\nCHAPTER 2\nThen\n") * 5
+
+    pieces = split_text(input_text, 10)
+
+    assert len(pieces) > 1
+    assert "\n".join(pieces) == input_text
+    assert "\n".join(format_text(piece) for piece in pieces) == format_text(input_text)
+
+
+def test_format_text_parallel_matches_format_text(sample_text, monkeypatch):
+    monkeypatch.setattr("novel_ai_module_tools.formatter.PARALLEL_FORMAT_MIN_SIZE", 0)
+    input_text = (sample_text + "He left.\nShe came.\nCHAPTER 2\nThen\n") * 20
+
+    assert format_text_parallel(input_text, jobs=2) == format_text(input_text)
+
+
+def test_process_file_streaming(temp_directory, sample_text):
+    input_file = os.path.join(temp_directory, "test_input.txt")
+    with open(input_file, "w", encoding="utf-8") as f:
+        f.write(sample_text)
+
+    process_file(input_file)
+    with open(
+        os.path.join(temp_directory, "test_input_fmtd.txt"), "r", encoding="utf-8"
+    ) as f:
+        in_memory_text = f.read()
+
+    process_file(input_file, streaming=True, chunk_size=5)
+    with open(
+        os.path.join(temp_directory, "test_input_fmtd.txt"), "r", encoding="utf-8"
+    ) as f:
+        streamed_text = f.read()
+
+    assert streamed_text == in_memory_text
+
+
 @pytest.mark.skip(reason="Temporarily skipping. This test is not working as expected")
 def test_multiple_formatting_rules(temp_directory):
     input_text = """
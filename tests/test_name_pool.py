@@ -0,0 +1,22 @@
+from novel_ai_module_tools.name_pool import NamePool, ends_with_s_or_x
+
+
+def test_ends_with_s_or_x():
+    assert ends_with_s_or_x("Jones")
+    assert ends_with_s_or_x("Wilcox")
+    assert not ends_with_s_or_x("Smith")
+
+
+def test_name_pool_pops_in_order_by_ending():
+    pool = NamePool(["Smith", "Jones", "Brown", "Wilcox", "Lee"])
+
+    assert pool.pop(True) == "Jones"
+    assert pool.pop(False) == "Smith"
+    assert pool.pop() == "Brown"
+    assert list(pool) == ["Wilcox", "Lee"]
+    assert len(pool) == 2
+
+    assert pool.pop(True) == "Wilcox"
+    assert pool.pop(True) is None
+    assert pool.pop() == "Lee"
+    assert pool.pop() is None
@@ -0,0 +1,50 @@
+import pytest
+
+from novel_ai_module_tools.name_replacer import (
+    get_independent_replacements,
+    replace_name,
+    replace_names,
+)
+
+
+def replace_one_at_a_time(text, replacements):
+    for original_name, replacement in replacements:
+        text = replace_name(text, original_name, replacement)
+    return text
+
+
+def test_replace_name_keeps_boundaries():
+    text = 'Bob said, "Bob!"\nBob—and Bobby (Bob).\nBob'
+
+    assert replace_name(text, "Bob", "Tom") == (
+        'Tom said, "Tom!"\nTom—and Bobby (Tom).\nBob'
+    )
+
+
+def test_get_independent_replacements():
+    replacements = [
+        ("Bob", "Tom"),
+        ("Mary", "Mary-Jane"),
+        ("Neil", "Ann"),
+        ("O'Neil", "Lee"),
+        ("Ann", "Sue"),
+    ]
+
+    assert get_independent_replacements(replacements) == {"Bob": "Tom"}
+
+
+@pytest.mark.parametrize(
+    "text, replacements",
+    [
+        ("Bob Bob Bob.\nBob,Bob", [("Bob", "Tom")]),
+        ("Bob Ann.", [("Bob", "Tom"), ("Ann", "Sue")]),
+        ("Bob Ann.", [("Bob", "Ann"), ("Ann", "Sue")]),
+        ("Mary's sister Mary-Jane.", [("Mary", "Yu-yan"), ("Jane", "Lee")]),
+        ("O'Neil and Neil.", [("Neil", "Tom"), ("O'Neil", "Sue")]),
+        ("Bob and Ann.", [("Bob", " Lee "), ("Ann", "Bob")]),
+    ],
+)
+def test_replace_names_matches_one_at_a_time(text, replacements):
+    assert replace_names(text, replacements) == replace_one_at_a_time(
+        text, replacements
+    )
@@ -1,9 +1,22 @@
 import pytest
+import spacy
 from pathlib import Path
 from spacy.tokens import Doc
+from novel_ai_module_tools.config import NER_MODEL
+from novel_ai_module_tools.ner_cache import get_ner_cache_path
+from novel_ai_module_tools.resources_loader import (
+    compile_name_index,
+    load_ignore_names,
+)
 from novel_ai_module_tools.ner import (
     get_unique_entities,
+    filter_candidate_paragraphs,
+    get_file_entities,
+    get_gazetteer_entities,
+    get_likely_names,
+    get_list_name,
     get_ner_write_file,
+    get_text_chunks,
     perform_ner,
 )
 
@@ -14,6 +27,8 @@ class MockDoc:
         def __init__(self, text, label_):
             self.text = text
             self.label_ = label_
+            self.start_char = 0
+            self.end_char = len(text)
 
     def __init__(self, ents):
         self.ents = [self.MockEnt(text, label) for text, label in ents]
@@ -63,18 +78,31 @@ def test_perform_ner(tmp_path, mock_resources, monkeypatch):
 
     # Mock spaCy and other dependencies
     class MockNER:
+        max_length = 1000000
+
         def __call__(self, text):
             return MockDoc([("John Doe", "PERSON"), ("Jane Smith", "PERSON")])
 
+        def pipe(self, texts, as_tuples, batch_size, n_process):
+            return ((self(text), context) for text, context in texts)
+
     monkeypatch.setattr(
         "novel_ai_module_tools.ner.spacy.load", lambda *args, **kwargs: MockNER()
     )
     monkeypatch.setattr(
-        "novel_ai_module_tools.ner.load_name_recognizers",
-        lambda: {"FirstName": ["John", "Jane"]},
+        "novel_ai_module_tools.ner.load_name_recognizer_index",
+        lambda path: compile_name_index(
+            {"FirstName": ["John", "Jane"]}, load_ignore_names(path)
+        ),
     )
 
-    perform_ner([input_dir / "test_file.txt"], ner_dir, mock_resources, ["input/"])
+    perform_ner(
+        [input_dir / "test_file.txt"],
+        ner_dir,
+        mock_resources,
+        ["input/"],
+        socket_path=str(tmp_path / "none.sock"),
+    )
 
     output_file = ner_dir / "ner_test_file.txt"
     assert output_file.exists()
@@ -83,3 +111,320 @@ def test_perform_ner(tmp_path, mock_resources, monkeypatch):
     assert "Jane|PERSON|FirstName" in content
     assert "Doe|PERSON|" in content
     assert "Smith|PERSON|" in content
+
+
+def get_ruler_ner():
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns(
+        [
+            {"label": "PERSON", "pattern": "John"},
+            {"label": "PERSON", "pattern": [{"TEXT": "Jane"}, {"TEXT": "Smith"}]},
+            {"label": "GPE", "pattern": "Paris"},
+        ]
+    )
+    return nlp
+
+
+@pytest.mark.parametrize(
+    "batch_size,n_process,chunk_size",
+    [(1, 1, 1000), (2, 1, 1000), (1, 2, 1000), (2, 1, 12)],
+)
+def test_perform_ner_batched_matches_serial(
+    tmp_path, mock_resources, monkeypatch, batch_size, n_process, chunk_size
+):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    texts = [
+        "John went to Paris.",
+        "Jane Smith met John.\nThen they left.\n",
+        "",
+        "Nobody here.",
+        "Jane Smith\nand John's dog.\nJohn again.",
+    ]
+    file_names = []
+    for number, text in enumerate(texts):
+        file_name = input_dir / f"test_{number}.txt"
+        file_name.write_text(text)
+        file_names.append(file_name)
+
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner.spacy.load",
+        lambda *args, **kwargs: get_ruler_ner(),
+    )
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner.load_name_recognizer_index",
+        lambda path: compile_name_index(
+            {"FirstName": ["John", "Jane"]}, load_ignore_names(path)
+        ),
+    )
+
+    ner_dir = tmp_path / "ner_output"
+    ner_dir.mkdir()
+    perform_ner(
+        file_names,
+        ner_dir,
+        mock_resources,
+        [],
+        batch_size=batch_size,
+        n_process=n_process,
+        chunk_size=chunk_size,
+        socket_path=str(tmp_path / "none.sock"),
+    )
+
+    serial_ner = get_ruler_ner()
+    for file_name, text in zip(file_names, texts):
+        output = (ner_dir / f"ner_{file_name.name}").read_text().splitlines()
+        expected = [
+            f"{name}|PERSON|" + ("FirstName" if name in ["John", "Jane"] else "")
+            for name in sorted(get_unique_entities(serial_ner(text)))
+        ]
+        assert output == expected
+
+
+def test_get_text_chunks(tmp_path):
+    file_name = tmp_path / "test.txt"
+    text = "One two.\nThree four five.\n\nSix.\nSeven eight nine ten eleven\n"
+    file_name.write_text(text)
+
+    chunks = list(get_text_chunks(file_name, 12))
+
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 12 for chunk in chunks)
+    assert chunks[:2] == ["One two.\n", "Three four "]
+    assert list(get_text_chunks(file_name, 1000)) == [text]
+
+
+def test_perform_ner_uses_cache(tmp_path, mock_resources, monkeypatch):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "test_0.txt").write_text("John went to Paris.\nJane Smith too.\n")
+    (input_dir / "test_1.txt").write_text("Nobody here.")
+    file_names = sorted(input_dir.iterdir())
+    ner_dir = tmp_path / "ner_output"
+    ner_dir.mkdir()
+
+    loads = []
+    pipe_texts = []
+
+    class RecordingNER:
+        def __init__(self):
+            self.nlp = get_ruler_ner()
+            self.max_length = self.nlp.max_length
+
+        def pipe(self, texts, **kwargs):
+            for text, context in texts:
+                pipe_texts.append(text)
+                yield from self.nlp.pipe([(text, context)], **kwargs)
+
+    def load(*args, **kwargs):
+        loads.append(RecordingNER())
+        return loads[-1]
+
+    monkeypatch.setattr("novel_ai_module_tools.ner.spacy.load", load)
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner.load_name_recognizer_index",
+        lambda path: compile_name_index({}, load_ignore_names(path)),
+    )
+
+    def run_ner():
+        perform_ner(
+            file_names,
+            ner_dir,
+            mock_resources,
+            [],
+            chunk_size=20,
+            socket_path=str(tmp_path / "none.sock"),
+        )
+        return (ner_dir / "ner_test_0.txt").read_text().splitlines()
+
+    assert run_ner() == ["Jane|PERSON|", "John|PERSON|", "Smith|PERSON|"]
+    assert len(loads) == 1
+    assert len(pipe_texts) == 3
+
+    # Only the filtering changed, so the model is not loaded again
+    (mock_resources / "ignore_names.txt").write_text("john\n")
+    assert run_ner() == ["Jane|PERSON|", "Smith|PERSON|"]
+    assert len(loads) == 1
+
+    # Only the changed chunk is run through the model
+    (input_dir / "test_0.txt").write_text("John went to Paris.\nJohn too.\n")
+    assert run_ner() == []
+    assert len(loads) == 2
+    assert pipe_texts[3:] == ["John too.\n"]
+
+    # One entry file per chunk, in the shard directory of its hash
+    entry_paths = list(get_ner_cache_path(ner_dir, NER_MODEL).glob("*/*.json"))
+    assert len(entry_paths) == 4
+    assert all(path.stem.startswith(path.parent.name) for path in entry_paths)
+
+
+def test_get_gazetteer_entities(tmp_path):
+    file_name = tmp_path / "test.txt"
+    file_name.write_text(
+        "John's sister Mary-Jane met O'Neil.\n"
+        "the mark on Johnny2 was from Mark, not Maryland.\n"
+    )
+    empty_file_name = tmp_path / "empty.txt"
+    empty_file_name.write_text("")
+    name_index = compile_name_index(
+        {"F": ["Mary-Jane", "Mary"], "M": ["John", "Mark", "Johnny"], "S": ["O'Neil"]},
+        [],
+    )
+
+    result = get_gazetteer_entities(name_index, [file_name, empty_file_name], 30)
+
+    assert result == [{"John", "Mary-Jane", "O'Neil", "Mark"}, set()]
+
+
+def test_get_list_name_drops_possessive_before_splitting_at_apostrophe():
+    name_index = compile_name_index({"M": ["John", "O'Connor"]}, [])
+
+    assert get_list_name("O'Connor's", name_index) == "O'Connor"
+    assert get_list_name("O'Connor’s", name_index) == "O'Connor"
+    assert get_list_name("John's", name_index) == "John"
+    assert get_list_name("John’d", name_index) == "John"
+    assert get_list_name("O'Brien's", name_index) is None
+
+
+def test_perform_ner_gazetteer_only(tmp_path, mock_resources, monkeypatch):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "test_file.txt").write_text("John and Jane's friend Bob.")
+
+    def fail_load(*args, **kwargs):
+        raise AssertionError("The model should not be loaded")
+
+    monkeypatch.setattr("novel_ai_module_tools.ner.spacy.load", fail_load)
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner.load_name_recognizer_index",
+        lambda path: compile_name_index(
+            {"F": ["Jane"], "M": ["John"]}, load_ignore_names(path)
+        ),
+    )
+    ner_dir = tmp_path / "ner_output"
+    ner_dir.mkdir()
+
+    perform_ner(
+        [input_dir / "test_file.txt"],
+        ner_dir,
+        mock_resources,
+        [],
+        gazetteer_only=True,
+        socket_path=str(tmp_path / "none.sock"),
+    )
+
+    assert (ner_dir / "ner_test_file.txt").read_text().splitlines() == [
+        "Jane|PERSON|F",
+        "John|PERSON|M",
+    ]
+
+
+def test_filter_candidate_paragraphs():
+    name_index = compile_name_index({"M": ["John"]}, [])
+    text = (
+        "The rain fell. It was cold.\n"
+        "John arrived.\n"
+        '"Where is the car?" she asked. "Ask Bertha."\n'
+        "She nodded.\n"
+        "It rained on Tuesday.\n"
+    )
+
+    assert filter_candidate_paragraphs(text, name_index) == (
+        'John arrived.\n"Where is the car?" she asked. "Ask Bertha."\n'
+    )
+
+
+def test_filter_candidate_paragraphs_drops_first_person_paragraphs():
+    name_index = compile_name_index({"F": ["June"], "M": ["John"]}, [])
+    text = "Then I knew. I'm sure I'd seen it in June, or on a Monday.\nI told John.\n"
+
+    assert list(get_likely_names(text, name_index)) == ["John"]
+    assert filter_candidate_paragraphs(text, name_index) == "I told John.\n"
+
+
+def test_get_likely_names():
+    name_index = compile_name_index({"M": ["John"]}, [])
+    text = "John's dog barked.\nThe rain fell on Bertha's car. It was cold.\nAsk Carl."
+
+    assert list(get_likely_names(text, name_index)) == ["John", "Bertha", "Carl"]
+
+
+def test_get_file_entities_with_prefilter(tmp_path):
+    file_name = tmp_path / "test.txt"
+    file_name.write_text("Nothing here.\nWe met John.\nNobody else.\n")
+    texts = []
+
+    class RecordingNER:
+        def __init__(self):
+            self.nlp = get_ruler_ner()
+            self.max_length = self.nlp.max_length
+
+        def pipe(self, texts_with_context, **kwargs):
+            for text, context in texts_with_context:
+                texts.append(text)
+                yield from self.nlp.pipe([(text, context)], **kwargs)
+
+    result = get_file_entities(
+        RecordingNER,
+        [file_name],
+        1,
+        1,
+        1000,
+        prefilter_index=compile_name_index({}, []),
+    )
+
+    assert result == [{"John"}]
+    assert texts == ["We met John.\n"]
+
+
+def test_perform_ner_cascade(tmp_path, mock_resources, monkeypatch):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "test_file.txt").write_text(
+        "John met Buidze.\nThe Rain fell.\nNothing else happened.\n"
+    )
+    models = {}
+
+    def load(model_name, *args, **kwargs):
+        nlp = spacy.blank("en")
+        ruler = nlp.add_pipe("entity_ruler")
+        if model_name == "large_model":
+            ruler.add_patterns(
+                [
+                    {"label": "PERSON", "pattern": "John"},
+                    {"label": "PERSON", "pattern": "Buidze"},
+                ]
+            )
+        else:
+            ruler.add_patterns(
+                [
+                    {"label": "PERSON", "pattern": name}
+                    for name in ["John", "Buidze", "Rain"]
+                ]
+            )
+        models[model_name] = nlp
+        return nlp
+
+    monkeypatch.setattr("novel_ai_module_tools.ner.spacy.load", load)
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner.load_name_recognizer_index",
+        lambda path: compile_name_index({"M": ["John"]}, load_ignore_names(path)),
+    )
+    ner_dir = tmp_path / "ner_output"
+    ner_dir.mkdir()
+
+    perform_ner(
+        [input_dir / "test_file.txt"],
+        ner_dir,
+        mock_resources,
+        [],
+        cascade_model="large_model",
+        socket_path=str(tmp_path / "none.sock"),
+    )
+
+    assert set(models) == {NER_MODEL, "large_model"}
+    assert (ner_dir / "ner_test_file.txt").read_text().splitlines() == [
+        "Buidze|PERSON||large_model",
+        f"John|PERSON|M|{NER_MODEL}",
+    ]
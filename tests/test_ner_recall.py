@@ -0,0 +1,41 @@
+import spacy
+
+from novel_ai_module_tools.ner_recall import (
+    compare_prefilter_recall,
+    print_recall_report,
+)
+from novel_ai_module_tools.resources_loader import compile_name_index
+
+
+def get_ruler_ner():
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns(
+        [
+            {"label": "PERSON", "pattern": "John"},
+            {"label": "PERSON", "pattern": "Mary"},
+        ]
+    )
+    return nlp
+
+
+def test_compare_prefilter_recall(tmp_path, capsys):
+    file_name = tmp_path / "book.txt"
+    # Mary only starts sentences and is not in the name lists, so the
+    # prefilter drops her paragraph
+    file_name.write_text("We saw John.\nMary left. Rain fell.\nThe end.\n")
+    name_index = compile_name_index({"M": ["John"]}, [])
+
+    (result,) = compare_prefilter_recall(get_ruler_ner(), name_index, [file_name])
+
+    assert result.full_names == {"John", "Mary"}
+    assert result.prefiltered_names == {"John"}
+    assert result.recall == 0.5
+    assert result.characters == len(file_name.read_text())
+    assert result.prefiltered_characters == len("We saw John.\n")
+
+    print_recall_report([result])
+    output = capsys.readouterr().out
+    assert "recall 50.0% (2 names)" in output
+    assert "Missed: Mary" in output
+    assert "Total: recall 50.0% (1/2 names)" in output
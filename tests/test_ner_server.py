@@ -0,0 +1,187 @@
+import os
+import stat
+import threading
+
+import pytest
+import spacy
+
+from novel_ai_module_tools.config import NER_MODEL
+from novel_ai_module_tools.resources_loader import (
+    compile_name_index,
+    load_ignore_names,
+)
+from novel_ai_module_tools.ner import (
+    is_owned_by_user,
+    perform_ner,
+    request_file_entities,
+)
+from novel_ai_module_tools.ner_cache import get_ner_cache_path
+from novel_ai_module_tools.ner_server import (
+    SOCKET_DIRECTORY_MODE,
+    SOCKET_MODE,
+    NERServer,
+    check_cache_path,
+    is_server_running,
+    serve,
+)
+
+
+def get_ruler_ner():
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns(
+        [
+            {"label": "PERSON", "pattern": "John"},
+            {"label": "PERSON", "pattern": [{"TEXT": "Jane"}, {"TEXT": "Smith"}]},
+        ]
+    )
+    return nlp
+
+
+@pytest.fixture
+def socket_path(tmp_path_factory):
+    # Unix socket paths are limited to about 100 characters
+    return str(tmp_path_factory.mktemp("ner") / "ner.sock")
+
+
+@pytest.fixture
+def ner_server(socket_path):
+    server = NERServer(socket_path, get_ruler_ner(), NER_MODEL)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    file_names = []
+    for number, text in enumerate(["John met Jane Smith.", "", "Nobody."]):
+        file_name = tmp_path / f"test_{number}.txt"
+        file_name.write_text(text)
+        file_names.append(file_name)
+    return file_names
+
+
+def test_perform_ner_uses_running_server(
+    tmp_path, socket_path, ner_server, input_files, monkeypatch
+):
+    def fail_load(*args, **kwargs):
+        raise AssertionError("The model should not be loaded")
+
+    monkeypatch.setattr("novel_ai_module_tools.ner.spacy.load", fail_load)
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner.load_name_recognizer_index",
+        lambda path: compile_name_index(
+            {"FirstName": ["John", "Jane"]}, load_ignore_names(path)
+        ),
+    )
+    ner_dir = tmp_path / "ner_output"
+    ner_dir.mkdir()
+
+    assert is_server_running(socket_path)
+    perform_ner(input_files, ner_dir, tmp_path, [], socket_path=socket_path)
+
+    assert (ner_dir / "ner_test_0.txt").read_text().splitlines() == [
+        "Jane|PERSON|FirstName",
+        "John|PERSON|FirstName",
+        "Smith|PERSON|",
+    ]
+    assert (ner_dir / "ner_test_1.txt").read_text() == ""
+    assert (ner_dir / "ner_test_2.txt").read_text() == ""
+
+
+def test_request_file_entities_rejects_other_model(socket_path, input_files):
+    server = NERServer(socket_path, get_ruler_ner(), "another_model")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert request_file_entities(socket_path, input_files, 1, 1, 1000) is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_request_file_entities_without_server(socket_path, input_files):
+    assert not is_server_running(socket_path)
+    assert request_file_entities(socket_path, input_files, 1, 1, 1000) is None
+
+
+def test_server_socket_is_private(socket_path, ner_server):
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == SOCKET_MODE
+
+
+def test_request_file_entities_ignores_socket_of_other_user(
+    socket_path, ner_server, input_files, monkeypatch
+):
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner.os.getuid", lambda: os.stat(socket_path).st_uid + 1
+    )
+
+    assert request_file_entities(socket_path, input_files, 1, 1, 1000) is None
+
+
+def test_request_file_entities_rejects_cache_outside_project(
+    tmp_path, socket_path, ner_server, input_files
+):
+    outside = tmp_path.parent / "outside"
+    outside.mkdir()
+
+    assert (
+        request_file_entities(
+            socket_path,
+            input_files,
+            1,
+            1,
+            1000,
+            get_ner_cache_path(outside, NER_MODEL),
+        )
+        is None
+    )
+    assert (
+        request_file_entities(
+            socket_path, input_files, 1, 1, 1000, tmp_path / "not_a_cache.json"
+        )
+        is None
+    )
+    assert not list(outside.iterdir())
+    assert not (tmp_path / "not_a_cache.json").exists()
+
+
+def test_check_cache_path_accepts_cache_of_split_files(tmp_path):
+    split_file = tmp_path / "names_replaced" / "splits" / "1h_book.txt"
+    cache_path = get_ner_cache_path(tmp_path / "names_replaced" / "ner", NER_MODEL)
+
+    check_cache_path(cache_path, [split_file], NER_MODEL)
+    with pytest.raises(ValueError):
+        check_cache_path(cache_path, [split_file], "another_model")
+
+
+def test_serve_makes_private_socket_directory(tmp_path, monkeypatch):
+    def stop_before_loading():
+        raise RuntimeError("stop")
+
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner_server.load_ner_model", stop_before_loading
+    )
+    socket_directory = tmp_path / "sockets"
+
+    with pytest.raises(RuntimeError):
+        serve(str(socket_directory / "ner.sock"))
+    assert stat.S_IMODE(socket_directory.stat().st_mode) == SOCKET_DIRECTORY_MODE
+
+    monkeypatch.setattr(
+        "novel_ai_module_tools.ner_server.is_owned_by_user", lambda path: False
+    )
+    with pytest.raises(SystemExit):
+        serve(str(socket_directory / "ner.sock"))
+
+
+def test_request_file_entities_without_user_ids(
+    socket_path, ner_server, input_files, monkeypatch
+):
+    monkeypatch.delattr("novel_ai_module_tools.ner.os.getuid")
+
+    assert not is_owned_by_user(socket_path)
+    assert request_file_entities(socket_path, input_files, 1, 1, 1000) is None
@@ -1,10 +1,14 @@
 import pytest
 from pathlib import Path
 from collections import OrderedDict
+import novel_ai_module_tools.resources_loader as resources_loader
 from novel_ai_module_tools.resources_loader import (
     load_names,
     load_name_replacements,
     load_name_recognizers,
+    load_name_index,
+    compile_name_index,
+    NAME_INDEX_FILE_NAME,
 )
 
 
@@ -62,3 +66,43 @@ def test_load_names_ignore_hidden_files(mock_names_directory):
 
     assert ".hidden_file" not in result
     assert len(result) == 2  # Only the two visible files should be loaded
+
+
+def test_compile_name_index():
+    name_index = compile_name_index(
+        OrderedDict({"Female": ["Alice", "Sam", "Sam"], "Male": ["Bob", "Sam"]}),
+        ["ignored"],
+    )
+
+    assert name_index.get_type("Alice") == "Female"
+    assert name_index.get_type("Sam") == "Female"
+    assert name_index.get_types("Sam") == ["Female", "Male"]
+    assert name_index.get_type("Nobody") == ""
+    assert name_index.is_ignored("Ignored")
+    assert not name_index.is_ignored("Alice")
+
+
+def test_load_name_index_is_cached_until_lists_change(
+    mock_names_directory, tmp_path, mocker
+):
+    ignore_names = tmp_path / "ignore_names.txt"
+    ignore_names.write_text("ignored\n")
+    load_names_spy = mocker.spy(resources_loader, "load_names")
+
+    name_index = load_name_index(mock_names_directory, ignore_names)
+    assert (mock_names_directory / NAME_INDEX_FILE_NAME).exists()
+    assert name_index.get_type("Bob") == "first_names"
+    assert name_index.is_ignored("Ignored")
+    assert load_names_spy.call_count == 1
+
+    assert load_name_index(mock_names_directory, ignore_names) == name_index
+    assert load_names_spy.call_count == 1
+
+    (mock_names_directory / "last_names.txt").write_text("Smith\nBob")
+    name_index = load_name_index(mock_names_directory, ignore_names)
+    assert load_names_spy.call_count == 2
+    assert name_index.get_types("Bob") == ["first_names", "last_names"]
+
+    ignore_names.unlink()
+    assert not load_name_index(mock_names_directory, ignore_names).is_ignored("ignored")
+    assert load_names_spy.call_count == 3
@@ -0,0 +1,98 @@
+import json
+import os
+
+from novel_ai_module_tools.section_index import (
+    build_section_index,
+    get_section_index,
+    get_section_index_path,
+    get_sections,
+    get_separator_indexes,
+    is_section_index_current,
+    load_section_index,
+)
+
+
+def test_build_section_index(tmp_path):
+    book = tmp_path / "book.txt"
+    text = "One two\nthree\n***\n\nFür vier***fünf\n"
+    book.write_text(text, encoding="utf-8")
+
+    index = build_section_index(str(book))
+
+    assert index["characters"] == len(text)
+    assert index["words"] == 6
+    assert [section["words"] for section in index["sections"]] == [3, 2, 1]
+    assert [section["paragraphs"] for section in index["sections"]] == [2, 1, 1]
+    assert get_sections(text, index) == text.split("***")
+    assert get_separator_indexes(index) == [14, 27]
+
+    raw = book.read_bytes()
+    assert [
+        raw[section["byte_start"] : section["byte_end"]]
+        for section in index["sections"]
+    ] == raw.split(b"***")
+
+
+def test_build_section_index_counts_crlf_as_one_character(tmp_path):
+    book = tmp_path / "book.txt"
+    book.write_bytes(b"One\r\ntwo\r\n***\r\nthree")
+
+    index = build_section_index(str(book))
+    text = book.read_text()
+
+    assert index["characters"] == len(text)
+    assert get_sections(text, index) == text.split("***")
+
+
+def test_get_section_index_saves_and_reuses_sidecar(tmp_path, mocker):
+    book = tmp_path / "book.txt"
+    book.write_text("One\n***\nTwo")
+
+    index = get_section_index(str(book))
+    index_path = get_section_index_path(str(book))
+    assert index_path == str(tmp_path / ".book.txt.sections.json")
+    with open(index_path) as f:
+        assert json.load(f) == index
+
+    build = mocker.patch("novel_ai_module_tools.section_index.build_section_index")
+    assert get_section_index(str(book)) == index
+    build.assert_not_called()
+
+
+def test_load_section_index_is_invalidated_by_changes(tmp_path):
+    book = tmp_path / "book.txt"
+    book.write_text("One\n***\nTwo")
+    index = get_section_index(str(book))
+
+    # Touched but unchanged
+    os.utime(book, ns=(index["mtime_ns"] + 10**9, index["mtime_ns"] + 10**9))
+    assert load_section_index(str(book))["sections"] == index["sections"]
+
+    # Same size, different content
+    book.write_text("One\n*!*\nTwo")
+    assert load_section_index(str(book)) is None
+    assert len(get_section_index(str(book))["sections"]) == 1
+
+
+def test_is_section_index_current_does_not_save(tmp_path, mocker):
+    book = tmp_path / "book.txt"
+    book.write_text("One\n***\nTwo")
+    index = get_section_index(str(book))
+    touched_ns = index["mtime_ns"] + 10**9
+    os.utime(book, ns=(touched_ns, touched_ns))
+
+    save = mocker.patch("novel_ai_module_tools.section_index.save_section_index")
+    assert is_section_index_current(str(book), dict(index))
+    save.assert_not_called()
+
+    mocker.stopall()
+    assert load_section_index(str(book))["mtime_ns"] == touched_ns
+    with open(get_section_index_path(str(book))) as f:
+        assert json.load(f)["mtime_ns"] == touched_ns
+
+
+def test_load_section_index_without_sidecar(tmp_path):
+    book = tmp_path / "book.txt"
+    book.write_text("One")
+
+    assert load_section_index(str(book)) is None
@@ -0,0 +1,59 @@
+import random
+from difflib import SequenceMatcher
+
+from novel_ai_module_tools.similarity_index import SimilarityIndex
+
+
+def find_similar_by_comparing_all(names, candidate, threshold):
+    for name in names:
+        similarity = SequenceMatcher(None, candidate, name).ratio()
+        if similarity > threshold:
+            return name, similarity
+    return None
+
+
+def test_find_similar_returns_first_similar_name():
+    index = SimilarityIndex(["Alicia", "Bob", "Alice", "Alicia"])
+
+    assert len(index) == 3
+    assert "Bob" in index
+    assert index.find_similar("Alice", 0.7) == ("Alicia", 2 * 4 / 11)
+    assert index.find_similar("Alice", 0.85) == ("Alice", 1.0)
+    assert index.find_similar("Zed", 0.5) is None
+
+
+def test_find_similar_matches_comparing_all_names():
+    random.seed(0)
+    names = [
+        "".join(random.choice("aeilnrsx") for _ in range(random.randint(0, 9)))
+        for _ in range(300)
+    ]
+    index = SimilarityIndex(names)
+
+    for threshold in (0.5, 0.85, 0.9):
+        for candidate in names[:100]:
+            assert index.find_similar(
+                candidate, threshold
+            ) == find_similar_by_comparing_all(
+                list(dict.fromkeys(names)), candidate, threshold
+            )
+
+
+def test_find_similar_batch_matches_find_similar(mocker):
+    random.seed(1)
+    names = [
+        "".join(random.choice("aeilnrsxéèё") for _ in range(random.randint(0, 9)))
+        for _ in range(200)
+    ]
+    index = SimilarityIndex(names[:120])
+    # Several batches
+    mocker.patch("novel_ai_module_tools.similarity_index.SIMILARITY_BATCH_SIZE", 50000)
+
+    for threshold in (0.5, 0.85):
+        assert index.find_similar_batch(names, threshold) == [
+            index.find_similar(candidate, threshold) for candidate in names
+        ]
+
+    index.add("zzz")
+    assert index.find_similar_batch(["zzz"], 0.9) == [("zzz", 1.0)]
+    assert SimilarityIndex().find_similar_batch(["zzz"], 0.9) == [None]
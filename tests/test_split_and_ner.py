@@ -1,10 +1,20 @@
+import threading
+import time
+
 import pytest
 from novel_ai_module_tools.split_and_ner import (
     create_directories,
+    SampleCoverage,
+    estimate_sample_coverage,
     process_single_file,
     process_files,
+    stream_ner_source_files,
+    write_section_sample,
 )
+from novel_ai_module_tools.resources_loader import compile_name_index
+from novel_ai_module_tools.split_file import SplitResult
 from novel_ai_module_tools.config import (
+    NER_SAMPLING_ALL,
     SPLITS_FIRST_HALF_PREFIX,
     SPLITS_SECOND_HALF_PREFIX,
 )
@@ -32,7 +42,7 @@ def test_process_single_file_no_splits(temp_directory, mocker):
     splits_dir.mkdir()
 
     mock_split_file = mocker.patch("novel_ai_module_tools.split_and_ner.split_file")
-    mock_split_file.return_value = {"no_stars": True, "full_text": "Test content"}
+    mock_split_file.return_value = SplitResult("Test content")
 
     result = process_single_file("test.txt", temp_directory, splits_dir)
 
@@ -40,16 +50,36 @@ def test_process_single_file_no_splits(temp_directory, mocker):
     assert result.read_text() == "Test content"
 
 
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_process_single_file_missing_file(temp_directory, use_mmap):
+    splits_dir = temp_directory / "splits"
+    splits_dir.mkdir()
+
+    with pytest.raises(RuntimeError):
+        process_single_file("missing.txt", temp_directory, splits_dir, use_mmap)
+
+    assert list(splits_dir.iterdir()) == []
+
+
+def test_process_single_file_into_parts_missing_file(temp_directory, mocker):
+    splits_dir = temp_directory / "splits"
+    splits_dir.mkdir()
+    mocker.patch("novel_ai_module_tools.split_and_ner.SPLITS_PARTS", 3)
+
+    with pytest.raises(RuntimeError):
+        process_single_file("missing.txt", temp_directory, splits_dir)
+
+    assert list(splits_dir.iterdir()) == []
+
+
 def test_process_single_file_with_splits(temp_directory, mocker):
     splits_dir = temp_directory / "splits"
     splits_dir.mkdir()
 
     mock_split_file = mocker.patch("novel_ai_module_tools.split_and_ner.split_file")
-    mock_split_file.return_value = {
-        "no_stars": False,
-        "first_half": "First half",
-        "second_half": "Second half",
-    }
+    mock_split_file.return_value = SplitResult(
+        "First half\n***\nSecond half", [(0, 10), (15, 26)]
+    )
 
     mocker.patch(
         "numpy.random.choice",
@@ -83,6 +113,13 @@ def test_process_files(temp_directory, mocker, file_names):
         "novel_ai_module_tools.split_and_ner.process_single_file"
     )
     mock_perform_ner = mocker.patch("novel_ai_module_tools.split_and_ner.perform_ner")
+    mock_perform_ner.side_effect = lambda file_names, **kwargs: list(file_names)
+    mock_estimate_sample_coverage = mocker.patch(
+        "novel_ai_module_tools.split_and_ner.estimate_sample_coverage"
+    )
+    mock_estimate_sample_coverage.return_value = SampleCoverage(
+        "test.txt", set(), set()
+    )
 
     for file_name in file_names:
         (temp_directory / file_name).touch()
@@ -91,3 +128,186 @@ def test_process_files(temp_directory, mocker, file_names):
 
     assert mock_process_single_file.call_count == len(file_names)
     assert mock_perform_ner.call_count == 1
+
+
+def test_process_single_file_with_mmap(temp_directory, mocker):
+    splits_dir = temp_directory / "splits"
+    splits_dir.mkdir()
+    (temp_directory / "test.txt").write_text("First half, longer\n***\nSecond half")
+
+    mocker.patch(
+        "numpy.random.choice",
+        return_value=splits_dir / f"{SPLITS_SECOND_HALF_PREFIX}test.txt",
+    )
+
+    result = process_single_file("test.txt", temp_directory, splits_dir, use_mmap=True)
+
+    assert result == splits_dir / f"{SPLITS_SECOND_HALF_PREFIX}test.txt"
+    assert (
+        splits_dir / f"{SPLITS_FIRST_HALF_PREFIX}test.txt"
+    ).read_text() == "First half, longer"
+    assert result.read_text() == "Second half"
+
+
+def test_process_single_file_into_parts(temp_directory, mocker):
+    splits_dir = temp_directory / "splits"
+    splits_dir.mkdir()
+    (temp_directory / "test.txt").write_text(
+        "One two\n***\nThree four\n***\nFive six\n***\nSeven eight"
+    )
+    mocker.patch("novel_ai_module_tools.split_and_ner.SPLITS_PARTS", 3)
+    mocker.patch(
+        "numpy.random.choice",
+        return_value=splits_dir / "3h_test.txt",
+    )
+
+    result = process_single_file("test.txt", temp_directory, splits_dir)
+
+    assert result == splits_dir / "3h_test.txt"
+    assert (splits_dir / "1h_test.txt").read_text() == "One two"
+    assert (splits_dir / "2h_test.txt").read_text() == "Three four\n***\nFive six"
+    assert result.read_text() == "Seven eight"
+
+
+def test_process_single_file_removes_earlier_split_files(temp_directory, mocker):
+    splits_dir = temp_directory / "splits"
+    splits_dir.mkdir()
+    (temp_directory / "test.txt").write_text("One two three four\n***\nFive")
+    for stale_name in ["3h_test.txt", "4h_test.txt", "nosplits_test.txt"]:
+        (splits_dir / stale_name).write_text("Stale")
+    for other_name in ["1h_other_test.txt", "3h_x_test.txt", "notes_test.txt"]:
+        (splits_dir / other_name).write_text("Other")
+    mocker.patch("numpy.random.choice", side_effect=lambda paths: paths[0])
+
+    process_single_file("test.txt", temp_directory, splits_dir)
+
+    assert sorted(path.name for path in splits_dir.iterdir()) == [
+        "1h_other_test.txt",
+        "1h_test.txt",
+        "2h_test.txt",
+        "3h_x_test.txt",
+        "notes_test.txt",
+    ]
+
+
+def test_write_section_sample(temp_directory, mocker):
+    samples_dir = temp_directory / "samples"
+    samples_dir.mkdir()
+    (temp_directory / "test.txt").write_text(
+        "\n***\n".join(f"Section {number}" for number in range(6))
+    )
+    randint = mocker.patch(
+        "novel_ai_module_tools.split_and_ner.random.randint",
+        side_effect=lambda low, high: low,
+    )
+
+    result = write_section_sample("test.txt", temp_directory, samples_dir, 0.5)
+
+    assert [call.args for call in randint.call_args_list] == [(0, 2), (2, 4), (4, 6)]
+    assert result == samples_dir / "test.txt"
+    assert result.read_text() == "Section 0\n***\nSection 2\n***\nSection 4\n"
+
+
+def test_estimate_sample_coverage(temp_directory):
+    full_file = temp_directory / "test.txt"
+    full_file.write_text("Ask John.\n***\nThe rain fell on Bertha.")
+    sample_file = temp_directory / "1h_test.txt"
+    sample_file.write_text("Ask John.")
+
+    coverage = estimate_sample_coverage(
+        full_file, sample_file, compile_name_index({}, [])
+    )
+
+    assert coverage.likely_names == {"John", "Bertha"}
+    assert coverage.missed_names == {"Bertha"}
+    assert coverage.coverage == 0.5
+
+
+def test_process_files_samples_all_text(temp_directory, mocker):
+    mocker.patch("novel_ai_module_tools.split_and_ner.process_single_file")
+    ner_file_names = []
+    mocker.patch(
+        "novel_ai_module_tools.split_and_ner.perform_ner",
+        side_effect=lambda file_names, **kwargs: ner_file_names.extend(file_names),
+    )
+    (temp_directory / "test.txt").write_text("Ask John.")
+
+    process_files(str(temp_directory), sampling=NER_SAMPLING_ALL)
+
+    assert ner_file_names == [temp_directory / "test.txt"]
+
+
+def test_process_files_writes_other_files_before_raising(temp_directory, mocker):
+    original_process_single_file = process_single_file
+
+    def fail_on_bad_file(file_name, *args):
+        if file_name == "bad.txt":
+            raise RuntimeError(file_name)
+        return original_process_single_file(file_name, *args)
+
+    mocker.patch(
+        "novel_ai_module_tools.split_and_ner.process_single_file",
+        side_effect=fail_on_bad_file,
+    )
+    (temp_directory / "good.txt").write_text("Ask John.")
+    (temp_directory / "bad.txt").write_text("Ask Mary.")
+
+    with pytest.raises(RuntimeError):
+        process_files(
+            str(temp_directory), gazetteer_only=True, sampling=NER_SAMPLING_ALL
+        )
+
+    ner_directory = temp_directory / "names_replaced" / "ner"
+    assert sorted(path.name for path in ner_directory.iterdir()) == ["ner_good.txt"]
+
+
+def test_stream_ner_source_files_limits_work_ahead():
+    prepared = []
+
+    def prepare(file_name):
+        prepared.append(file_name)
+        return file_name.upper()
+
+    results = stream_ner_source_files(
+        prepare, ["a", "b", "c", "d"], workers=1, queue_size=1
+    )
+    time.sleep(0.1)
+
+    # One result in the queue and one waiting to be put in it
+    assert len(prepared) <= 2
+    assert list(results) == ["A", "B", "C", "D"]
+
+
+def test_stream_ner_source_files_skips_files_that_fail():
+    def prepare(file_name):
+        if file_name == "b":
+            raise ValueError(file_name)
+        return file_name
+
+    with stream_ner_source_files(prepare, ["a", "b", "c"], workers=2) as results:
+        assert sorted(results) == ["a", "c"]
+
+    assert [str(error) for error in results.errors] == ["b"]
+
+
+def test_stream_ner_source_files_stops_when_consumer_fails():
+    prepared = []
+
+    def prepare(file_name):
+        prepared.append(file_name)
+        return file_name
+
+    file_names = [str(number) for number in range(40)]
+    with pytest.raises(RuntimeError):
+        with stream_ner_source_files(
+            prepare, file_names, workers=4, queue_size=1
+        ) as results:
+            next(results)
+            raise RuntimeError("NER failed")
+
+    # The threads have stopped instead of waiting on the full queue
+    assert len(prepared) < len(file_names)
+    assert not any(
+        thread.name.startswith("ner_source") for thread in threading.enumerate()
+    )
+    assert list(results) == []
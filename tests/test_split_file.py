@@ -1,5 +1,12 @@
 import pytest
-from novel_ai_module_tools.split_file import get_star_index, split_file
+from novel_ai_module_tools.split_file import (
+    get_star_index,
+    split_file,
+    split_file_mapped,
+    split_file_into_parts,
+    get_balanced_separator_indexes,
+    SplitResult,
+)
 import tempfile
 import os
 
@@ -45,7 +52,125 @@ def test_split_file():
         # Test with a non-existent file
         result = split_file("non_existent_file.txt")
         assert "ERROR" in result
+        assert result.no_stars == False
 
     finally:
         # Clean up the temporary file
         os.unlink(temp_file_name)
+
+
+def test_split_file_result_offsets(tmp_path):
+    input_file = tmp_path / "book.txt"
+    input_file.write_text(" First half content Longer \n***\n Second half content\n")
+
+    result = split_file(str(input_file))
+
+    assert isinstance(result, SplitResult)
+    assert result.no_stars == False
+    assert result.first_half == "First half content Longer"
+    assert result.second_half == "Second half content"
+    assert result.first_half_range == (1, 26)
+
+    result.write_first_half(tmp_path / "1h_book.txt")
+    result.write_second_half(tmp_path / "2h_book.txt")
+    assert (tmp_path / "1h_book.txt").read_text() == "First half content Longer"
+    assert (tmp_path / "2h_book.txt").read_text() == "Second half content"
+
+
+def test_split_result_has_no_instance_dict():
+    result = SplitResult("text")
+
+    assert not hasattr(result, "__dict__")
+    with pytest.raises(KeyError):
+        result["first_half"]
+
+
+def test_split_file_mapped(tmp_path):
+    input_file = tmp_path / "book.txt"
+    input_file.write_text("First half content Longer\n***\nSecond half content\n")
+    first_half = tmp_path / "1h_book.txt"
+    second_half = tmp_path / "2h_book.txt"
+    full_text = tmp_path / "nosplits_book.txt"
+
+    result = split_file_mapped(
+        str(input_file), str(first_half), str(second_half), str(full_text)
+    )
+
+    assert result["no_stars"] == False
+    expected = split_file(str(input_file))
+    assert first_half.read_text() == expected["first_half"]
+    assert second_half.read_text() == expected["second_half"]
+    assert not full_text.exists()
+
+
+@pytest.mark.parametrize("content", ["Content without stars", ""])
+def test_split_file_mapped_no_stars(tmp_path, content):
+    input_file = tmp_path / "book.txt"
+    input_file.write_text(content)
+    full_text = tmp_path / "nosplits_book.txt"
+
+    result = split_file_mapped(
+        str(input_file),
+        str(tmp_path / "1h_book.txt"),
+        str(tmp_path / "2h_book.txt"),
+        str(full_text),
+    )
+
+    assert result["no_stars"] == True
+    assert full_text.read_text() == content
+
+
+def test_split_file_mapped_non_existent_file(tmp_path):
+    result = split_file_mapped(
+        "non_existent_file.txt",
+        str(tmp_path / "1h.txt"),
+        str(tmp_path / "2h.txt"),
+        str(tmp_path / "nosplits.txt"),
+    )
+
+    assert "ERROR" in result
+
+
+def test_get_balanced_separator_indexes():
+    text = "a b c d\n***\ne\n***\nf\n***\ng h\n***\ni j k l"
+    separator_indexes = [
+        index for index in range(len(text)) if text.startswith("***", index)
+    ]
+
+    assert len(separator_indexes) == 4
+    section_word_counts = [4, 1, 1, 2, 4]
+    assert get_balanced_separator_indexes(
+        separator_indexes, section_word_counts, 2
+    ) == [separator_indexes[2]]
+    assert get_balanced_separator_indexes(
+        separator_indexes, section_word_counts, 3
+    ) == [
+        separator_indexes[0],
+        separator_indexes[3],
+    ]
+    # Not enough separators for the parts asked for
+    assert get_balanced_separator_indexes(
+        separator_indexes, section_word_counts, 6
+    ) == (separator_indexes)
+
+
+def test_split_file_into_parts(tmp_path):
+    input_file = tmp_path / "book.txt"
+    input_file.write_text("One two\n***\n Three four \n***\nFive six\n")
+
+    result = split_file_into_parts(str(input_file), 3)
+
+    assert result.no_stars == False
+    assert len(result.part_ranges) == 3
+    assert [result.get_part(part) for part in range(3)] == [
+        "One two",
+        "Three four",
+        "Five six",
+    ]
+
+    input_file.write_text("Content without stars")
+    result = split_file_into_parts(str(input_file), 3)
+    assert result.no_stars == True
+    assert result.full_text == "Content without stars"
+
+    assert "ERROR" in split_file_into_parts("non_existent_file.txt", 3)